@@ -0,0 +1,146 @@
+import os
+import subprocess
+from llvmlite import ir
+import llvmlite.binding as llvm
+
+import JIT
+import Runtime
+
+
+OUTPUT_KINDS = ("obj", "shared", "exe")
+# objects and libraries are linked into programs that have their own main, so the top level code is exported as
+# LIBRARY_ENTRY instead
+LIBRARY_ENTRY = "calclite_main"
+EXTENSIONS = {
+    "obj": ".obj" if os.name == "nt" else ".o",
+    "shared": ".dll" if os.name == "nt" else ".so",
+    "exe": ".exe" if os.name == "nt" else "",
+}
+
+C_TYPES = {
+    "i1": "bool",
+    "i8": "int8_t",
+    "i32": "int32_t",
+    "i64": "int64_t",
+    "float": "float",
+    "double": "double",
+    "void": "void",
+    # arrays, see Compiler.array_type
+    "{i64, i32*}": "calclite_int_array",
+    "{i64, float*}": "calclite_float_array",
+    # matrices are not listed: LLVM passes a three field struct in three registers, where C passes it in memory
+}
+# names CalcLite allows that cannot name a parameter in C, together with the types the header uses
+C_KEYWORDS = {
+    "auto", "break", "case", "char", "const", "continue", "default", "do", "double", "else", "enum", "extern",
+    "float", "for", "goto", "if", "inline", "int", "long", "register", "restrict", "return", "short", "signed",
+    "sizeof", "static", "struct", "switch", "typedef", "union", "unsigned", "void", "volatile", "while", "bool",
+    "true", "false", "int8_t", "int32_t", "int64_t", "calclite_int_array", "calclite_float_array",
+}
+ARRAY_TYPEDEFS = [
+    "typedef struct { int64_t length; int32_t *data; } calclite_int_array;",
+    "typedef struct { int64_t length; float *data; } calclite_float_array;",
+]
+
+
+class AOTError(Exception):
+    pass
+
+
+def default_output_path(source_path: str, kind: str) -> str:
+    return os.path.splitext(source_path)[0] + EXTENSIONS[kind]
+
+
+def emit_object(module: ir.Module, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL, entry: str = "main") -> bytes:
+    # position independent, so the same object links into both shared libraries and executables
+    target_machine = JIT.create_target_machine(opt_level, reloc="pic")
+    module.triple = target_machine.triple
+    parsed_module = JIT.parse_module(module)
+    parsed_module.get_function("main").name = entry
+    # programs with parallel loops carry their own copy of the runtime
+    if JIT.uses_runtime(module):
+        runtime = Runtime.runtime_module()
+        runtime.triple = module.triple
+        parsed_module.link_in(JIT.parse_module(runtime))
+    JIT.optimize(parsed_module, target_machine, opt_level)
+    return target_machine.emit_object(parsed_module)
+
+
+def link(object_path: str, output_path: str, kind: str) -> None:
+    # links with the system C compiler driver, which also pulls in the C runtime and the exe entry point
+    compiler = os.environ.get("CC", "cc")
+    command = [compiler, object_path, "-o", output_path]
+    if kind == "shared":
+        command.insert(1, "-shared")
+    if os.name != "nt":
+        # for the thread pool behind parallel loops, and libm for ^ and the math functions
+        command.extend(["-pthread", "-lm"])
+    try:
+        result = subprocess.run(command, capture_output=True, text=True)
+    except OSError as e:
+        raise AOTError(f"Could not run the C compiler {compiler}: {e}")
+    if result.returncode != 0:
+        raise AOTError(f"Linking {output_path} failed:\n{result.stderr}")
+
+
+def header(module: ir.Module, guard: str, entry: str = LIBRARY_ENTRY) -> str:
+    # C prototypes of every function exported by the module, internal helpers like the matmul kernels are skipped.
+    # Functions that take or return a matrix can only be called from CalcLite, so the header just names them
+    guard = "".join(character if character.isalnum() else "_" for character in guard).upper()
+    lines = [f"#ifndef {guard}", f"#define {guard}", "", "#include <stdbool.h>", "#include <stdint.h>", "", *ARRAY_TYPEDEFS, ""]
+    for function in module.functions:
+        if function.is_declaration or function.linkage == "internal": continue
+        function_type = function.function_type
+        name = entry if function.name == "main" else function.name
+        if any(str(type) not in C_TYPES for type in [function_type.return_type, *function_type.args]):
+            lines.append(f"/* {name} has a parameter or result without a C equivalent */")
+            continue
+        parameters = ", ".join(f"{_c_type(type)} {_c_name(argument.name, i)}" for i, (type, argument) in enumerate(zip(function_type.args, function.args)))
+        lines.append(f"{_c_type(function_type.return_type)} {name}({parameters or 'void'});")
+    if JIT.uses_runtime(module):
+        # printed output stays in a buffer of the calling thread until it is full or this is called
+        lines.append(f"void {Runtime.FLUSH}(void);")
+    lines += ["", f"#endif /* {guard} */", ""]
+    return "\n".join(lines)
+
+
+def _c_name(name: str, index: int) -> str:
+    # the name of a parameter in the header, arg<index> where the name LLVM has for it is not a C identifier
+    if name.isidentifier() and name.isascii() and name not in C_KEYWORDS:
+        return name
+    return f"arg{index}"
+
+
+def _c_type(type: ir.Type) -> str:
+    c_type = C_TYPES.get(str(type))
+    if c_type is None:
+        raise AOTError(f"Type {type} has no C equivalent.")
+    return c_type
+
+
+def build(module: ir.Module, output_path: str, kind: str, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL) -> list[str]:
+    # writes the object, shared library or executable and returns the paths of every file written
+    if kind not in OUTPUT_KINDS:
+        raise AOTError(f"Output kind must be one of {OUTPUT_KINDS}, got {kind}.")
+    object_data = emit_object(module, opt_level, entry="main" if kind == "exe" else LIBRARY_ENTRY)
+
+    written = [output_path]
+    if kind == "obj":
+        object_path = output_path
+    else:
+        object_path = output_path + EXTENSIONS["obj"]
+    with open(object_path, "wb") as f:
+        f.write(object_data)
+
+    if kind != "obj":
+        try:
+            link(object_path, output_path, kind)
+        finally:
+            os.remove(object_path)
+
+    if kind != "exe":
+        header_path = os.path.splitext(output_path)[0] + ".h"
+        with open(header_path, "w") as f:
+            f.write(header(module, os.path.basename(header_path)))
+        written.append(header_path)
+    return written
@@ -13,19 +13,25 @@ class NodeType(Enum):
     AssignStatement = "AssignStatement"
     IfStatement = "IfStatement"
     WhileStatement = "WhileStatement"
+    IndexAssignStatement = "IndexAssignStatement"
+    ForStatement = "ForStatement"
 
     InfixExpression = "InfixExpression"
     CallExpression = "CallExpression"
+    IndexExpression = "IndexExpression"
 
     IntegerLiteral = "IntegerLiteral"
     FloatLiteral = "FloatLiteral"
     IdentifierLiteral = "IdentifierLiteral"
     BooleanLiteral = "BooleanLiteral"
+    ArrayLiteral = "ArrayLiteral"
 
     FunctionParameter = "FunctionParameter"
 
 
 class Node:
+    __slots__ = ()
+
     @abstractmethod
     def type(self) -> NodeType:
         pass
@@ -35,13 +41,15 @@ class Node:
         pass
 
 class Statement(Node):
-    pass
+    __slots__ = ()
 
 class Expression(Node):
-    pass
+    __slots__ = ()
 
 
 class IntegerLiteral(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value: int) -> None:
         self.value = value
 
@@ -55,6 +63,8 @@ class IntegerLiteral(Expression):
         }
     
 class FloatLiteral(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value: float) -> None:
         self.value = value
 
@@ -68,8 +78,13 @@ class FloatLiteral(Expression):
         }
 
 class IdentifierLiteral(Expression):
+    __slots__ = ("value", "depth", "slot")
+
     def __init__(self, value: str) -> None:
         self.value = value
+        # the variable the name refers to, bound by the Resolver (see Environment)
+        self.depth: int | None = None
+        self.slot: int | None = None
 
     def type(self) -> NodeType:
         return NodeType.IdentifierLiteral
@@ -81,6 +96,8 @@ class IdentifierLiteral(Expression):
         } 
 
 class BooleanLiteral(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value: bool) -> None:
         self.value = value
 
@@ -93,8 +110,25 @@ class BooleanLiteral(Expression):
             "value": self.value
         } 
 
+class ArrayLiteral(Expression):
+    __slots__ = ("elements",)
+
+    def __init__(self, elements: list[Expression]) -> None:
+        self.elements = elements
+
+    def type(self) -> NodeType:
+        return NodeType.ArrayLiteral
+
+    def json(self) -> dict:
+        return {
+            "type": self.type().value,
+            "elements": [element.json() for element in self.elements]
+        }
+
 
 class Program(Node):
+    __slots__ = ("statements",)
+
     def __init__(self, statements: list[Statement]) -> None:
         self.statements = statements
     
@@ -109,6 +143,8 @@ class Program(Node):
     
 
 class FunctionParameter(Expression):
+    __slots__ = ("name", "value_type")
+
     def __init__(self, name: str, value_type: str) -> None:
         self.name = name
         self.value_type = value_type
@@ -125,6 +161,8 @@ class FunctionParameter(Expression):
     
 
 class ExpressionStatement(Statement):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expression) -> None:
         self.expression = expression
 
@@ -138,6 +176,8 @@ class ExpressionStatement(Statement):
         }
 
 class VarStatement(Statement):
+    __slots__ = ("name", "value", "value_type")
+
     def __init__(self, name: IdentifierLiteral, value: Expression, value_type: str) -> None:
         self.name = name
         self.value = value
@@ -155,6 +195,8 @@ class VarStatement(Statement):
         }
 
 class BlockStatement(Statement):
+    __slots__ = ("statements",)
+
     def __init__(self, statements: list[Statement]) -> None:
         self.statements = statements
     
@@ -168,6 +210,8 @@ class BlockStatement(Statement):
         }
     
 class ReturnStatement(Statement):
+    __slots__ = ("return_value",)
+
     def __init__(self, return_value: Expression) -> None:
         self.return_value = return_value
     
@@ -181,11 +225,16 @@ class ReturnStatement(Statement):
         }
 
 class FunctionStatement(Statement):
-    def __init__(self, parameters: list[FunctionParameter], body: BlockStatement, name: IdentifierLiteral, return_type: str) -> None:
+    # pure functions are annotated @pure or @memo, and memo is the number of results a @memo function caches
+    __slots__ = ("parameters", "body", "name", "return_type", "pure", "memo")
+
+    def __init__(self, parameters: list[FunctionParameter], body: BlockStatement, name: IdentifierLiteral, return_type: str, pure: bool = False, memo: int | None = None) -> None:
         self.parameters = parameters
         self.body = body
         self.name = name
         self.return_type = return_type
+        self.pure = pure
+        self.memo = memo
     
     def type(self) -> NodeType:
         return NodeType.FunctionStatement
@@ -196,10 +245,14 @@ class FunctionStatement(Statement):
             "name": self.name.json(),
             "return_type": self.return_type,
             "parameters": [parameter.json() for parameter in self.parameters],
-            "body": self.body.json()
+            "body": self.body.json(),
+            "pure": self.pure,
+            "memo": self.memo,
         }
     
 class AssignStatement(Statement):
+    __slots__ = ("identifier", "expression")
+
     def __init__(self, identifier: IdentifierLiteral, expression: Expression) -> None:
         self.identifier = identifier
         self.expression = expression
@@ -215,6 +268,8 @@ class AssignStatement(Statement):
         }
 
 class IfStatement(Statement):
+    __slots__ = ("condition", "consequence", "alternative")
+
     def __init__(self, condition: Expression, consequence: BlockStatement, alternative: BlockStatement | None = None) -> None:
         self.condition = condition
         self.consequence = consequence
@@ -232,6 +287,8 @@ class IfStatement(Statement):
         }
     
 class WhileStatement(Statement):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition: Expression, body: BlockStatement) -> None:
         self.condition = condition
         self.body = body
@@ -246,8 +303,59 @@ class WhileStatement(Statement):
             "body": self.body.json(),
         }
 
+class IndexAssignStatement(Statement):
+    __slots__ = ("array", "index", "expression")
+
+    def __init__(self, array: Expression, index: Expression, expression: Expression) -> None:
+        self.array = array
+        self.index = index
+        self.expression = expression
+
+    def type(self) -> NodeType:
+        return NodeType.IndexAssignStatement
+
+    def json(self) -> dict:
+        return {
+            "type": self.type().value,
+            "array": self.array.json(),
+            "index": self.index.json(),
+            "expression": self.expression.json()
+        }
+
+class ForStatement(Statement):
+    # for variable in start..stop { body }, with schedule "static" or "dynamic" for a parallel for, whose iterations
+    # are handed out to threads in chunks of chunk iterations. reductions are the (operator, variable) pairs of a
+    # reduce(+: total, max: largest) clause, with the operators +, *, min and max
+    __slots__ = ("variable", "start", "stop", "body", "schedule", "chunk", "reductions")
+
+    def __init__(self, variable: IdentifierLiteral, start: Expression, stop: Expression, body: BlockStatement, schedule: str | None = None, chunk: Expression | None = None, reductions: list[tuple[str, IdentifierLiteral]] | None = None) -> None:
+        self.variable = variable
+        self.start = start
+        self.stop = stop
+        self.body = body
+        self.schedule = schedule
+        self.chunk = chunk
+        self.reductions = reductions or []
+
+    def type(self) -> NodeType:
+        return NodeType.ForStatement
+
+    def json(self) -> dict:
+        return {
+            "type": self.type().value,
+            "variable": self.variable.json(),
+            "start": self.start.json(),
+            "stop": self.stop.json(),
+            "body": self.body.json(),
+            "schedule": self.schedule,
+            "chunk": self.chunk.json() if self.chunk is not None else None,
+            "reductions": [{"operator": operator, "variable": variable.json()} for operator, variable in self.reductions],
+        }
+
 
 class InfixExpression(Expression):
+    __slots__ = ("left_node", "operator", "right_node")
+
     def __init__(self, left_node: Expression, operator: str, right_node: Expression) -> None:
         self.left_node = left_node
         self.operator = operator
@@ -265,6 +373,8 @@ class InfixExpression(Expression):
         }
     
 class CallExpression(Expression):
+    __slots__ = ("name", "parameters")
+
     def __init__(self, name: IdentifierLiteral, parameters: list[Expression]) -> None:
         self.name = name
         self.parameters = parameters
@@ -278,3 +388,54 @@ class CallExpression(Expression):
             "name": self.name.json(),
             "parameters": [parameter.json() for parameter in self.parameters],
         }
+
+class IndexExpression(Expression):
+    __slots__ = ("array", "index")
+
+    def __init__(self, array: Expression, index: Expression) -> None:
+        self.array = array
+        self.index = index
+
+    def type(self) -> NodeType:
+        return NodeType.IndexExpression
+
+    def json(self) -> dict:
+        return {
+            "type": self.type().value,
+            "array": self.array.json(),
+            "index": self.index.json()
+        }
+
+
+def children(node: Node) -> list[Node | None]:
+    # the nodes directly below a node in the order they appear in the source, None for missing optional parts
+    match node.type():
+        case NodeType.Program | NodeType.BlockStatement:
+            return node.statements
+        case NodeType.ExpressionStatement:
+            return [node.expression]
+        case NodeType.VarStatement:
+            return [node.name, node.value]
+        case NodeType.FunctionStatement:
+            return [node.name, *node.parameters, node.body]
+        case NodeType.ReturnStatement:
+            return [node.return_value]
+        case NodeType.AssignStatement:
+            return [node.identifier, node.expression]
+        case NodeType.IfStatement:
+            return [node.condition, node.consequence, node.alternative]
+        case NodeType.WhileStatement:
+            return [node.condition, node.body]
+        case NodeType.ForStatement:
+            return [node.variable, node.start, node.stop, node.chunk, node.body, *[variable for _, variable in node.reductions]]
+        case NodeType.IndexAssignStatement:
+            return [node.array, node.index, node.expression]
+        case NodeType.InfixExpression:
+            return [node.left_node, node.right_node]
+        case NodeType.CallExpression:
+            return [node.name, *node.parameters]
+        case NodeType.IndexExpression:
+            return [node.array, node.index]
+        case NodeType.ArrayLiteral:
+            return node.elements
+    return []
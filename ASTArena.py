@@ -0,0 +1,238 @@
+import mmap
+import struct
+from array import array
+
+from AST import Node, NodeType, Program
+from AST import ExpressionStatement, VarStatement, FunctionStatement, ReturnStatement, BlockStatement, AssignStatement
+from AST import IfStatement, WhileStatement, IndexAssignStatement, ForStatement
+from AST import InfixExpression, CallExpression, IndexExpression
+from AST import IntegerLiteral, FloatLiteral, IdentifierLiteral, BooleanLiteral, ArrayLiteral
+from AST import FunctionParameter
+
+
+NODE_TYPES = list(NodeType)
+NODE_CODES = {node_type: code for code, node_type in enumerate(NODE_TYPES)}
+
+# every node is a record of RECORD_SIZE int32 values: its NodeType code followed by FIELDS fields. A field holds a
+# node id, a string id, an index into the integer or float table, or an offset into the children array, where a
+# list is stored as its length followed by the ids of its elements. Missing nodes are NONE.
+FIELDS = 5
+RECORD_SIZE = FIELDS + 1
+NONE = -1
+# the annotation field of a function that is @pure but not @memo, @memo functions store their cache size
+PURE = 0
+
+MAGIC = b"CLAST\0"
+VERSION = 5
+# magic, version, root, then the element counts of the nodes, children, integers, floats, string offsets and
+# string data sections, which follow the header in this order, each padded to 8 bytes
+HEADER = struct.Struct("<6sHi6q")
+
+
+def _padded(size: int) -> int:
+    return (size + 7) & ~7
+
+
+class ASTArena:
+    # flat representation of a program: node records are indexed by integer ids and only turned back into AST
+    # objects on demand, so an arena loaded from disk is usable without parsing anything
+    def __init__(self, nodes=None, children=None, integers=None, floats=None, string_offsets=None, string_data=None, root: int = NONE) -> None:
+        self.nodes = nodes if nodes is not None else array("i")
+        self.children = children if children is not None else array("i")
+        self.integers = integers if integers is not None else array("q")
+        self.floats = floats if floats is not None else array("d")
+        self.string_offsets = string_offsets if string_offsets is not None else array("i", [0])
+        self.string_data = string_data if string_data is not None else bytearray()
+        self.root = root
+        self._string_ids: dict[str, int] = {}
+        self._strings: dict[int, str] = {}
+        self._mmap = None
+
+    def __len__(self) -> int:
+        return len(self.nodes) // RECORD_SIZE
+
+    # reading
+    def type(self, node_id: int) -> NodeType:
+        return NODE_TYPES[self.nodes[node_id * RECORD_SIZE]]
+
+    def field(self, node_id: int, index: int) -> int:
+        return self.nodes[node_id * RECORD_SIZE + 1 + index]
+
+    def items(self, offset: int) -> list[int]:
+        return list(self.children[offset + 1:offset + 1 + self.children[offset]])
+
+    def string(self, string_id: int) -> str | None:
+        if string_id == NONE: return None
+        string = self._strings.get(string_id)
+        if string is None:
+            string = bytes(self.string_data[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode("utf-8")
+            self._strings[string_id] = string
+        return string
+
+    def node(self, node_id: int) -> Node | None:
+        if node_id == NONE: return None
+        base = node_id * RECORD_SIZE
+        return _BUILDERS[self.nodes[base]](self, *self.nodes[base + 1:base + RECORD_SIZE])
+
+    def program(self) -> Program:
+        return self.node(self.root)
+
+    # building
+    def _add_string(self, string: str | None) -> int:
+        if string is None: return NONE
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = self._string_ids[string] = len(self.string_offsets) - 1
+            self.string_data += string.encode("utf-8")
+            self.string_offsets.append(len(self.string_data))
+        return string_id
+
+    def _add_list(self, nodes: list[Node] | None) -> int:
+        ids = [self.add(node) for node in nodes or []]
+        offset = len(self.children)
+        self.children.append(len(ids))
+        self.children.extend(ids)
+        return offset
+
+    def _add_record(self, node_type: NodeType, f0: int = NONE, f1: int = NONE, f2: int = NONE, f3: int = NONE, f4: int = NONE) -> int:
+        node_id = len(self)
+        self.nodes.extend((NODE_CODES[node_type], f0, f1, f2, f3, f4))
+        return node_id
+
+    def add(self, node: Node | None) -> int:
+        # children are added before their parent, so the root of a tree gets the largest id
+        if node is None: return NONE
+        node_type = node.type()
+        match node_type:
+            case NodeType.Program | NodeType.BlockStatement:
+                return self._add_record(node_type, self._add_list(node.statements))
+            case NodeType.ExpressionStatement:
+                return self._add_record(node_type, self.add(node.expression))
+            case NodeType.VarStatement:
+                return self._add_record(node_type, self.add(node.name), self.add(node.value), self._add_string(node.value_type))
+            case NodeType.FunctionStatement:
+                annotation = node.memo if node.memo is not None else PURE if node.pure else NONE
+                return self._add_record(node_type, self.add(node.name), self._add_string(node.return_type), self._add_list(node.parameters), self.add(node.body), annotation)
+            case NodeType.ReturnStatement:
+                return self._add_record(node_type, self.add(node.return_value))
+            case NodeType.AssignStatement:
+                return self._add_record(node_type, self.add(node.identifier), self.add(node.expression))
+            case NodeType.IfStatement:
+                return self._add_record(node_type, self.add(node.condition), self.add(node.consequence), self.add(node.alternative))
+            case NodeType.WhileStatement:
+                return self._add_record(node_type, self.add(node.condition), self.add(node.body))
+            case NodeType.IndexAssignStatement:
+                return self._add_record(node_type, self.add(node.array), self.add(node.index), self.add(node.expression))
+            case NodeType.ForStatement:
+                # more children than fields, so the nodes are stored as a list followed by the reduction variables,
+                # whose operators are joined into one string
+                variables = [variable for _, variable in node.reductions]
+                operators = ",".join(operator for operator, _ in node.reductions)
+                return self._add_record(node_type, self._add_list([node.variable, node.start, node.stop, node.body, node.chunk, *variables]), self._add_string(node.schedule), self._add_string(operators))
+            case NodeType.InfixExpression:
+                return self._add_record(node_type, self.add(node.left_node), self._add_string(node.operator), self.add(node.right_node))
+            case NodeType.CallExpression:
+                return self._add_record(node_type, self.add(node.name), self._add_list(node.parameters))
+            case NodeType.IndexExpression:
+                return self._add_record(node_type, self.add(node.array), self.add(node.index))
+            case NodeType.IntegerLiteral:
+                self.integers.append(node.value)
+                return self._add_record(node_type, len(self.integers) - 1)
+            case NodeType.FloatLiteral:
+                self.floats.append(node.value)
+                return self._add_record(node_type, len(self.floats) - 1)
+            case NodeType.IdentifierLiteral:
+                return self._add_record(node_type, self._add_string(node.value))
+            case NodeType.BooleanLiteral:
+                return self._add_record(node_type, int(node.value))
+            case NodeType.ArrayLiteral:
+                return self._add_record(node_type, self._add_list(node.elements))
+            case NodeType.FunctionParameter:
+                return self._add_record(node_type, self._add_string(node.name), self._add_string(node.value_type))
+
+    @classmethod
+    def from_program(cls, program: Program) -> "ASTArena":
+        arena = cls()
+        arena.root = arena.add(program)
+        return arena
+
+    # binary format
+    def _sections(self) -> list:
+        return [self.nodes, self.children, self.integers, self.floats, self.string_offsets, self.string_data]
+
+    def dump(self, path: str) -> None:
+        sections = self._sections()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.root, *[len(section) for section in sections]))
+            f.write(bytes(_padded(HEADER.size) - HEADER.size))
+            for section in sections:
+                data = section.tobytes() if isinstance(section, array) else bytes(section)
+                f.write(data)
+                f.write(bytes(_padded(len(data)) - len(data)))
+
+    @classmethod
+    def load(cls, path: str) -> "ASTArena":
+        # the sections are memoryviews into a read-only mapping of the file, so loading copies nothing and the pages
+        # are shared between every process that maps the same file
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, root, *counts = HEADER.unpack_from(mapping)
+        if magic != MAGIC or version != VERSION:
+            mapping.close()
+            raise ValueError(f"{path} is not a version {VERSION} CalcLite AST file.")
+
+        view = memoryview(mapping)
+        offset = _padded(HEADER.size)
+        sections = []
+        for count, format in zip(counts, ["i", "i", "q", "d", "i", "B"]):
+            size = count * struct.calcsize(format)
+            sections.append(view[offset:offset + size].cast(format))
+            offset += _padded(size)
+
+        arena = cls(*sections, root=root)
+        arena._mmap = mapping
+        return arena
+
+
+def dump(program: Program, path: str) -> None:
+    ASTArena.from_program(program).dump(path)
+
+
+def load(path: str) -> Program:
+    return ASTArena.load(path).program()
+
+
+def _nodes(arena: ASTArena, offset: int) -> list[Node]:
+    return [arena.node(child) for child in arena.items(offset)]
+
+
+def _for_statement(nodes: list[Node], schedule: str | None, operators: str) -> ForStatement:
+    reductions = list(zip(operators.split(","), nodes[5:])) if operators else []
+    return ForStatement(*nodes[:4], schedule, nodes[4], reductions)
+
+
+# AST constructors indexed by NodeType code, called with the arena and the five fields of a record
+_BUILDERS = [None] * len(NODE_TYPES)
+for _node_type, _builder in {
+    NodeType.Program: lambda arena, f0, f1, f2, f3, f4: Program(_nodes(arena, f0)),
+    NodeType.ExpressionStatement: lambda arena, f0, f1, f2, f3, f4: ExpressionStatement(arena.node(f0)),
+    NodeType.VarStatement: lambda arena, f0, f1, f2, f3, f4: VarStatement(arena.node(f0), arena.node(f1), arena.string(f2)),
+    NodeType.FunctionStatement: lambda arena, f0, f1, f2, f3, f4: FunctionStatement(_nodes(arena, f2), arena.node(f3), arena.node(f0), arena.string(f1), f4 != NONE, f4 if f4 > PURE else None),
+    NodeType.BlockStatement: lambda arena, f0, f1, f2, f3, f4: BlockStatement(_nodes(arena, f0)),
+    NodeType.ReturnStatement: lambda arena, f0, f1, f2, f3, f4: ReturnStatement(arena.node(f0)),
+    NodeType.AssignStatement: lambda arena, f0, f1, f2, f3, f4: AssignStatement(arena.node(f0), arena.node(f1)),
+    NodeType.IfStatement: lambda arena, f0, f1, f2, f3, f4: IfStatement(arena.node(f0), arena.node(f1), arena.node(f2)),
+    NodeType.WhileStatement: lambda arena, f0, f1, f2, f3, f4: WhileStatement(arena.node(f0), arena.node(f1)),
+    NodeType.IndexAssignStatement: lambda arena, f0, f1, f2, f3, f4: IndexAssignStatement(arena.node(f0), arena.node(f1), arena.node(f2)),
+    NodeType.ForStatement: lambda arena, f0, f1, f2, f3, f4: _for_statement(_nodes(arena, f0), arena.string(f1), arena.string(f2)),
+    NodeType.InfixExpression: lambda arena, f0, f1, f2, f3, f4: InfixExpression(arena.node(f0), arena.string(f1), arena.node(f2)),
+    NodeType.CallExpression: lambda arena, f0, f1, f2, f3, f4: CallExpression(arena.node(f0), _nodes(arena, f1)),
+    NodeType.IndexExpression: lambda arena, f0, f1, f2, f3, f4: IndexExpression(arena.node(f0), arena.node(f1)),
+    NodeType.IntegerLiteral: lambda arena, f0, f1, f2, f3, f4: IntegerLiteral(arena.integers[f0]),
+    NodeType.FloatLiteral: lambda arena, f0, f1, f2, f3, f4: FloatLiteral(arena.floats[f0]),
+    NodeType.IdentifierLiteral: lambda arena, f0, f1, f2, f3, f4: IdentifierLiteral(arena.string(f0)),
+    NodeType.BooleanLiteral: lambda arena, f0, f1, f2, f3, f4: BooleanLiteral(bool(f0)),
+    NodeType.ArrayLiteral: lambda arena, f0, f1, f2, f3, f4: ArrayLiteral(_nodes(arena, f0)),
+    NodeType.FunctionParameter: lambda arena, f0, f1, f2, f3, f4: FunctionParameter(arena.string(f0), arena.string(f1)),
+}.items():
+    _BUILDERS[NODE_CODES[_node_type]] = _builder
@@ -0,0 +1,331 @@
+from Lexer import Lexer
+from TableLexer import TableLexer, tokenize
+from Parser import Parser
+from Compiler import Compiler
+from Optimizer import Optimizer
+from Token import TokenType
+import JIT
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import subprocess
+import llvmlite.binding as llvm
+from ctypes import CFUNCTYPE, c_int
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+BENCHMARK_DIRECTORY = "Benchmarks"
+PHASES = ["lex", "parse", "optimize", "codegen", "jit", "execute"]
+
+
+# pure Python and NumPy equivalents of the kernels in Benchmarks/
+def fibonacci_python():
+    def fibonacci(n):
+        if n == 0: return 0
+        if n == 1: return 1
+        return fibonacci(n - 1) + fibonacci(n - 2)
+    return fibonacci(27)
+
+def nested_loops_python():
+    total = 0
+    for i in range(2000):
+        for j in range(2000):
+            total += (i * j) % 7
+    return total
+
+def nested_loops_numpy():
+    i = np.arange(2000, dtype=np.int64)
+    return int(np.sum(np.outer(i, i) % 7))
+
+def integer_arithmetic_python():
+    x, total = 12345, 0
+    for _ in range(5000000):
+        x = (x * 75 + 74) % 65537
+        total += x % 13
+    return total
+
+def float_arithmetic_python():
+    total, k = 0.0, 1.0
+    while k < 2000000.0:
+        total += 1.0 / (k * k)
+        k += 1.0
+    return total
+
+def float_arithmetic_numpy():
+    k = np.arange(1, 2000000, dtype=np.float32)
+    return float(np.sum(1.0 / (k * k)))
+
+def exponentiation_python():
+    total, k = 0.0, 0.0
+    while k < 1000000.0:
+        total += (k / 1000000.0) ** 3.0 + (k / 1000000.0) ** 0.5
+        k += 1.0
+    return total
+
+def exponentiation_numpy():
+    x = np.arange(0, 1000000, dtype=np.float32) / np.float32(1000000.0)
+    return float(np.sum(x ** 3 + np.sqrt(x)))
+
+def elementwise_python():
+    x = [1.5] * 4000000
+    y = [2.0] * 4000000
+    z = [3.0 * a + b * b - a / 2.0 for a, b in zip(x, y)]
+    return z[-1]
+
+def elementwise_numpy():
+    x = np.full(4000000, 1.5, dtype=np.float32)
+    y = np.full(4000000, 2.0, dtype=np.float32)
+    z = 3.0 * x + y * y - x / 2.0
+    return float(z[-1])
+
+def matmul_numpy():
+    a = np.full((256, 256), 0.5, dtype=np.float32)
+    b = np.full((256, 256), 0.25, dtype=np.float32)
+    for _ in range(20):
+        c = a @ b
+    return float(c[255, 255])
+
+def reduction_numpy():
+    x = np.full(4000000, 0.5, dtype=np.float32)
+    y = np.full(4000000, 0.25, dtype=np.float32)
+    total = 0.0
+    for _ in range(10):
+        total += float(np.dot(x, y) + np.sum(x) + np.max(y))
+    return total
+
+def parallel_sweep_python():
+    result = []
+    r = 3.0
+    for _ in range(2000):
+        x = 0.5
+        for _ in range(2000):
+            x = r * x * (1.0 - x)
+        result.append(x)
+        r += 0.0005
+    return result[-1]
+
+def parallel_sweep_numpy():
+    r = 3.0 + 0.0005 * np.arange(2000, dtype=np.float32)
+    x = np.full(2000, 0.5, dtype=np.float32)
+    for _ in range(2000):
+        x = r * x * (1.0 - x)
+    return float(x[-1])
+
+
+# name: (python baseline, numpy baseline). integer_arithmetic has a loop carried dependency, so it has no
+# meaningful NumPy formulation, and neither has the recursive fibonacci. Twenty 256 x 256 matrix products take
+# minutes in pure Python, so matmul is only compared against NumPy, and so is reduction, which would take seconds.
+KERNELS = {
+    "fibonacci": (fibonacci_python, None),
+    "nested_loops": (nested_loops_python, nested_loops_numpy),
+    "integer_arithmetic": (integer_arithmetic_python, None),
+    "float_arithmetic": (float_arithmetic_python, float_arithmetic_numpy),
+    "exponentiation": (exponentiation_python, exponentiation_numpy),
+    "elementwise": (elementwise_python, elementwise_numpy),
+    "matmul": (None, matmul_numpy),
+    "reduction": (None, reduction_numpy),
+    "parallel_sweep": (parallel_sweep_python, parallel_sweep_numpy),
+}
+
+
+class _SilencedStdout:
+    # the kernels print their result, which would otherwise interleave with the report
+    def __enter__(self):
+        sys.stdout.flush()
+        JIT.flush_output()
+        self._saved = os.dup(1)
+        self._null = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(self._null, 1)
+
+    def __exit__(self, *_):
+        JIT.flush_output()
+        os.dup2(self._saved, 1)
+        os.close(self._saved)
+        os.close(self._null)
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarise(samples: list[float]) -> dict[str, float]:
+    # all times in milliseconds
+    samples = [sample * 1000 for sample in samples]
+    return {
+        "median": percentile(samples, 50),
+        "p90": percentile(samples, 90),
+        "p99": percentile(samples, 99),
+        "min": min(samples),
+        "max": max(samples),
+        "mean": sum(samples) / len(samples),
+        "runs": len(samples),
+    }
+
+
+def generate_source(size: int) -> str:
+    # machine generated program of roughly size bytes: copies of Testing/Test.txt with renamed identifiers
+    with open(os.path.join("Testing", "Test.txt"), "r") as f:
+        template = f.read()
+    parts = []
+    length = 0
+    while length < size:
+        part = template.replace("fibonacci", f"fibonacci_{len(parts)}").replace("var j", f"var j_{len(parts)}").replace("var a", f"var a_{len(parts)}")
+        parts.append(part)
+        length += len(part.encode("utf-8"))
+    return "\n".join(parts)
+
+
+def lex_with(lexer) -> int:
+    count = 1
+    while lexer.get_next_token().type != TokenType.EOF:
+        count += 1
+    return count
+
+
+def benchmark_lexers(size: int, repeat: int) -> dict[str, dict]:
+    code = generate_source(size)
+    megabytes = len(code.encode("utf-8")) / (1024 * 1024)
+    lexers = {
+        "Lexer": lambda: lex_with(Lexer(code=code)),
+        "tokenize": lambda: len(tokenize(code)),
+        "TableLexer": lambda: lex_with(TableLexer(code=code)),
+    }
+    results = {}
+    for name, run in lexers.items():
+        samples = []
+        for _ in range(repeat):
+            start = perf_counter()
+            run()
+            samples.append(perf_counter() - start)
+        results[name] = {"megabytes": megabytes, "megabytes_per_second": megabytes / percentile(samples, 50), **summarise(samples)}
+        print(f"{name:<20} {results[name]['megabytes_per_second']:.2f} MB/s")
+    return results
+
+
+def benchmark_kernel(code: str, opt_level: int, warmup: int, repeat: int) -> dict[str, dict[str, float]]:
+    samples = {phase: [] for phase in PHASES}
+    for run in range(warmup + repeat):
+        timings = {}
+
+        start = perf_counter()
+        lexer = TableLexer(code=code)
+        timings["lex"] = perf_counter() - start
+
+        start = perf_counter()
+        parser = Parser(lexer=lexer)
+        program = parser.parse()
+        timings["parse"] = perf_counter() - start
+        if parser.errors:
+            raise RuntimeError("\n".join(parser.errors))
+
+        start = perf_counter()
+        if opt_level > 0:
+            program = Optimizer().optimize(program)
+        timings["optimize"] = perf_counter() - start
+
+        start = perf_counter()
+        # the kernels measure the generated code, so their calls are not evaluated while compiling
+        compiler = Compiler(compile_time_steps=0)
+        compiler.compile(node=program)
+        compiler.module.triple = llvm.get_default_triple()
+        timings["codegen"] = perf_counter() - start
+        if compiler.errors:
+            raise RuntimeError("\n".join(compiler.errors))
+
+        start = perf_counter()
+        engine = JIT.create_engine(compiler.module, opt_level=opt_level)
+        cfunc = CFUNCTYPE(c_int)(engine.get_function_address("main"))
+        timings["jit"] = perf_counter() - start
+
+        with _SilencedStdout():
+            start = perf_counter()
+            cfunc()
+            timings["execute"] = perf_counter() - start
+
+        if run >= warmup:
+            for phase, timing in timings.items():
+                samples[phase].append(timing)
+    return {phase: summarise(phase_samples) for phase, phase_samples in samples.items()}
+
+
+def benchmark_function(function, warmup: int, repeat: int) -> dict[str, float]:
+    samples = []
+    for run in range(warmup + repeat):
+        start = perf_counter()
+        function()
+        if run >= warmup:
+            samples.append(perf_counter() - start)
+    return summarise(samples)
+
+
+def metadata(opt_level: int, warmup: int, repeat: int) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "opt_level": opt_level,
+        "warmup": warmup,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "llvm": ".".join(map(str, llvm.llvm_version_info)),
+        "numpy": np.__version__ if np is not None else None,
+        "cpu": llvm.get_host_cpu_name(),
+        "machine": platform.machine(),
+    }
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Benchmark the CalcLite kernels in Benchmarks/ against Python and NumPy.")
+    argument_parser.add_argument("kernels", nargs="*", default=list(KERNELS), help="kernels to run (default: all)")
+    argument_parser.add_argument("-O", dest="opt_level", type=int, choices=JIT.OPTIMIZATION_LEVELS, default=JIT.DEFAULT_OPTIMIZATION_LEVEL)
+    argument_parser.add_argument("--warmup", type=int, default=2)
+    argument_parser.add_argument("--repeat", type=int, default=10)
+    argument_parser.add_argument("--no-baselines", action="store_true", help="skip the Python and NumPy baselines")
+    argument_parser.add_argument("--lexers", type=float, metavar="MB", help="only measure lexer throughput on a generated source of this size")
+    argument_parser.add_argument("--output", default=os.path.join(BENCHMARK_DIRECTORY, "results.json"))
+    arguments = argument_parser.parse_args()
+
+    JIT.initialise()
+    results = {"metadata": metadata(arguments.opt_level, arguments.warmup, arguments.repeat), "kernels": {}}
+    if arguments.lexers is not None:
+        results["lexers"] = benchmark_lexers(int(arguments.lexers * 1024 * 1024), arguments.repeat)
+        arguments.kernels = []
+    for name in arguments.kernels:
+        if name not in KERNELS:
+            argument_parser.error(f"unknown kernel {name}, expected one of {', '.join(KERNELS)}")
+        with open(os.path.join(BENCHMARK_DIRECTORY, f"{name}.txt"), "r") as f:
+            code = f.read()
+
+        result = {"calclite": benchmark_kernel(code, arguments.opt_level, arguments.warmup, arguments.repeat)}
+        python_function, numpy_function = KERNELS[name]
+        if not arguments.no_baselines:
+            if python_function is not None:
+                result["python"] = benchmark_function(python_function, arguments.warmup, arguments.repeat)
+            if numpy_function is not None and np is not None:
+                result["numpy"] = benchmark_function(numpy_function, arguments.warmup, arguments.repeat)
+        results["kernels"][name] = result
+
+        phases = "  ".join(f"{phase} {result['calclite'][phase]['median']:.3f}" for phase in PHASES)
+        print(f"{name:<20} {phases}  (median ms)")
+        execute = result["calclite"]["execute"]["median"]
+        for baseline in ["python", "numpy"]:
+            if baseline in result:
+                print(f"{'':<20} {baseline} {result[baseline]['median']:.3f} ms, {result[baseline]['median'] / execute:.1f}x the CalcLite execution time")
+
+    with open(arguments.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {arguments.output}")
@@ -0,0 +1,128 @@
+import os
+import json
+import hashlib
+import llvmlite.binding as llvm
+
+
+# sources whose changes invalidate every cached object
+COMPILER_SOURCES = ["Token.py", "Lexer.py", "TableLexer.py", "AST.py", "Parser.py", "Environment.py", "Interpreter.py", "Optimizer.py", "Resolver.py", "Compiler.py", "Runtime.py", "JIT.py"]
+DEFAULT_CACHE_DIRECTORY = os.environ.get("CALCLITE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "calclite"))
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+_compiler_version: str | None = None
+
+
+def compiler_version() -> str:
+    global _compiler_version
+    if _compiler_version is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for source in COMPILER_SOURCES:
+            with open(os.path.join(directory, source), "rb") as f:
+                digest.update(f.read())
+        digest.update(".".join(map(str, llvm.llvm_version_info)).encode("utf-8"))
+        _compiler_version = digest.hexdigest()
+    return _compiler_version
+
+
+class ObjectCache:
+    # native objects are stored as <key>.o and evicted least recently used first, the modification time of an
+    # entry is its last use
+    def __init__(self, directory: str = DEFAULT_CACHE_DIRECTORY, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, code: str, opt_level: int, options: str = "") -> str:
+        # options are the compiler options that change the generated code, such as fast reductions
+        digest = hashlib.sha256()
+        for part in [code, compiler_version(), str(opt_level), options, llvm.get_default_triple(), llvm.get_host_cpu_name(), llvm.get_host_cpu_features().flatten()]:
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.o")
+
+    def load(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            self._record("misses")
+            return None
+        self._record("hits")
+        return data
+
+    def store(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+        self._evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".o"): continue
+            try:
+                status = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((status.st_mtime, status.st_size, name))
+        return entries
+
+    def _evict(self) -> None:
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        while entries and size > self.max_size:
+            _, entry_size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+        if evicted:
+            self._record("evictions", evicted)
+
+    def _stats_path(self) -> str:
+        return os.path.join(self.directory, "stats.json")
+
+    def _read_counters(self) -> dict[str, int]:
+        try:
+            with open(self._stats_path(), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _record(self, counter: str, amount: int = 1) -> None:
+        # counters are shared between processes, concurrent runs may occasionally lose an increment
+        counters = self._read_counters()
+        counters[counter] = counters.get(counter, 0) + amount
+        temporary_path = f"{self._stats_path()}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(counters, f)
+        os.replace(temporary_path, self._stats_path())
+
+    def stats(self) -> dict[str, int | float]:
+        counters = self._read_counters()
+        entries = self._entries()
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            **counters,
+            "hit_rate": counters.get("hits", 0) / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "size": sum(entry[1] for entry in entries),
+            "max_size": self.max_size,
+        }
+
+    def clear(self) -> None:
+        for _, _, name in self._entries():
+            os.remove(os.path.join(self.directory, name))
+        if os.path.exists(self._stats_path()):
+            os.remove(self._stats_path())
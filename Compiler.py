@@ -1,26 +1,133 @@
+import math
+from itertools import zip_longest
 from llvmlite import ir
 
-from AST import Node, NodeType, Statement, Expression, Program
+from AST import Node, NodeType, Statement, Expression, Program, children
 from AST import ExpressionStatement, VarStatement, BlockStatement, FunctionStatement, ReturnStatement, AssignStatement
-from AST import IfStatement, WhileStatement
-from AST import InfixExpression, CallExpression
-from AST import IntegerLiteral, FloatLiteral, IdentifierLiteral, BooleanLiteral
+from AST import IfStatement, WhileStatement, IndexAssignStatement, ForStatement
+from AST import InfixExpression, CallExpression, IndexExpression
+from AST import IntegerLiteral, FloatLiteral, IdentifierLiteral, BooleanLiteral, ArrayLiteral
 from AST import FunctionParameter
 from Environment import Environment
+from Resolver import Resolver
+from Interpreter import Interpreter, InterpreterError, CONVERSION_FUNCTIONS, MATH_FUNCTIONS, MAX_UNROLLED_EXPONENT, math_type, elementwise_type
+from Token import NUMERIC_TYPES
+import Runtime
+
+
+ELEMENTWISE_OPERATORS = ("+", "-", "*", "/", "%", "^")
+COMPARISON_OPERATORS = ("<", "<=", ">", ">=", "==", "!=")
+
+
+# matrix products are computed in tiles of MATMUL_ROWS rows by MATMUL_VECTORS vectors of VECTOR_WIDTH floats, whose
+# accumulators stay in registers, within cache blocks of MATMUL_COLUMN_BLOCK columns and MATMUL_DEPTH_BLOCK rows of
+# the right operand
+VECTOR_WIDTH = 8
+MATMUL_ROWS = 4
+MATMUL_VECTORS = 2
+MATMUL_COLUMN_BLOCK = 256
+MATMUL_DEPTH_BLOCK = 128
+TRANSPOSE_BLOCK = 32
+
+# reductions keep REDUCTION_VECTORS vector accumulators of VECTOR_WIDTH lanes, and arrays longer than REDUCTION_BLOCK
+# elements are reduced in blocks of that size, which the thread pool runs in parallel from REDUCTION_PARALLEL_BLOCKS
+# blocks upwards. The iterations of a loop with a reduce clause are split into REDUCTION_BLOCKS blocks unless the
+# loop gives a chunk size
+REDUCTION_VECTORS = 4
+REDUCTION_BLOCK = 1 << 16
+REDUCTION_PARALLEL_BLOCKS = 4
+REDUCTION_BLOCKS = 256
+REDUCTION_OPERATORS = {"+": "sum", "*": "prod", "min": "min", "max": "max"}
+# with fast_reductions float reductions may be reassociated and contracted into fused multiply-adds
+FAST_REDUCTION_FLAGS = ("reassoc", "contract")
+# the LLVM fast-math flags fast_math may set on float instructions, "fast" standing for all of them
+FAST_MATH_FLAGS = ("reassoc", "contract", "nnan", "ninf", "nsz", "arcp", "afn")
+
+# a call of a @memo function probes MEMO_WAYS consecutive entries of its cache
+MEMO_WAYS = 4
+# built-in functions without side effects, which pure functions may call
+PURE_BUILTINS = ("fill", "len", "reshape", "transpose", "rows", "cols", "sum", "prod", "min", "max", "dot", *CONVERSION_FUNCTIONS, *MATH_FUNCTIONS)
+# math functions with an LLVM intrinsic llvm.<libm name>, which LLVM can fold, hoist and vectorize. The others are
+# calls of libm
+INTRINSIC_MATH_FUNCTIONS = ("sqrt", "abs", "floor", "ceil", "trunc", "round", "fma", "exp", "exp2", "log", "log2", "log10", "sin", "cos")
+# statements the interpreter may execute in total to evaluate calls of pure functions with literal arguments while
+# compiling, where it caches the results of calls. The interpreter rounds float reductions, matrix products and powers differently from compiled code, so
+# functions that use these are not evaluated, and neither are those with transcendental functions, which LLVM folds in double precision
+DEFAULT_COMPILE_TIME_STEPS = 100000
+INEXACT_BUILTINS = ("sum", "prod", "dot", "exp", "exp2", "log", "log2", "log10", "sin", "cos", "tan", "asin", "acos", "atan", "atan2", "sinh", "cosh", "tanh")
+
+
+def array_type(element_type: ir.Type) -> ir.LiteralStructType:
+    # arrays are passed by value as their length and a pointer to the elements, which live on the heap and are
+    # shared by every copy of the array
+    return ir.LiteralStructType([ir.IntType(64), element_type.as_pointer()])
+
+
+def matrix_type() -> ir.LiteralStructType:
+    # float matrices are passed by value as their rows, columns and a pointer to the row-major elements
+    return ir.LiteralStructType([ir.IntType(64), ir.IntType(64), ir.FloatType().as_pointer()])
 
 
 class Compiler:
-    def __init__(self) -> None:
+    def __init__(self, function_addresses: dict[str, int] | None = None, entry: str = "main", global_variables: bool = False, batch_functions: bool = False, fast_reductions: bool = False, memo_counters: bool = False, compile_time_steps: int = DEFAULT_COMPILE_TIME_STEPS, fast_math: tuple[str, ...] = ()) -> None:
         self.type_map = {
             "int": ir.IntType(32),
+            "i64": ir.IntType(64),
             "float": ir.FloatType(),
+            "f64": ir.DoubleType(),
             "bool": ir.IntType(1),
         }
+        self.type_map["int[]"] = array_type(self.type_map["int"])
+        self.type_map["float[]"] = array_type(self.type_map["float"])
+        self.type_map["matrix"] = matrix_type()
         self.module: ir.Module = ir.Module("Main")
         self.builder: ir.IRBuilder = ir.IRBuilder()
         self.environment = Environment(records={})
         self.errors: list[str] = []
+        # slots of the names in the scope of every function and parallel for body, and the functions calling
+        # themselves, found by the Resolver
+        self._scopes: dict[Node, dict[str, int]] = {}
+        self._recursive: set[FunctionStatement] = set()
+        # top level functions named here are not compiled, calls go through a function pointer initialised to the
+        # given address instead (see LazyJIT)
+        self.function_addresses = function_addresses or {}
+        # the top level code is compiled into the function entry, and with global_variables its variables become
+        # module globals that other modules can link against (see REPL)
+        self.entry = entry
+        self.global_variables = global_variables
+        # with batch_functions every top level function with only scalar parameters and result also gets a loop
+        # wrapper <name>.batch that applies it to whole buffers (see _batch_function and Interop)
+        self.batch_functions = batch_functions
+        # float reductions add up their partial results in an order fixed by the length of the input alone, so the
+        # result does not depend on the number of threads. fast_reductions lets LLVM reorder them as well
+        self.fast_reductions = fast_reductions
+        # fast_math sets the given fast-math flags on all float arithmetic and comparisons, which lets LLVM assume
+        # there are no NaNs or infinities with nnan and ninf, or reorder and fuse operations with reassoc and contract
+        unknown = [flag for flag in fast_math if flag not in (*FAST_MATH_FLAGS, "fast")]
+        if unknown:
+            raise ValueError(f"Unknown fast-math flags {', '.join(unknown)}, expected some of {', '.join(FAST_MATH_FLAGS)} or fast.")
+        self.fast_math: tuple[str, ...] = FAST_MATH_FLAGS if "fast" in fast_math else tuple(dict.fromkeys(fast_math))
+        self._reduction_flags = _union(self.fast_math, FAST_REDUCTION_FLAGS) if fast_reductions else self.fast_math
+        self._float_flags: tuple[str, ...] = self.fast_math # fast-math flags of the float arithmetic being compiled
+        # with memo_counters every @memo function counts its cache hits and misses in the globals
+        # <name>.memo.hits and <name>.memo.misses, and memo_functions lists the functions that have them
+        self.memo_counters = memo_counters
+        self.memo_functions: list[str] = []
+        # definitions of the functions seen so far, and why they are not pure (None if they are) once checked
+        self._function_nodes: dict[str, FunctionStatement] = {}
+        self._impurities: dict[str, str | None] = {}
+        # calls of pure functions with literal arguments are evaluated while compiling until the interpreter has run
+        # compile_time_steps statements in total, 0 turns this off. Results are kept per function and arguments,
+        # None for calls that could not be evaluated
+        self.compile_time_steps = compile_time_steps
+        self._compile_time_results: dict[tuple, ir.Constant | None] = {}
+        self._parallel_bodies = 0 # outlined parallel for bodies so far, and how many are being compiled right now
+        self._parallel_depth = 0
+        # while compiling a function whose recursive calls become jumps: its name, the block they jump to, the phi
+        # nodes of its parameters and accumulator there, and the accumulating operator (see _recursion_loop)
+        self._recursion: tuple[str, ir.Block, list[ir.PhiInstr], ir.PhiInstr | None, str] | None = None
         self._initialise_builtins()
+        self.builtins = set(self.environment.records)
     
     def _initialise_builtins(self):
         # initialise true and false constants
@@ -29,35 +136,33 @@ class Compiler:
         true_var = ir.GlobalVariable(self.module, boolean_type, "true")
         true_var.initializer = ir.Constant(boolean_type, 1)
         true_var.global_constant = True
+        true_var.linkage = "internal"
         self.environment.define("true", true_var, true_var.type)
 
         false_var = ir.GlobalVariable(self.module, boolean_type, "false")
         false_var.initializer = ir.Constant(boolean_type, 0)
         false_var.global_constant = True
+        false_var.linkage = "internal"
         self.environment.define("false", false_var, false_var.type)
 
-        # initialise exponentiation functions
-        int_exponentiation = ir.Function(self.module, ir.FunctionType(self.type_map["int"], [self.type_map["int"], self.type_map["int"]]), name="llvm.pow.i32")
-        self.environment.define("int_exponentiation", int_exponentiation, self.type_map["int"])
-        float_exponentiation = ir.Function(self.module, ir.FunctionType(self.type_map["float"], [self.type_map["float"], self.type_map["float"]]), name="llvm.pow.f32")
-        self.environment.define("float_exponentiation", float_exponentiation, self.type_map["float"])
-
-        # initialise print
-        printf_ty = ir.FunctionType(ir.VoidType(), [ir.IntType(8).as_pointer()], var_arg=True)
-        printf = ir.Function(self.module, printf_ty, name="printf")
-        self.environment.define("print", printf, ir.VoidType())
+        # ^ is emitted inline (see _power), declaring the LLVM intrinsics it calls when first used
 
-        str_format = "%.10f"
-        format_str_var = ir.GlobalVariable(self.module, ir.ArrayType(ir.IntType(8), len(str_format)), name=f"float_string_format")
-        format_str_var.initializer = ir.Constant(ir.ArrayType(ir.IntType(8), len(str_format)), bytearray(str_format.encode("utf-8")))
-        self.environment.define("float_string_format", format_str_var, ir.IntType(8).as_pointer())
+        # print and the messages of runtime checks go through the output buffers of the runtime, whose functions
+        # are declared when first used (see _runtime_function)
 
-        str_format = "%d\n"
-        format_str_var = ir.GlobalVariable(self.module, ir.ArrayType(ir.IntType(8), len(str_format)), name=f"int_string_format")
-        format_str_var.initializer = ir.Constant(ir.ArrayType(ir.IntType(8), len(str_format)), bytearray(str_format.encode("utf-8")))
-        self.environment.define("int_string_format", format_str_var, ir.IntType(8).as_pointer())
+        # initialise memory allocation for arrays
+        malloc = ir.Function(self.module, ir.FunctionType(ir.IntType(8).as_pointer(), [ir.IntType(64)]), name="malloc")
+        self.environment.define("malloc", malloc, ir.IntType(8).as_pointer())
+        free = ir.Function(self.module, ir.FunctionType(ir.VoidType(), [ir.IntType(8).as_pointer()]), name="free")
+        self.environment.define("free", free, ir.VoidType())
+        memset = ir.Function(self.module, ir.FunctionType(ir.VoidType(), [ir.IntType(8).as_pointer(), ir.IntType(8), ir.IntType(64), ir.IntType(1)]), name="llvm.memset.p0i8.i64")
+        self.environment.define("memset", memset, ir.VoidType())
 
     def compile(self, node: Node):
+        # the node compiled outside of any function is resolved as a whole first, and not compiled if a name in it
+        # is undefined or declared twice
+        if self.builder.block is None and not self._resolve(node):
+            return
         match node.type():
             case NodeType.Program:
                 self._visit_program(node)
@@ -78,12 +183,29 @@ class Compiler:
                 self._visit_if_statement(node)
             case NodeType.WhileStatement:
                 self._visit_while_statement(node)
+            case NodeType.IndexAssignStatement:
+                self._visit_index_assign_statement(node)
+            case NodeType.ForStatement:
+                self._visit_for_statement(node)
 
             case NodeType.InfixExpression:
                 self._visit_infix_expression(node)
             case NodeType.CallExpression:
                 self._visit_call_expression(node)
     
+    def _resolve(self, node: Node) -> bool:
+        resolver = Resolver(self.environment, self.entry, self.global_variables)
+        errors = resolver.resolve(node)
+        if errors:
+            self.errors.extend(errors)
+            return False
+        # names the Resolver declared at the top get their slots in the same order
+        for name in resolver.environment.slots:
+            self.environment.slot(name)
+        self._scopes.update(resolver.scopes)
+        self._recursive.update(resolver.recursive)
+        return True
+
     def _resolve_value(self, node: Expression, value_type: str = None) -> tuple[ir.Value, ir.Type]:
         match node.type():
             case NodeType.IntegerLiteral:
@@ -93,9 +215,7 @@ class Compiler:
                 node_value, node_type = node.value, self.type_map["float" if value_type is None else value_type]
                 return ir.Constant(node_type, node_value), node_type
             case NodeType.IdentifierLiteral:
-                pointer, node_type = self.environment.lookup(node.value)
-                # TODO: error handling if trying to load a non existent variable, function etc.???
-                return self.builder.load(pointer), node_type
+                return self._load_variable(node)
             case NodeType.BooleanLiteral:
                 value = ir.Constant(self.type_map["bool" if value_type is None else value_type], 1 if node.value else 0)
                 return value, self.type_map["bool" if value_type is None else value_type]
@@ -104,10 +224,14 @@ class Compiler:
                 return self._visit_infix_expression(node)
             case NodeType.CallExpression:
                 return self._visit_call_expression(node)
+            case NodeType.IndexExpression:
+                return self._visit_index_expression(node)
+            case NodeType.ArrayLiteral:
+                return self._visit_array_literal(node, value_type)
 
     def _visit_program(self, node: Program):
         function_type = ir.FunctionType(self.type_map["int"], [])
-        main_function = ir.Function(self.module, function_type, name="main")
+        main_function = ir.Function(self.module, function_type, name=self.entry)
 
         block = main_function.append_basic_block("Main function")
         self.builder = ir.IRBuilder(block)
@@ -115,6 +239,9 @@ class Compiler:
         for statement in node.statements:
             self.compile(statement)
         
+        # the output of the program is complete when it returns
+        if any(name in self.module.globals for name in Runtime.PRINT_FUNCTIONS):
+            self.builder.call(self._runtime_function(Runtime.FLUSH, Runtime.FLUSH_TYPE), [])
         return_value: ir.Constant = ir.Constant(self.type_map["int"], 0)
         self.builder.ret(return_value)
     
@@ -124,80 +251,484 @@ class Compiler:
     def _visit_var_statement(self, node: VarStatement):
         name = node.name.value
         value, type = self._resolve_value(node=node.value, value_type=node.value_type)
+        declared_type = self.type_map.get(node.value_type)
+        if declared_type is not None and type is not None:
+            value, type = self._implicit_conversion(value, type, declared_type)
+            if type != declared_type:
+                self.errors.append(f"Identifier {name} of type {declared_type} tried to be declared with a value of type {type}.")
+                # the variable is still declared, so that its uses are not reported as well
+                value, type = ir.Constant(declared_type, ir.Undefined), declared_type
 
-        # if variable does not exist in current scope
-        if self.environment.lookup(name) is None:
-            pointer = self.builder.alloca(type)
-            self.builder.store(value, pointer)
-            self.environment.define(name, pointer, type)
-        # if variable exists in current scope
+        # the Resolver checked that the name is new. The value of the variable lives in an SSA register, or in a
+        # module global for the top level code with global_variables
+        if self.global_variables and self.builder.block.function.name == self.entry:
+            global_variable = ir.GlobalVariable(self.module, type, name=name)
+            global_variable.initializer = ir.Constant(type, None)
+            self.builder.store(value, global_variable)
+            self._define(node.name, global_variable, type)
         else:
-            self.errors.append(f"Identifier {name} tried to be declared more than once.")
+            self._define(node.name, value, type)
+
+    def _function_type(self, node: FunctionStatement) -> tuple[ir.FunctionType, ir.Type]:
+        parameter_types: list[ir.Type] = [self.type_map[parameter.value_type] for parameter in node.parameters]
+        return_type: ir.Type = self.type_map[node.return_type]
+        return ir.FunctionType(return_type, parameter_types), return_type
+
+    def declare_function_pointer(self, node: FunctionStatement, address: int | None = None) -> ir.GlobalVariable:
+        # calls to the function load its address from the global "<name>.address", which is defined if an initial
+        # address is given and otherwise resolved from another module at link time
+        function_type, return_type = self._function_type(node)
+        self._function_nodes[node.name.value] = node
+        pointer = ir.GlobalVariable(self.module, function_type.as_pointer(), name=f"{node.name.value}.address")
+        if address is not None:
+            pointer.initializer = ir.Constant(ir.IntType(64), address).inttoptr(function_type.as_pointer())
+        self.environment.define(node.name.value, pointer, return_type)
+        return pointer
+
+    def declare_function(self, node: FunctionStatement) -> ir.Function:
+        # a function defined in another module
+        function_type, return_type = self._function_type(node)
+        self._function_nodes[node.name.value] = node
+        function = ir.Function(self.module, function_type, name=node.name.value)
+        self.environment.define(node.name.value, function, return_type)
+        return function
 
     def _visit_function_statement(self, node: FunctionStatement):
         name = node.name.value
         body = node.body
+        self._function_nodes[name] = node
+        if node.pure:
+            reason = self._impurity(node)
+            if reason is not None:
+                self.errors.append(f"Function {name} is annotated @{'memo' if node.memo is not None else 'pure'} but {reason}.")
+        if name in self.function_addresses and self.environment.parent is None:
+            self.declare_function_pointer(node, self.function_addresses[name])
+            return
 
         parameter_names = [parameter.name for parameter in node.parameters]
-        parameter_types: list[ir.Type] = [self.type_map[parameter.value_type] for parameter in node.parameters]
-        return_type: ir.Type = self.type_map[node.return_type]
-
-        function_type = ir.FunctionType(return_type, parameter_types)
+        function_type, return_type = self._function_type(node)
+        parameter_types = function_type.args
         function = ir.Function(self.module, function_type, name=name)
-        block = function.append_basic_block(f"{name}_entry")
+        scalar_types = [self.type_map[type] for type in (*NUMERIC_TYPES, "bool")]
+        # the body of a @memo function is compiled into <name>.memo.body, and the function itself looks the
+        # arguments up in its cache and only calls the body on a miss. Recursive calls go through the cache too
+        target = function
+        if node.memo is not None:
+            if all(type in scalar_types for type in [*parameter_types, return_type]):
+                target = ir.Function(self.module, function_type, name=f"{name}.memo.body")
+                target.linkage = "internal"
+            else:
+                self.errors.append(f"Function {name} is annotated @memo but only functions of numbers and bools can be cached.")
+        block = target.append_basic_block(f"{name}_entry")
 
         previous_builder = self.builder
         self.builder = ir.IRBuilder(block)
         previous_environment = self.environment
-        self.environment = Environment({}, previous_environment)
+        self.environment = Environment({}, previous_environment, names=self._scopes.get(node, ()))
         # define function for recursion
         self.environment.define(name, function, return_type)
 
         for i, parameter_type in enumerate(parameter_types):
-            pointer = self.builder.alloca(parameter_type)
-            self.builder.store(function.args[i], pointer)
-            self.environment.define(parameter_names[i], pointer, parameter_type)
+            target.args[i].name = parameter_names[i]
+            # the cache of a @memo function has the parameter names as well, which the header of --emit uses
+            if target is not function:
+                function.args[i].name = parameter_names[i]
+            self.environment.define(parameter_names[i], target.args[i], parameter_type)
+
+        # recursive calls of a @memo function go through its cache, so they stay calls
+        previous_recursion = self._recursion
+        operator = _tail_recursion(node) if target is function and node in self._recursive else None
+        self._recursion = self._recursion_loop(name, operator) if operator is not None else None
 
         self.compile(body)
+        self._recursion = previous_recursion
+        if not self.builder.block.is_terminated:
+            if self._has_predecessors(self.builder.block):
+                self.errors.append(f"Function {name} does not return a value on every path.")
+            self.builder.unreachable()
 
         self.environment = previous_environment
-        self.environment.define(name, function, return_type)
+        self._define(node.name, function, return_type)
+        self.builder = previous_builder
+        if target is not function:
+            self._memo_function(function, target, node.memo)
+
+        if self.batch_functions and self.environment.parent is None and all(type in scalar_types for type in [*parameter_types, return_type]):
+            self._batch_function(function)
+
+    def _recursion_loop(self, name: str, operator: str) -> tuple[str, ir.Block, list[ir.PhiInstr], ir.PhiInstr | None, str]:
+        # the body of the function becomes a loop, the parameters are phi nodes merging the arguments of the call
+        # with those of every recursive call, which jumps back instead of calling. With an operator the results of
+        # the recursive calls were added or multiplied with a value, which is accumulated on the way down instead
+        # and applied to the values returned without recursion
+        function = self.builder.block.function
+        entry_block = self.builder.block
+        loop_block = function.append_basic_block(f"{name}_loop")
+        self.builder.branch(loop_block)
+        self.builder.position_at_end(loop_block)
+        parameters = []
+        for argument in function.args:
+            phi = self.builder.phi(argument.type, name=argument.name)
+            phi.add_incoming(argument, entry_block)
+            self.environment.define(argument.name, phi, argument.type)
+            parameters.append(phi)
+        accumulator = None
+        if operator:
+            return_type = function.function_type.return_type
+            accumulator = self.builder.phi(return_type, name="accumulator")
+            accumulator.add_incoming(self._identity(REDUCTION_OPERATORS[operator], return_type), entry_block)
+        return name, loop_block, parameters, accumulator, operator
+
+    def _visit_recursive_return(self, value: Expression) -> bool:
+        # compiles a return inside a function turned into a loop, False if it is an ordinary return
+        name, loop_block, parameters, accumulator, operator = self._recursion
+        if operator and value.type() == NodeType.InfixExpression and value.operator == operator and (_is_call_to(value.left_node, name) or _is_call_to(value.right_node, name)):
+            operands = [value.left_node, value.right_node]
+        elif _is_call_to(value, name):
+            operands = [value]
+        elif operator:
+            result, type = self._apply_operator(operator, accumulator, accumulator.type, *self._resolve_converted(value, accumulator.type))
+            if type != accumulator.type:
+                self.errors.append(f"Function {name} of type {accumulator.type} tried to return a value of type {type}.")
+                self.builder.unreachable()
+                return True
+            self.builder.ret(result)
+            return True
+        else:
+            return False
+
+        # the operands are evaluated in the order of the original expression, the call being replaced by the jump
+        arguments, total = [], accumulator
+        for operand in operands:
+            if _is_call_to(operand, name):
+                arguments = [self._resolve_converted(argument, phi.type) for argument, phi in zip(operand.parameters, parameters)]
+                arguments += [self._resolve_value(argument) for argument in operand.parameters[len(parameters):]]
+            else:
+                term, type = self._resolve_converted(operand, accumulator.type)
+                total, type = self._apply_operator(operator, total, total.type, term, type)
+                if type != accumulator.type:
+                    self.errors.append(f"Function {name} of type {accumulator.type} tried to return a value of type {type}.")
+                    self.builder.unreachable()
+                    return True
+        if [type for _, type in arguments] != [phi.type for phi in parameters]:
+            self.errors.append(f"Function {name} is called with arguments that do not match its parameters.")
+            self.builder.unreachable()
+            return True
+        for phi, (argument, _) in zip(parameters, arguments):
+            phi.add_incoming(argument, self.builder.block)
+        if accumulator is not None:
+            accumulator.add_incoming(total, self.builder.block)
+        self.builder.branch(loop_block)
+        return True
+
+    def _impurity(self, node: FunctionStatement) -> str | None:
+        # why a function is not pure, None if it is. A pure function does not print, call functions that are not
+        # pure, use variables declared outside it or assign elements of arrays it did not create, so its result
+        # only depends on its arguments
+        name = node.name.value
+        if name in self._impurities:
+            return self._impurities[name]
+        # recursive calls are assumed to be pure while the function is checked
+        self._impurities[name] = None
+        declared = {parameter.name for parameter in node.parameters}
+        created = _created_arrays(node)
+        functions = {name}
+
+        def first(*nodes) -> str | None:
+            return next((reason for reason in map(visit, nodes) if reason is not None), None)
+
+        def visit(current: Node | None) -> str | None:
+            if current is None: return None
+            match current.type():
+                case NodeType.BlockStatement:
+                    return first(*current.statements)
+                case NodeType.ExpressionStatement:
+                    return visit(current.expression)
+                case NodeType.VarStatement:
+                    reason = visit(current.value)
+                    declared.add(current.name.value)
+                    return reason
+                case NodeType.FunctionStatement:
+                    functions.add(current.name.value)
+                case NodeType.ReturnStatement:
+                    return visit(current.return_value)
+                case NodeType.AssignStatement:
+                    if current.identifier.value not in declared:
+                        return f"assigns the variable {current.identifier.value} declared outside it"
+                    return visit(current.expression)
+                case NodeType.IndexAssignStatement:
+                    array = current.array
+                    while array.type() == NodeType.IndexExpression:
+                        array = array.array
+                    if array.type() != NodeType.IdentifierLiteral or array.value not in created:
+                        return "assigns elements of an array it did not create"
+                    return first(current.array, current.index, current.expression)
+                case NodeType.IfStatement:
+                    return first(current.condition, current.consequence, current.alternative)
+                case NodeType.WhileStatement:
+                    return first(current.condition, current.body)
+                case NodeType.ForStatement:
+                    reason = first(current.start, current.stop, current.chunk)
+                    declared.add(current.variable.value)
+                    return reason or visit(current.body)
+                case NodeType.InfixExpression:
+                    return first(current.left_node, current.right_node)
+                case NodeType.CallExpression:
+                    callee = current.name.value
+                    if callee == "print":
+                        return "prints"
+                    if callee not in PURE_BUILTINS and callee not in functions:
+                        callee_node = self._function_nodes.get(callee)
+                        if callee_node is None:
+                            return f"calls {callee}, which is not defined before it"
+                        if self._impurity(callee_node) is not None:
+                            return f"calls {callee}, which is not pure"
+                    return first(*current.parameters)
+                case NodeType.IndexExpression:
+                    return first(current.array, current.index)
+                case NodeType.ArrayLiteral:
+                    return first(*current.elements)
+                case NodeType.IdentifierLiteral:
+                    if current.value not in declared and current.value not in ("true", "false"):
+                        return f"reads the variable {current.value} declared outside it"
+            return None
+
+        self._impurities[name] = visit(node.body)
+        return self._impurities[name]
+
+    def _memo_function(self, function: ir.Function, body: ir.Function, size: int) -> None:
+        # the results of a @memo function are cached in a table of size entries rounded up to a power of two. An
+        # entry holds its state (0 empty, 1 cached, 2 cached and used since the clock last passed it), the
+        # arguments and the result, and the arguments hash to a run of MEMO_WAYS entries. A miss runs the body
+        # without holding the lock of the table, so that recursive calls can use it, and then replaces the first
+        # entry of the run that was not used since the clock last passed, giving used entries a second chance
+        name = function.name
+        i8, i32, i64 = ir.IntType(8), ir.IntType(32), ir.IntType(64)
+        size = max(1 << (size - 1).bit_length(), MEMO_WAYS)
+        function_type = function.function_type
+        entry_type = ir.LiteralStructType([i8, *function_type.args, function_type.return_type])
+        table = ir.GlobalVariable(self.module, ir.ArrayType(entry_type, size), name=f"{name}.memo.table")
+        table.initializer = ir.Constant(table.value_type, None)
+        table.linkage = "internal"
+        lock = ir.GlobalVariable(self.module, i8, name=f"{name}.memo.lock")
+        lock.initializer = ir.Constant(i8, 0)
+        lock.linkage = "internal"
+        hits = misses = None
+        if self.memo_counters:
+            hits, misses = [ir.GlobalVariable(self.module, i64, name=f"{name}.memo.{counter}") for counter in ("hits", "misses")]
+            hits.initializer = misses.initializer = ir.Constant(i64, 0)
+            self.memo_functions.append(name)
+
+        previous_builder = self.builder
+        self.builder = ir.IRBuilder(function.append_basic_block(f"{name}_entry"))
+        arguments = list(function.args)
+        home = self._memo_hash(arguments)
+        def entry(way: int) -> ir.Value:
+            slot = self.builder.and_(self.builder.add(home, ir.Constant(i64, way)), ir.Constant(i64, size - 1))
+            return self.builder.gep(table, [ir.Constant(i64, 0), slot], inbounds=True)
+        def field(pointer: ir.Value, index: int) -> ir.Value:
+            return self.builder.gep(pointer, [ir.Constant(i32, 0), ir.Constant(i32, index)], inbounds=True)
+
+        # lookup
+        hit_block = function.append_basic_block("hit")
+        miss_block = function.append_basic_block("miss")
+        self._memo_lock(lock)
+        found = []
+        for way in range(MEMO_WAYS):
+            pointer = entry(way)
+            matches = self.builder.icmp_unsigned("!=", self.builder.load(field(pointer, 0)), ir.Constant(i8, 0))
+            for i, argument in enumerate(arguments):
+                matches = self.builder.and_(matches, self._memo_equal(self.builder.load(field(pointer, i + 1)), argument))
+            next_block = function.append_basic_block(f"way{way + 1}") if way + 1 < MEMO_WAYS else miss_block
+            found.append((pointer, self.builder.block))
+            self.builder.cbranch(matches, hit_block, next_block)
+            self.builder.position_at_end(next_block)
+
+        # miss
+        self._memo_count(misses)
+        self.builder.store_atomic(ir.Constant(i8, 0), lock, "release", 1)
+        result = self.builder.call(body, arguments)
+        self._memo_lock(lock)
+        insert_block = function.append_basic_block("insert")
+        victims = []
+        for way in range(MEMO_WAYS):
+            pointer = entry(way)
+            state = field(pointer, 0)
+            victims.append((pointer, self.builder.block))
+            second_chance_block = function.append_basic_block(f"second_chance{way}")
+            self.builder.cbranch(self.builder.icmp_unsigned("==", self.builder.load(state), ir.Constant(i8, 2)), second_chance_block, insert_block)
+            self.builder.position_at_end(second_chance_block)
+            self.builder.store(ir.Constant(i8, 1), state)
+        # every entry of the run was used, and the clock comes back to the first one
+        victims.append((entry(0), self.builder.block))
+        self.builder.branch(insert_block)
+        self.builder.position_at_end(insert_block)
+        victim = self.builder.phi(entry_type.as_pointer())
+        for pointer, block in victims:
+            victim.add_incoming(pointer, block)
+        cached = self.builder.insert_value(ir.Constant(entry_type, ir.Undefined), ir.Constant(i8, 1), 0)
+        for i, value in enumerate([*arguments, result]):
+            cached = self.builder.insert_value(cached, value, i + 1)
+        self.builder.store(cached, victim)
+        self.builder.store_atomic(ir.Constant(i8, 0), lock, "release", 1)
+        self.builder.ret(result)
+
+        # hit
+        self.builder.position_at_end(hit_block)
+        pointer = self.builder.phi(entry_type.as_pointer())
+        for way_pointer, block in found:
+            pointer.add_incoming(way_pointer, block)
+        value = self.builder.load(field(pointer, len(arguments) + 1))
+        self.builder.store(ir.Constant(i8, 2), field(pointer, 0))
+        self._memo_count(hits)
+        self.builder.store_atomic(ir.Constant(i8, 0), lock, "release", 1)
+        self.builder.ret(value)
+        self.builder = previous_builder
+
+    def _memo_lock(self, lock: ir.GlobalVariable) -> None:
+        # spins until it takes the lock of a cache, which is only held for a lookup or an insertion. A thread that
+        # finds the lock taken yields, since the holder may be waiting for the processor it spins on
+        function = self.builder.block.function
+        spin_block = function.append_basic_block("lock")
+        wait_block = function.append_basic_block("lock_wait")
+        locked_block = function.append_basic_block("locked")
+        self.builder.branch(spin_block)
+        self.builder.position_at_end(spin_block)
+        previous = self.builder.atomic_rmw("xchg", lock, ir.Constant(ir.IntType(8), 1), "acquire")
+        self.builder.cbranch(self.builder.icmp_unsigned("==", previous, ir.Constant(ir.IntType(8), 0)), locked_block, wait_block)
+        self.builder.position_at_end(wait_block)
+        sched_yield = self.module.globals.get("sched_yield") or ir.Function(self.module, ir.FunctionType(ir.IntType(32), []), name="sched_yield")
+        self.builder.call(sched_yield, [])
+        self.builder.branch(spin_block)
+        self.builder.position_at_end(locked_block)
+
+    def _memo_count(self, counter: ir.GlobalVariable | None) -> None:
+        if counter is not None:
+            self.builder.store(self.builder.add(self.builder.load(counter), ir.Constant(ir.IntType(64), 1)), counter)
+
+    def _memo_hash(self, arguments: list[ir.Value]) -> ir.Value:
+        # multiplicative hash of the bits of the arguments, with the high half folded into the low bits that index
+        # the table
+        i64 = ir.IntType(64)
+        hash = ir.Constant(i64, 0x27D4EB2F165667C5)
+        for argument in arguments:
+            bits = self._bits(argument)
+            if bits.type != i64:
+                bits = self.builder.zext(bits, i64)
+            hash = self.builder.mul(self.builder.xor(hash, bits), ir.Constant(i64, 0x9E3779B97F4A7C15 - (1 << 64)))
+        return self.builder.xor(hash, self.builder.lshr(hash, ir.Constant(i64, 32)))
+
+    def _memo_equal(self, a: ir.Value, b: ir.Value) -> ir.Value:
+        # floats are compared bit for bit, so that a cached NaN argument is found again
+        return self.builder.icmp_unsigned("==", self._bits(a), self._bits(b))
+
+    def _bits(self, value: ir.Value) -> ir.Value:
+        # the bits of a float as an int of the same width, ints as they are
+        if isinstance(value.type, ir.DoubleType):
+            return self.builder.bitcast(value, ir.IntType(64))
+        if isinstance(value.type, ir.FloatType):
+            return self.builder.bitcast(value, ir.IntType(32))
+        return value
+
+    def _batch_function(self, function: ir.Function) -> ir.Function:
+        # void <name>.batch(i64 start, i64 stop, T0* x0, i64 step0, ..., R* out) computes out[i] = name(x0[i * step0],
+        # ...) for start <= i < stop, so a whole buffer costs a single call from Python. A step of 0 broadcasts a
+        # scalar, and bools are stored as bytes. Threads are given disjoint ranges of the same buffers
+        function_type = function.function_type
+        memory_types = [ir.IntType(8) if type == self.type_map["bool"] else type for type in [*function_type.args, function_type.return_type]]
+        argument_types = [ir.IntType(64), ir.IntType(64)]
+        for memory_type in memory_types[:-1]:
+            argument_types += [memory_type.as_pointer(), ir.IntType(64)]
+        argument_types.append(memory_types[-1].as_pointer())
+        batch = ir.Function(self.module, ir.FunctionType(ir.VoidType(), argument_types), name=f"{function.name}.batch")
+        start, stop, *inputs, output = batch.args
+
+        previous_builder = self.builder
+        self.builder = ir.IRBuilder(batch.append_basic_block(f"{function.name}.batch_entry"))
+        def body(index):
+            arguments = []
+            for (pointer, step), type in zip(zip(inputs[0::2], inputs[1::2]), function_type.args):
+                value = self.builder.load(self.builder.gep(pointer, [self.builder.mul(index, step)], inbounds=True))
+                arguments.append(self.builder.trunc(value, type) if type == self.type_map["bool"] else value)
+            result = self.builder.call(function, arguments)
+            if function_type.return_type == self.type_map["bool"]:
+                result = self.builder.zext(result, ir.IntType(8))
+            self.builder.store(result, self.builder.gep(output, [index], inbounds=True))
+        self._loop(start, stop, 1, body)
+        self.builder.ret_void()
         self.builder = previous_builder
+        return batch
 
     def _visit_block_statement(self, node: BlockStatement):
         for statement in node.statements:
+            # statements after a return are dead
+            if self.builder.block.is_terminated:
+                break
             self.compile(statement)
 
     def _visit_return_statement(self, node: ReturnStatement):
-        value, type = self._resolve_value(node.return_value)
+        if self._parallel_depth:
+            self.errors.append("A parallel for cannot return from its function.")
+            self.builder.ret_void()
+            return
+        if self._recursion is not None and self._visit_recursive_return(node.return_value):
+            return
+        value, type = self._returned(node.return_value)
 
+        # a call of another function in tail position reuses the stack frame, which is guaranteed if both functions
+        # have the same signature
+        call = node.return_value
+        if call.type() == NodeType.CallExpression and call.name.value not in (*self.builtins, *PURE_BUILTINS) and isinstance(value, ir.CallInstr):
+            value.tail = "musttail" if value.callee.type.pointee == self.builder.block.function.function_type else "tail"
         self.builder.ret(value)
+
+    def _returned(self, node: Expression) -> tuple[ir.Value, ir.Type]:
+        # the returned value converted to the return type of the function being compiled
+        return_type = self.builder.block.function.function_type.return_type
+        value, type = self._resolve_converted(node, return_type)
+        if type != return_type:
+            self.errors.append(f"Function {self.builder.block.function.name} of type {return_type} tried to return a value of type {type}.")
+        return value, type
     
     def _visit_assign_statement(self, node: AssignStatement):
         variable_name = node.identifier.value
-        value, type = self._resolve_value(node.expression)
-
-        if self.environment.lookup(variable_name) is None:
+        record = self._lookup(node.identifier)
+        if record is None:
+            self._resolve_value(node.expression)
             self.errors.append(f"Identifier {variable_name} was not declared before re-assignment.")
         else:
-            pointer, type2 = self.environment.lookup(variable_name)
+            pointer, type2 = record
+            value, type = self._resolve_converted(node.expression, type2)
             if type != type2:
                 self.errors.append(f"Identifier {variable_name} of type {type2} tried to be re-assigned to {type}.")
-            else:
+            elif self._is_pointer(pointer):
                 self.builder.store(value, pointer)
+            else:
+                self._assign(node.identifier, value)
     
     def _visit_if_statement(self, node: IfStatement):
         test, type = self._resolve_value(node.condition)
 
-        if node.alternative:
-            with self.builder.if_else(test) as (true, otherwise):
-                with true:
-                    self.compile(node.consequence)
-                with otherwise:
-                    self.compile(node.alternative)
-        else:
-            with self.builder.if_then(test):
-                self.compile(node.consequence)
+        current_function = self.builder.block.function
+        then_block = current_function.append_basic_block(name="then")
+        else_block = current_function.append_basic_block(name="else") if node.alternative else None
+        merge_block = current_function.append_basic_block(name="endif")
+        self.builder.cbranch(test, then_block, else_block or merge_block)
+
+        # every branch starts from the variable values before the if and the values are merged with phi nodes
+        before = self.environment.snapshot()
+        incoming = [] if node.alternative else [(self.builder.block, before)]
+        for block, branch in [(then_block, node.consequence), (else_block, node.alternative)]:
+            if block is None: continue
+            self.environment.restore(before)
+            self.builder.position_at_end(block)
+            self.compile(branch)
+            if not self.builder.block.is_terminated:
+                incoming.append((self.builder.block, self.environment.values))
+                self.builder.branch(merge_block)
+
+        self.builder.position_at_end(merge_block)
+        self._merge_records(incoming, before)
     
     def _visit_while_statement(self, node: WhileStatement):
         current_function = self.builder.block.function
@@ -206,47 +737,377 @@ class Compiler:
         after_block = current_function.append_basic_block(name="after")
 
         # condition branch
+        preheader_block = self.builder.block
         self.builder.branch(cond_block)
         self.builder.position_at_end(cond_block)
+
+        phis = self._loop_phis(node.body, preheader_block)
         test, _ = self._resolve_value(node.condition)
         self.builder.cbranch(test, body_block, after_block)
+        at_condition = self.environment.snapshot()
 
         # body branch
         self.builder.position_at_end(body_block)
         self.compile(node.body)
+        if not self.builder.block.is_terminated:
+            for slot, phi in phis.items():
+                phi.add_incoming(self.environment.resolve(0, slot)[0], self.builder.block)
+            self.builder.branch(cond_block)
+
+        # after loop, only the condition block branches here
+        self.builder.position_at_end(after_block)
+        self.environment.restore(at_condition)
+
+    def _loop_phis(self, body: BlockStatement, preheader_block: ir.Block) -> dict[int, ir.PhiInstr]:
+        # variables of the scope assigned in the body get a phi node, by slot, merging the value before the loop and
+        # after an iteration
+        phis: dict[int, ir.PhiInstr] = {}
+        for name in _assigned_names(body):
+            slot = self.environment.slots.get(name)
+            record = self.environment.resolve(0, slot) if slot is not None else None
+            if record is None or self._is_pointer(record[0]): continue
+            phi = self.builder.phi(record[1], name=name)
+            phi.add_incoming(record[0], preheader_block)
+            phis[slot] = phi
+            self.environment.set(slot, (phi, record[1]))
+        return phis
+
+    def _visit_for_statement(self, node: ForStatement):
+        # the bounds are evaluated once before the first iteration, and the loop variable only exists in the body
+        start, start_type = self._resolve_value(node.start)
+        stop, stop_type = self._resolve_value(node.stop)
+        if start_type != self.type_map["int"] or stop_type != self.type_map["int"]:
+            self.errors.append("The bounds of a for loop must be ints.")
+            return
+        if node.variable.value in _assigned_names(node.body):
+            self.errors.append(f"Loop variable {node.variable.value} cannot be assigned in the loop body.")
+            return
+        reductions = self._reductions(node)
+        if reductions is None:
+            return
+        # a reduce clause allows float reductions in the body to be reordered, which lets LLVM vectorize them
+        previous_flags = self._float_flags
+        if reductions and self.fast_reductions:
+            self._float_flags = self._reduction_flags
+        if node.schedule is None:
+            self._visit_sequential_for(node, start, stop)
+        else:
+            self._visit_parallel_for(node, start, stop, reductions)
+        self._float_flags = previous_flags
+
+    def _reductions(self, node: ForStatement) -> list[tuple[str, str, ir.Type]] | None:
+        # the (operation, name, type) of every variable in the reduce clause, None after an error
+        reductions = []
+        for operator, variable in node.reductions:
+            name = variable.value
+            record = self._lookup(variable)
+            if record is None:
+                self.errors.append(f"Reduction variable {name} is not defined.")
+                return None
+            if record[1] not in [self.type_map[type] for type in NUMERIC_TYPES]:
+                self.errors.append(f"Reduction variable {name} must be an int or a float.")
+                return None
+            if name == node.variable.value or any(name == other for _, other, _ in reductions):
+                self.errors.append(f"Variable {name} cannot be reduced more than once or be the loop variable.")
+                return None
+            reductions.append((REDUCTION_OPERATORS[operator], name, record[1]))
+        return reductions
+
+    def _visit_sequential_for(self, node: ForStatement, start: ir.Value, stop: ir.Value):
+        current_function = self.builder.block.function
+        cond_block = current_function.append_basic_block(name="for_cond")
+        body_block = current_function.append_basic_block(name="for_body")
+        after_block = current_function.append_basic_block(name="for_after")
+
+        preheader_block = self.builder.block
         self.builder.branch(cond_block)
+        self.builder.position_at_end(cond_block)
+        phis = self._loop_phis(node.body, preheader_block)
+        index = self.builder.phi(self.type_map["int"], name=node.variable.value)
+        index.add_incoming(start, preheader_block)
+        self.builder.cbranch(self.builder.icmp_signed("<", index, stop), body_block, after_block)
+        at_condition = self.environment.snapshot()
+
+        self.builder.position_at_end(body_block)
+        self._define(node.variable, index, self.type_map["int"])
+        self.compile(node.body)
+        if not self.builder.block.is_terminated:
+            for slot, phi in phis.items():
+                phi.add_incoming(self.environment.resolve(0, slot)[0], self.builder.block)
+            index.add_incoming(self.builder.add(index, ir.Constant(self.type_map["int"], 1), flags=["nsw"]), self.builder.block)
+            self.builder.branch(cond_block)
 
-        # after loop
         self.builder.position_at_end(after_block)
+        self.environment.restore(at_condition)
+
+    def _visit_parallel_for(self, node: ForStatement, start: ir.Value, stop: ir.Value, reductions: list[tuple[str, str, ir.Type]]):
+        # the body is outlined into the function <function>.parallel.<n>, which runs a range of iterations, and the
+        # runtime splits the whole range between the threads of its pool (see Runtime). Values the body uses from
+        # the enclosing function are captured through an array of pointers to stack copies of them
+        i64 = ir.IntType(64)
+        chunk = ir.Constant(i64, 0)
+        if node.chunk is not None:
+            chunk, chunk_type = self._resolve_value(node.chunk)
+            if chunk_type != self.type_map["int"]:
+                self.errors.append("The chunk size of a parallel for must be an int.")
+                return
+            chunk = self.builder.sext(chunk, i64)
+        start, stop = self.builder.sext(start, i64), self.builder.sext(stop, i64)
+
+        # with a reduce clause the runtime hands out blocks of iterations instead, and every block reduces its
+        # iterations into its own slot of an array of partial results per variable. The blocks only depend on the
+        # range and the chunk size, so combining the partial results in block order gives the same result for every
+        # number of threads and schedule
+        partials = []
+        if reductions:
+            count = self.builder.sub(stop, start)
+            count = self.builder.select(self.builder.icmp_signed(">", count, ir.Constant(i64, 0)), count, ir.Constant(i64, 0))
+            block = self._ceiling_division(count, ir.Constant(i64, REDUCTION_BLOCKS))
+            if node.chunk is not None:
+                block = self.builder.select(self.builder.icmp_signed(">", chunk, ir.Constant(i64, 0)), chunk, block)
+            block = self.builder.select(self.builder.icmp_signed(">", block, ir.Constant(i64, 0)), block, ir.Constant(i64, 1))
+            blocks = self._ceiling_division(count, block)
+            partials = [self._allocate(type, blocks) for _, _, type in reductions]
+            # every runtime chunk is one block, or a contiguous range of blocks per thread by default
+            chunk = ir.Constant(i64, 1 if node.chunk is not None else 0)
+
+        name = f"{self.builder.block.function.name}.parallel.{self._parallel_bodies}"
+        self._parallel_bodies += 1
+        body_function = ir.Function(self.module, Runtime.BODY, name=name)
+        body_function.linkage = "internal"
+        context, first, last = body_function.args
+        # stack slots of nested parallel loops go to entry, captured values are loaded in captures
+        entry_block = body_function.append_basic_block("entry")
+        capture_block = body_function.append_basic_block("captures")
+        loop_block = body_function.append_basic_block("loop")
+
+        previous_builder, previous_environment = self.builder, self.environment
+        captures = _CaptureEnvironment(previous_environment, context, ir.IRBuilder(capture_block), self.errors)
+        self.environment = Environment({}, captures, name=name, names=self._scopes.get(node, ()))
+        self.builder = ir.IRBuilder(loop_block)
+        self._parallel_depth += 1
+        def iteration(index, *accumulators):
+            # reduction variables are private accumulators that start from the identity of their operation
+            self.environment.restore([])
+            self._define(node.variable, self.builder.trunc(index, self.type_map["int"]), self.type_map["int"])
+            for (_, reduction_name, type), accumulator in zip(reductions, accumulators):
+                self.environment.define(reduction_name, accumulator, type)
+            self.compile(node.body)
+            if self.builder.block.is_terminated:
+                # after the error of a return in the body
+                self.builder.position_at_end(body_function.append_basic_block("unreachable"))
+                return accumulators
+            return [self.environment.lookup(reduction_name)[0] for _, reduction_name, _ in reductions]
+        if reductions:
+            block_start, block_size, block_stop = [captures.capture(value, i64) for value in (start, block, stop)]
+            partial_slots = [captures.capture(partial, partial.type) for partial in partials]
+            def run_block(block_index):
+                low = self.builder.add(block_start, self.builder.mul(block_index, block_size))
+                high = self._minimum(self.builder.add(low, block_size), block_stop)
+                results = self._loop(low, high, 1, iteration, [self._identity(operation, type) for operation, _, type in reductions])
+                for result, slot in zip(results, partial_slots):
+                    self.builder.store(result, self._element_pointer(slot, block_index))
+            self._loop(first, last, 1, run_block)
+        else:
+            self._loop(first, last, 1, iteration)
+        self.builder.ret_void()
+        ir.IRBuilder(entry_block).branch(capture_block)
+        captures.builder.branch(loop_block)
+        self._parallel_depth -= 1
+        self.builder, self.environment = previous_builder, previous_environment
+
+        slots = self._create_entry_alloca(ir.ArrayType(Runtime.VOID_POINTER, max(len(captures.captured), 1)), name=f"{name}.context")
+        for i, (value, type) in enumerate(captures.captured):
+            slot = self._create_entry_alloca(type)
+            self.builder.store(value, slot)
+            self.builder.store(self.builder.bitcast(slot, Runtime.VOID_POINTER), self.builder.gep(slots, [ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), i)], inbounds=True))
+        parallel_for = self._runtime_function(Runtime.PARALLEL_FOR, Runtime.PARALLEL_FOR_TYPE)
+        dynamic = ir.Constant(ir.IntType(8), 1 if node.schedule == "dynamic" else 0)
+        if reductions:
+            self.builder.call(parallel_for, [body_function, self.builder.bitcast(slots, Runtime.CONTEXT), ir.Constant(i64, 0), blocks, dynamic, chunk])
+        else:
+            self.builder.call(parallel_for, [body_function, self.builder.bitcast(slots, Runtime.CONTEXT), start, stop, dynamic, chunk])
+
+        free, _ = self.environment.lookup("free")
+        for (operation, _, type), partial, (_, variable) in zip(reductions, partials, node.reductions):
+            combined = self.builder.call(self._reduction_range_function(operation, type), [partial, partial, ir.Constant(i64, 0), blocks])
+            self.builder.call(free, [self.builder.bitcast(partial, ir.IntType(8).as_pointer())])
+            value, _ = self._load_variable(variable)
+            value = self._combine(operation, value, combined)
+            pointer, _ = self._lookup(variable)
+            if self._is_pointer(pointer):
+                self.builder.store(value, pointer)
+            else:
+                self._assign(variable, value)
+
+    def _merge_records(self, incoming: list[tuple[ir.Block, list]], before: list) -> None:
+        if not incoming:
+            # every branch returned, the code that follows is unreachable
+            self.environment.restore(before)
+            return
+
+        merged = []
+        names = list(self.environment.slots)
+        for slot, entries in enumerate(zip_longest(*(values for _, values in incoming))):
+            defined = [entry for entry in entries if entry is not None]
+            if not defined:
+                merged.append(None)
+                continue
+            value, type = defined[0]
+            if len(defined) == len(entries) and all(entry[0] is value for entry in defined) or self._is_pointer(value) or isinstance(value, ir.Function):
+                merged.append((value, type))
+                continue
+            phi = self.builder.phi(type, name=names[slot])
+            for (block, _), entry in zip(incoming, entries):
+                phi.add_incoming(entry[0] if entry is not None else ir.Constant(type, ir.Undefined), block)
+            merged.append((phi, type))
+        self.environment.restore(merged)
+
+    def _lookup(self, identifier: IdentifierLiteral) -> tuple[ir.Value, ir.Type] | None:
+        # names the Resolver left unbound are looked up in the scopes outside the program
+        if identifier.slot is None:
+            return self.environment.lookup(identifier.value)
+        return self.environment.resolve(identifier.depth, identifier.slot)
+
+    def _define(self, identifier: IdentifierLiteral, value: ir.Value, type: ir.Type) -> None:
+        self.environment.set(identifier.slot, (value, type))
+
+    def _assign(self, identifier: IdentifierLiteral, value: ir.Value) -> None:
+        if identifier.slot is None:
+            self.environment.assign(identifier.value, value)
+        else:
+            self.environment.assign_at(identifier.depth, identifier.slot, value)
+
+    def _load_variable(self, identifier: IdentifierLiteral) -> tuple[ir.Value, ir.Type]:
+        name = identifier.value
+        record = self._lookup(identifier)
+        if record is None:
+            self.errors.append(f"Identifier {name} is not defined.")
+            return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+        value, type = record
+        # the Resolver checked that the variable belongs to this function, or is kept in memory
+        if self._is_pointer(value):
+            return self.builder.load(value), type
+        return value, type
+
+    def _is_pointer(self, value: ir.Value) -> bool:
+        # variables kept in memory instead of registers
+        return isinstance(value, (ir.GlobalVariable, ir.AllocaInstr))
+
+    def _create_entry_alloca(self, type: ir.Type, name: str = "") -> ir.AllocaInstr:
+        # stack slots always live in the entry block, so loops do not grow the stack
+        entry_block = self.builder.block.function.entry_basic_block
+        builder = ir.IRBuilder(entry_block)
+        builder.position_at_start(entry_block)
+        alloca = builder.alloca(type, name=name)
+        # the insertion point of the current builder is an index into the block, which the alloca just shifted
+        if self.builder.block is entry_block:
+            self.builder.position_at_end(entry_block)
+        return alloca
+
+    def _has_predecessors(self, block: ir.Block) -> bool:
+        return any(block in other.terminator.operands for other in block.function.blocks if other.is_terminated)
 
-    
     def _visit_infix_expression(self, node: InfixExpression) -> tuple[ir.Value, ir.Type]:
-        operator = node.operator
+        if node.operator == "@":
+            return self._visit_matmul_expression(node)
+        if node.operator in ELEMENTWISE_OPERATORS and self._is_aggregate(self._expression_type(node)):
+            return self._visit_elementwise_expression(node)
         left_value, left_type = self._resolve_value(node.left_node)
         right_value, right_type = self._resolve_value(node.right_node)
+        if self._is_aggregate(left_type) or self._is_aggregate(right_type):
+            self.errors.append(f"Operator {node.operator} is not defined for {self._type_name(left_type)} and {self._type_name(right_type)}.")
+            return ir.Constant(left_type, ir.Undefined), left_type
+        # a literal is exact in the wider type of the other operand, so 0.1 next to an f64 is the f64 closest to 0.1
+        if self._converts_exactly(node.left_node, right_type):
+            left_value, left_type = ir.Constant(right_type, node.left_node.value), right_type
+        if self._converts_exactly(node.right_node, left_type):
+            right_value, right_type = ir.Constant(left_type, node.right_node.value), left_type
+        literal_exponent = node.right_node.type() in (NodeType.IntegerLiteral, NodeType.FloatLiteral)
+        return self._apply_operator(node.operator, left_value, left_type, right_value, right_type, literal_exponent)
 
+    def _promoted_type(self, left_type: ir.Type | None, right_type: ir.Type | None) -> ir.Type | None:
+        # the type both operands of an arithmetic operator are converted to: the wider of two ints or two floats,
+        # and for an int and a float the float, or f64 if the int is an i64. None unless both are ints or floats
+        numeric_types = [self.type_map[name] for name in NUMERIC_TYPES]
+        if left_type not in numeric_types or right_type not in numeric_types:
+            return None
+        if left_type == right_type:
+            return left_type
+        types = (left_type, right_type)
+        if all(isinstance(type, ir.IntType) for type in types):
+            return self.type_map["i64"]
+        if self.type_map["f64"] in types or self.type_map["i64"] in types:
+            return self.type_map["f64"]
+        return self.type_map["float"]
+
+    def _convert(self, value: ir.Value, type: ir.Type, target: ir.Type) -> ir.Value:
+        # a numeric value as another numeric type. Floats are truncated towards zero when converted to ints and
+        # saturate at the limits of the int type, with NaN giving 0, where a plain fptosi would be poison
+        if type == target:
+            return value
+        if isinstance(type, ir.IntType) and isinstance(target, ir.IntType):
+            return self.builder.sext(value, target) if target.width > type.width else self.builder.trunc(value, target)
+        if isinstance(type, ir.IntType):
+            return self.builder.sitofp(value, target)
+        if isinstance(target, ir.IntType):
+            saturating = self._declaration(f"llvm.fptosi.sat.{_type_suffix(target)}.{_type_suffix(type)}", target, [type])
+            return self.builder.call(saturating, [value])
+        return self.builder.fpext(value, target) if target == self.type_map["f64"] else self.builder.fptrunc(value, target)
+
+    def _converts_exactly(self, node: Expression, target: ir.Type | None) -> bool:
+        # whether a literal is converted to a type by giving it that type, because the type is wider than its own
+        if node.type() not in (NodeType.IntegerLiteral, NodeType.FloatLiteral):
+            return False
+        type = self._expression_type(node)
+        return type != target and self._promoted_type(type, target) == target
+
+    def _resolve_converted(self, node: Expression, target: ir.Type) -> tuple[ir.Value, ir.Type]:
+        # an expression converted to the target type if that is its promoted type. Literals are exact in the target
+        # type, so 5000000000 can be passed as an i64
+        if self._converts_exactly(node, target):
+            return ir.Constant(target, node.value), target
+        return self._implicit_conversion(*self._resolve_value(node), target)
+
+    def _implicit_conversion(self, value: ir.Value, type: ir.Type, target: ir.Type) -> tuple[ir.Value, ir.Type]:
+        # an int or float widened to the target type if that is its promoted type, other values are left unchanged
+        if type != target and self._promoted_type(type, target) == target:
+            return self._convert(value, type, target), target
+        return value, type
+
+    def _type_name(self, type: ir.Type) -> str | None:
+        return next((name for name, mapped in self.type_map.items() if mapped == type), None)
+
+    def _apply_operator(self, operator: str, left_value: ir.Value, left_type: ir.Type, right_value: ir.Value, right_type: ir.Type, literal_exponent: bool = False) -> tuple[ir.Value, ir.Type]:
+        # literal_exponent is whether the right operand is a literal of the program, see _float_power
         node_type = None
         node_value = None
-        if isinstance(left_type, ir.IntType) and isinstance(right_type, ir.IntType):
+        # the exponent of ^ before it is promoted, so that int exponents and the values of constant ones are known
+        exponent = right_value
+        promoted_type = self._promoted_type(left_type, right_type)
+        if promoted_type is not None and left_type != right_type:
+            left_value, left_type = self._convert(left_value, left_type, promoted_type), promoted_type
+            right_value, right_type = self._convert(right_value, right_type, promoted_type), promoted_type
+        if isinstance(left_type, ir.IntType) and left_type == right_type:
             match operator:
                 case "+":
                     node_value = self.builder.add(left_value, right_value)
-                    node_type = self.type_map["int"]
+                    node_type = left_type
                 case "-":
                     node_value = self.builder.sub(left_value, right_value)
-                    node_type = self.type_map["int"]
+                    node_type = left_type
                 case "*":
                     node_value = self.builder.mul(left_value, right_value)
-                    node_type = self.type_map["int"]
+                    node_type = left_type
                 case "/":
                     node_value = self.builder.sdiv(left_value, right_value)
-                    node_type = self.type_map["int"]
+                    node_type = left_type
                 case "%":
                     node_value = self.builder.srem(left_value, right_value)
-                    node_type = self.type_map["int"]
-                case "^":
-                    function, node_type = self.environment.lookup("int_exponentiation")
-                    node_value = self.builder.call(function, [left_value, right_value])
+                    node_type = left_type
+                case "^" if left_type != self.type_map["bool"]:
+                    node_value = self._integer_power(left_value, right_value, exponent)
+                    node_type = left_type
                 case "<":
                     node_value = self.builder.icmp_signed("<", left_value, right_value)
                     node_type = self.type_map["bool"]
@@ -265,47 +1126,185 @@ class Compiler:
                 case "!=":
                     node_value = self.builder.icmp_signed("!=", left_value, right_value)
                     node_type = self.type_map["bool"]
-        elif isinstance(left_type, ir.FloatType) and isinstance(right_type, ir.FloatType):
+        elif _is_float(left_type) and left_type == right_type:
             match operator:
                 case "+":
-                    node_value = self.builder.fadd(left_value, right_value)
-                    node_type = self.type_map["float"]
+                    node_value = self.builder.fadd(left_value, right_value, flags=self._float_flags)
+                    node_type = left_type
                 case "-":
-                    node_value = self.builder.fsub(left_value, right_value)
-                    node_type = self.type_map["float"]
+                    node_value = self.builder.fsub(left_value, right_value, flags=self._float_flags)
+                    node_type = left_type
                 case "*":
-                    node_value = self.builder.fmul(left_value, right_value)
-                    node_type = self.type_map["float"]
+                    node_value = self.builder.fmul(left_value, right_value, flags=self._float_flags)
+                    node_type = left_type
                 case "/":
-                    node_value = self.builder.fdiv(left_value, right_value)
-                    node_type = self.type_map["float"]
+                    node_value = self.builder.fdiv(left_value, right_value, flags=self._float_flags)
+                    node_type = left_type
                 case "%":
                     node_value = self.builder.frem(left_value, right_value)
-                    node_type = self.type_map["float"]
+                    node_type = left_type
                 case "^":
-                    function, node_type = self.environment.lookup("float_exponentiation")
-                    node_value = self.builder.call(function, [left_value, right_value])
+                    node_value = self._float_power(left_value, right_value, exponent, literal_exponent)
+                    node_type = left_type
                 case "<":
-                    node_value = self.builder.fcmp_ordered("<", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered("<", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
                 case "<=":
-                    node_value = self.builder.fcmp_ordered("<=", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered("<=", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
                 case ">":
-                    node_value = self.builder.fcmp_ordered(">", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered(">", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
                 case ">=":
-                    node_value = self.builder.fcmp_ordered(">=", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered(">=", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
                 case "==":
-                    node_value = self.builder.fcmp_ordered("==", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered("==", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
                 case "!=":
-                    node_value = self.builder.fcmp_ordered("!=", left_value, right_value)
+                    node_value = self.builder.fcmp_ordered("!=", left_value, right_value, flags=self._float_flags)
                     node_type = self.type_map["bool"]
         return node_value, node_type
+
+    def _integer_power(self, base: ir.Value, exponent: ir.Value, original: ir.Value) -> ir.Value:
+        # base ^ exponent wraps around like a product, and a negative exponent gives 0 unless the base is 1 or -1 (see
+        # Interpreter._int_power). Constant exponents are unrolled, others call calclite.pow.<type>
+        if isinstance(original, ir.Constant):
+            if original.constant >= 0:
+                return self._multiplied_power(base, original.constant)
+            return self._negative_power(base, ir.Constant(ir.IntType(1), original.constant & 1))
+        return self.builder.call(self._power_function(base.type, exponent.type), [base, exponent])
+
+    def _float_power(self, base: ir.Value, exponent: ir.Value, original: ir.Value, literal: bool) -> ir.Value:
+        # literal whole exponents up to MAX_UNROLLED_EXPONENT are unrolled, with a reciprocal for negative ones, and a
+        # literal 0.5 is a square root. Other int exponents call calclite.pow.<type>.i32, which multiplies the same
+        # way, and everything else llvm.pow. Only literals count as constant, so that the interpreter and the
+        # Optimizer pick the same way from the AST (see Interpreter.float_power)
+        type = base.type
+        if literal:
+            value = float(original.constant)
+            if value.is_integer() and abs(value) <= MAX_UNROLLED_EXPONENT:
+                power = self._multiplied_power(base, int(abs(value)))
+                return self.builder.fdiv(ir.Constant(type, 1.0), power, flags=self._float_flags) if value < 0 else power
+            if value == 0.5:
+                return self._square_root(base)
+        if original.type == self.type_map["int"]:
+            return self.builder.call(self._power_function(type, original.type), [base, original])
+        pow = self._declaration(f"llvm.pow.{_type_suffix(type)}", type, [type, type])
+        return self.builder.call(pow, [base, exponent], fastmath=self._float_flags)
+
+    def _power_function(self, type: ir.Type, exponent_type: ir.Type) -> ir.Function:
+        # calclite.pow.i32 and .i64 raise ints to the same type, calclite.pow.f32.i32 and .f64.i32 raise floats to an
+        # int like llvm.powi, whose library function the JIT does not link
+        name = f"calclite.pow.{_type_suffix(type)}" + (f".{_type_suffix(exponent_type)}" if _is_float(type) else "")
+        return self._kernel_function(name, ["base", "exponent"], [type, exponent_type], self._emit_power, type)
+
+    def _emit_power(self, base: ir.Value, exponent: ir.Value) -> ir.Value:
+        # square-and-multiply over the bits of the magnitude of the exponent, from the lowest up. A negative exponent
+        # takes the reciprocal of a float power, ints skip the loop
+        type, exponent_type = base.type, exponent.type
+        zero, one = ir.Constant(exponent_type, 0), ir.Constant(exponent_type, 1)
+        negative = self.builder.icmp_signed("<", exponent, zero)
+        # the magnitude is unsigned, so that of the smallest int is right too
+        magnitude = self.builder.select(negative, self.builder.sub(zero, exponent) if _is_float(type) else zero, exponent)
+        entry_block = self.builder.block
+        loop_block = entry_block.function.append_basic_block(name="power_loop")
+        after_block = entry_block.function.append_basic_block(name="power_after")
+        self.builder.cbranch(self.builder.icmp_unsigned("!=", magnitude, zero), loop_block, after_block)
+
+        self.builder.position_at_end(loop_block)
+        result, square, remaining = self.builder.phi(type), self.builder.phi(type), self.builder.phi(exponent_type)
+        next_result = self.builder.select(self.builder.trunc(remaining, ir.IntType(1)), self._product(result, square), result)
+        next_square = self._product(square, square)
+        next_remaining = self.builder.lshr(remaining, one)
+        for phi, start, next in ((result, ir.Constant(type, 1), next_result), (square, base, next_square), (remaining, magnitude, next_remaining)):
+            phi.add_incoming(start, entry_block)
+            phi.add_incoming(next, loop_block)
+        self.builder.cbranch(self.builder.icmp_unsigned("!=", next_remaining, zero), loop_block, after_block)
+
+        self.builder.position_at_end(after_block)
+        power = self.builder.phi(type)
+        power.add_incoming(ir.Constant(type, 1), entry_block)
+        power.add_incoming(next_result, loop_block)
+        if _is_float(type):
+            reciprocal = self.builder.fdiv(ir.Constant(type, 1.0), power, flags=self._float_flags)
+        else:
+            reciprocal = self._negative_power(base, self.builder.trunc(exponent, ir.IntType(1)))
+        return self.builder.select(negative, reciprocal, power)
+
+    def _negative_power(self, base: ir.Value, odd: ir.Value) -> ir.Value:
+        # 1 ^ n is 1 and -1 ^ n is -1 for odd n, any other base gives 0. base + 1 <= 2 unsigned picks -1, 0 and 1
+        type = base.type
+        unit = self.builder.icmp_unsigned("<=", self.builder.add(base, ir.Constant(type, 1)), ir.Constant(type, 2))
+        return self.builder.select(unit, self.builder.select(odd, base, self.builder.mul(base, base)), ir.Constant(type, 0))
+
+    def _multiplied_power(self, base: ir.Value, exponent: int) -> ir.Value:
+        # base ^ exponent for a constant exponent >= 0 as a chain of log2(exponent) squarings and the products of the
+        # squares of its set bits
+        result, square = None, base
+        while exponent:
+            if exponent & 1:
+                result = square if result is None else self._product(result, square)
+            exponent >>= 1
+            if exponent:
+                square = self._product(square, square)
+        return result if result is not None else ir.Constant(base.type, 1)
+
+    def _product(self, left: ir.Value, right: ir.Value) -> ir.Value:
+        if _is_float(left.type):
+            return self.builder.fmul(left, right, flags=self._float_flags)
+        return self.builder.mul(left, right)
+
+    def _square_root(self, value: ir.Value) -> ir.Value:
+        # x ^ 0.5 is sqrt(x), except that it is +0 for -0 and +inf for -inf unless fast-math allows nsz and ninf
+        type = value.type
+        suffix = _type_suffix(type)
+        root = self.builder.call(self._declaration(f"llvm.sqrt.{suffix}", type, [type]), [value], fastmath=self._float_flags)
+        if "nsz" not in self._float_flags:
+            root = self.builder.call(self._declaration(f"llvm.fabs.{suffix}", type, [type]), [root])
+        if "ninf" not in self._float_flags:
+            negative_infinity = self.builder.fcmp_ordered("==", value, ir.Constant(type, -math.inf))
+            root = self.builder.select(negative_infinity, ir.Constant(type, math.inf), root)
+        return root
+
+    def _math_type(self, name: str, types: list[ir.Type | None]) -> ir.Type | None:
+        type = math_type(name, [self._type_name(type) for type in types])
+        return self.type_map[type] if type is not None else None
+
+    def _elementwise_type(self, left_type: ir.Type | None, right_type: ir.Type | None) -> ir.Type | None:
+        type = elementwise_type(self._type_name(left_type), self._type_name(right_type))
+        return self.type_map[type] if type is not None else None
+
+    def _math_function(self, name: str, arguments: list[tuple[ir.Value, ir.Type]]) -> tuple[ir.Value, ir.Type]:
+        # a math function of ints and floats (see Interpreter.math_type), whose arguments are converted to the type of
+        # the result. Intrinsics are vectorized with the loop around them, libm functions are declared readnone so
+        # that LLVM can hoist them too
+        type = self._math_type(name, [type for _, type in arguments])
+        if type is None or self._is_aggregate(type):
+            self.errors.append(f"{name} is not defined for {', '.join(self._type_name(type) or str(type) for _, type in arguments)}.")
+            return ir.Constant(self.type_map["float"], ir.Undefined), self.type_map["float"]
+        values = [self._convert(value, argument_type, type) if argument_type != type else value for value, argument_type in arguments]
+        if not _is_float(type):
+            # abs of an int, which wraps around for the smallest one
+            value = values[0]
+            return self.builder.select(self.builder.icmp_signed("<", value, ir.Constant(type, 0)), self.builder.neg(value), value), type
+        if name in INTRINSIC_MATH_FUNCTIONS:
+            function = self._declaration(f"llvm.{MATH_FUNCTIONS[name]}.{_type_suffix(type)}", type, [type] * len(values))
+        else:
+            function = self._declaration(MATH_FUNCTIONS[name] + ("f" if type == self.type_map["float"] else ""), type, [type] * len(values))
+            function.attributes.add("readnone")
+            function.attributes.add("nounwind")
+        return self.builder.call(function, values, fastmath=self._float_flags), type
+
+    def _declaration(self, name: str, return_type: ir.Type, argument_types: list[ir.Type]) -> ir.Function:
+        # LLVM intrinsics and libm functions are declared when first called
+        if name in self.module.globals:
+            return self.module.globals[name]
+        return ir.Function(self.module, ir.FunctionType(return_type, argument_types), name=name)
     
     def _visit_call_expression(self, node: CallExpression) -> tuple[ir.Value, ir.Type]:
+        if node.name.value in MATH_FUNCTIONS and self._is_aggregate(self._expression_type(node)):
+            return self._visit_elementwise_expression(node)
         arguments: list[ir.Value] = []
         types: list[ir.Type] = []
         for expression in node.parameters:
@@ -315,19 +1314,1026 @@ class Compiler:
 
         match node.name.value:
             case "print":
-                function, return_type = self.environment.lookup("print")
+                return_value, return_type = ir.Constant(self.type_map["int"], 0), ir.VoidType()
                 for value, type in zip(arguments, types):
-                    if type == self.type_map["int"]:
-                        str_format = "%d\n"
-                        format_str_var, _ = self.environment.lookup("int_string_format")
-                    elif type == self.type_map["float"]:
-                        # convert to double to pass to printf
-                        value = self.builder.fpext(value, ir.DoubleType())
-                        format_str_var, _ = self.environment.lookup("float_string_format")
-                    fmt_ptr = self.builder.bitcast(format_str_var, ir.IntType(8).as_pointer())
-                    return_value = self.builder.call(function, [fmt_ptr, value])
+                    if type in (self.type_map["int"], self.type_map["i64"]):
+                        self.builder.call(self._runtime_function(Runtime.PRINT_INT, Runtime.PRINT_INT_TYPE), [self._convert(value, type, self.type_map["i64"])])
+                    elif type in (self.type_map["float"], self.type_map["f64"]):
+                        self.builder.call(self._runtime_function(Runtime.PRINT_FLOAT, Runtime.PRINT_FLOAT_TYPE), [self._convert(value, type, self.type_map["f64"])])
+                    elif type == self.type_map["int[]"]:
+                        self.builder.call(self._runtime_function(Runtime.PRINT_INTS, Runtime.PRINT_INTS_TYPE), [self._array_data(value), self._array_length(value)])
+                    elif type == self.type_map["float[]"]:
+                        self.builder.call(self._runtime_function(Runtime.PRINT_FLOATS, Runtime.PRINT_FLOATS_TYPE), [self._array_data(value), self._array_length(value)])
+                    elif self._is_matrix(type):
+                        rows, columns, data = [self.builder.extract_value(value, i) for i in range(3)]
+                        self.builder.call(self._runtime_function(Runtime.PRINT_MATRIX, Runtime.PRINT_MATRIX_TYPE), [data, rows, columns])
+                    else:
+                        self.errors.append(f"print does not support values of type {type}.")
+            case "fill":
+                if len(types) == 3:
+                    return self._visit_fill_matrix(arguments, types)
+                return self._visit_fill(arguments, types)
+            case "reshape":
+                return self._visit_reshape(arguments, types)
+            case "transpose":
+                return self._visit_transpose(arguments, types)
+            case "rows" | "cols":
+                if len(types) != 1 or not self._is_matrix(types[0]):
+                    self.errors.append(f"{node.name.value} expects one matrix.")
+                    return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+                value = self.builder.extract_value(arguments[0], 0 if node.name.value == "rows" else 1)
+                return self.builder.trunc(value, self.type_map["int"]), self.type_map["int"]
+            case "sum" | "prod" | "min" | "max" | "dot":
+                return self._visit_reduction(node.name.value, arguments, types)
+            case "int" | "i64" | "float" | "f64":
+                target = self.type_map[node.name.value]
+                if len(types) != 1 or self._promoted_type(types[0], types[0]) is None:
+                    self.errors.append(f"{node.name.value} converts one int or float.")
+                    return ir.Constant(target, ir.Undefined), target
+                return self._convert(arguments[0], types[0], target), target
+            case "len":
+                if len(types) != 1 or self._element_type(types[0]) is None:
+                    self.errors.append("len expects one array.")
+                    return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+                return self.builder.trunc(self._array_length(arguments[0]), self.type_map["int"]), self.type_map["int"]
+            case name if name in MATH_FUNCTIONS:
+                return self._math_function(name, list(zip(arguments, types)))
 
             case _:
-                function, return_type = self.environment.lookup(node.name.value)
+                record = self._lookup(node.name)
+                if record is None:
+                    self.errors.append(f"Function {node.name.value} is not defined.")
+                    return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+                function, return_type = record
+                constant = self._evaluate_at_compile_time(node)
+                if constant is not None:
+                    return constant, return_type
+                if isinstance(function, ir.GlobalVariable):
+                    function = self.builder.load(function)
+                # arguments are converted to the parameter types, literals are exact in them
+                parameter_types = function.type.pointee.args
+                for i, (expression, parameter_type) in enumerate(zip(node.parameters, parameter_types)):
+                    if self._converts_exactly(expression, parameter_type):
+                        arguments[i] = ir.Constant(parameter_type, expression.value)
+                    else:
+                        arguments[i], _ = self._implicit_conversion(arguments[i], types[i], parameter_type)
                 return_value = self.builder.call(function, arguments)
         return return_value, return_type
+
+
+    def _evaluate_at_compile_time(self, node: CallExpression) -> ir.Constant | None:
+        # the result of a call of a pure function with literal arguments of the parameter types, computed by the
+        # interpreter, or None if the call has to run at runtime
+        callee = self._function_nodes.get(node.name.value)
+        if self.compile_time_steps <= 0 or callee is None or callee.return_type not in (*NUMERIC_TYPES, "bool"):
+            return None
+        # the parameter types each kind of literal can be passed as
+        literal_types = {NodeType.IntegerLiteral: NUMERIC_TYPES, NodeType.FloatLiteral: ("float", "f64"), NodeType.BooleanLiteral: ("bool",)}
+        if len(node.parameters) != len(callee.parameters) or any(parameter.value_type not in literal_types.get(argument.type(), ()) for argument, parameter in zip(node.parameters, callee.parameters)):
+            return None
+        key = (callee.name.value, *[argument.value for argument in node.parameters])
+        if key in self._compile_time_results:
+            return self._compile_time_results[key]
+        self._compile_time_results[key] = None
+        if self._impurity(callee) is not None or not self._exact_at_compile_time(callee):
+            return None
+
+        interpreter = Interpreter(jit=False, step_budget=self.compile_time_steps, pure=True)
+        try:
+            interpreter.run(Program(list(self._function_nodes.values())))
+            value = interpreter.evaluate(node)
+        except (InterpreterError, RecursionError, ArithmeticError, IndexError, TypeError, ValueError):
+            value = None
+        finally:
+            self.compile_time_steps = max(self.compile_time_steps - interpreter.steps, 0)
+        if value is None:
+            return None
+        self._compile_time_results[key] = ir.Constant(self.type_map[callee.return_type], value)
+        return self._compile_time_results[key]
+
+    def _exact_at_compile_time(self, node: FunctionStatement) -> bool:
+        # whether the function and the functions it calls avoid the operations the interpreter rounds differently
+        pending, seen = [node.body], {node.name.value}
+        while pending:
+            current = pending.pop()
+            if current is None: continue
+            match current.type():
+                case NodeType.InfixExpression:
+                    if current.operator in ("^", "@"):
+                        return False
+                    pending.extend([current.left_node, current.right_node])
+                case NodeType.CallExpression:
+                    name = current.name.value
+                    if name in INEXACT_BUILTINS:
+                        return False
+                    if name not in seen and name in self._function_nodes:
+                        seen.add(name)
+                        pending.append(self._function_nodes[name].body)
+                    pending.extend(current.parameters)
+                case NodeType.BlockStatement:
+                    pending.extend(current.statements)
+                case NodeType.ExpressionStatement:
+                    pending.append(current.expression)
+                case NodeType.VarStatement:
+                    pending.append(current.value)
+                case NodeType.AssignStatement:
+                    pending.append(current.expression)
+                case NodeType.ReturnStatement:
+                    pending.append(current.return_value)
+                case NodeType.IfStatement:
+                    pending.extend([current.condition, current.consequence, current.alternative])
+                case NodeType.WhileStatement:
+                    pending.extend([current.condition, current.body])
+                case NodeType.ForStatement:
+                    pending.extend([current.start, current.stop, current.chunk, current.body])
+                case NodeType.IndexAssignStatement:
+                    pending.extend([current.array, current.index, current.expression])
+                case NodeType.IndexExpression:
+                    pending.extend([current.array, current.index])
+                case NodeType.ArrayLiteral:
+                    pending.extend(current.elements)
+        return True
+
+
+    # arrays
+    def _element_type(self, type: ir.Type | None) -> ir.Type | None:
+        # element type of an array type, None for every other type
+        if isinstance(type, ir.LiteralStructType) and len(type.elements) == 2 and isinstance(type.elements[1], ir.PointerType) and type == array_type(type.elements[1].pointee):
+            return type.elements[1].pointee
+        return None
+
+    def _is_matrix(self, type: ir.Type | None) -> bool:
+        return type == self.type_map["matrix"]
+
+    def _is_aggregate(self, type: ir.Type | None) -> bool:
+        # arrays and matrices, the operands of elementwise operations
+        return self._element_type(type) is not None or self._is_matrix(type)
+
+    def _expression_type(self, node: Expression) -> ir.Type | None:
+        # the type of an expression without generating code for it, None if it cannot be known up front
+        match node.type():
+            case NodeType.IntegerLiteral:
+                return self.type_map["int"]
+            case NodeType.FloatLiteral:
+                return self.type_map["float"]
+            case NodeType.BooleanLiteral:
+                return self.type_map["bool"]
+            case NodeType.IdentifierLiteral:
+                record = self._lookup(node)
+                return record[1] if record is not None else None
+            case NodeType.ArrayLiteral:
+                element_type = self._expression_type(node.elements[0]) if node.elements else None
+                return array_type(element_type) if element_type is not None else None
+            case NodeType.IndexExpression:
+                array_type_ = self._expression_type(node.array)
+                if self._is_matrix(array_type_):
+                    return self.type_map["float[]"]
+                return self._element_type(array_type_)
+            case NodeType.CallExpression:
+                match node.name.value:
+                    case "fill":
+                        if len(node.parameters) == 3:
+                            return self.type_map["matrix"]
+                        element_type = self._expression_type(node.parameters[1]) if len(node.parameters) == 2 else None
+                        return array_type(element_type) if element_type is not None else None
+                    case "reshape" | "transpose":
+                        return self.type_map["matrix"]
+                    case "len" | "rows" | "cols":
+                        return self.type_map["int"]
+                    case "int" | "i64" | "float" | "f64":
+                        return self.type_map[node.name.value]
+                    case name if name in MATH_FUNCTIONS:
+                        return self._math_type(name, [self._expression_type(parameter) for parameter in node.parameters])
+                    case "sum" | "prod" | "min" | "max" | "dot":
+                        argument_type = self._expression_type(node.parameters[0]) if node.parameters else None
+                        if len(node.parameters) == 2 and node.name.value in ("min", "max") and self._promoted_type(argument_type, self._expression_type(node.parameters[1])) is not None:
+                            return self._promoted_type(argument_type, self._expression_type(node.parameters[1]))
+                        if self._is_matrix(argument_type):
+                            return self.type_map["float"]
+                        return self._element_type(argument_type) or argument_type
+                    case "print":
+                        return None
+                record = self._lookup(node.name)
+                return record[1] if record is not None else None
+            case NodeType.InfixExpression:
+                if node.operator in COMPARISON_OPERATORS:
+                    return self.type_map["bool"]
+                left_type = self._expression_type(node.left_node)
+                right_type = self._expression_type(node.right_node)
+                if node.operator == "@":
+                    return right_type if self._is_matrix(left_type) else None
+                if self._is_aggregate(left_type) or self._is_aggregate(right_type):
+                    return self._elementwise_type(left_type, right_type)
+                return self._promoted_type(left_type, right_type) or left_type
+        return None
+
+    def _array_length(self, array: ir.Value) -> ir.Value:
+        return self.builder.extract_value(array, 0)
+
+    def _array_data(self, array: ir.Value) -> ir.Value:
+        return self.builder.extract_value(array, 1)
+
+    def _element_pointer(self, data: ir.Value, index: ir.Value) -> ir.Value:
+        if index.type != ir.IntType(64):
+            index = self.builder.sext(index, ir.IntType(64))
+        return self.builder.gep(data, [index], inbounds=True)
+
+    def _allocate(self, element_type: ir.Type, count: ir.Value, zeroed: bool = False) -> ir.Value:
+        # the size of an element is the address of the second element of a null pointer, which LLVM folds
+        element_size = ir.Constant(element_type.as_pointer(), None).gep([ir.Constant(ir.IntType(64), 1)]).ptrtoint(ir.IntType(64))
+        size = self.builder.mul(count, element_size)
+        malloc, _ = self.environment.lookup("malloc")
+        memory = self.builder.call(malloc, [size])
+        if zeroed:
+            memset, _ = self.environment.lookup("memset")
+            self.builder.call(memset, [memory, ir.Constant(ir.IntType(8), 0), size, ir.Constant(ir.IntType(1), 0)])
+        return self.builder.bitcast(memory, element_type.as_pointer())
+
+    def _allocate_array(self, element_type: ir.Type, length: ir.Value) -> ir.Value:
+        return self._array_value(element_type, length, self._allocate(element_type, length))
+
+    def _array_value(self, element_type: ir.Type, length: ir.Value, data: ir.Value) -> ir.Value:
+        array = ir.Constant(array_type(element_type), ir.Undefined)
+        array = self.builder.insert_value(array, length, 0)
+        return self.builder.insert_value(array, data, 1)
+
+    def _loop(self, start: ir.Value, stop: ir.Value, step: int, body, initial: list[ir.Value] = ()) -> list[ir.Value]:
+        # emits for (index = start; index < stop; index += step) with an i64 induction variable. Values can be carried
+        # between iterations: body(index, *values) returns the values for the next iteration, and the values after
+        # the last iteration are returned
+        current_function = self.builder.block.function
+        preheader_block = self.builder.block
+        cond_block = current_function.append_basic_block(name="loop_cond")
+        body_block = current_function.append_basic_block(name="loop_body")
+        after_block = current_function.append_basic_block(name="loop_after")
+        self.builder.branch(cond_block)
+
+        self.builder.position_at_end(cond_block)
+        index = self.builder.phi(ir.IntType(64), name="index")
+        index.add_incoming(start, preheader_block)
+        values = []
+        for value in initial:
+            phi = self.builder.phi(value.type)
+            phi.add_incoming(value, preheader_block)
+            values.append(phi)
+        self.builder.cbranch(self.builder.icmp_signed("<", index, stop), body_block, after_block)
+
+        self.builder.position_at_end(body_block)
+        next_values = body(index, *values)
+        for phi, value in zip(values, next_values if values else []):
+            phi.add_incoming(value, self.builder.block)
+        index.add_incoming(self.builder.add(index, ir.Constant(ir.IntType(64), step), flags=["nsw"]), self.builder.block)
+        self.builder.branch(cond_block)
+        self.builder.position_at_end(after_block)
+        return values
+
+    def _counted_loop(self, count: ir.Value, body) -> None:
+        # for (index = 0; index < count; index++) body(index) without other loop carried values, which is the shape
+        # the loop vectorizer turns into SIMD code
+        self._loop(ir.Constant(ir.IntType(64), 0), count, 1, body)
+
+    def _runtime_check(self, condition: ir.Value, message: str) -> None:
+        # prints the message and exits the program if the condition is false
+        current_function = self.builder.block.function
+        failed_block = current_function.append_basic_block(name="check_failed")
+        passed_block = current_function.append_basic_block(name="check_passed")
+        self.builder.cbranch(condition, passed_block, failed_block)
+
+        self.builder.position_at_end(failed_block)
+        text = bytearray(f"{message}\n\0".encode("utf-8"))
+        message_var = ir.GlobalVariable(self.module, ir.ArrayType(ir.IntType(8), len(text)), name=self.module.get_unique_name("message"))
+        message_var.initializer = ir.Constant(ir.ArrayType(ir.IntType(8), len(text)), text)
+        message_var.global_constant = True
+        message_var.linkage = "internal"
+        fail = self._runtime_function(Runtime.FAIL, Runtime.FAIL_TYPE)
+        self.builder.call(fail, [self.builder.bitcast(message_var, Runtime.VOID_POINTER)])
+        self.builder.unreachable()
+        self.builder.position_at_end(passed_block)
+
+    def _runtime_function(self, name: str, type: ir.FunctionType) -> ir.Function:
+        # a function of the native runtime, declared in the module on first use
+        return self.module.globals.get(name) or ir.Function(self.module, type, name=name)
+
+    def _visit_array_literal(self, node: ArrayLiteral, value_type: str = None) -> tuple[ir.Value, ir.Type]:
+        element_type_name = value_type[:-2] if value_type is not None and value_type.endswith("[]") else None
+        elements = [self._resolve_value(element, element_type_name) for element in node.elements]
+        if elements:
+            element_type = elements[0][1]
+        elif element_type_name is not None:
+            element_type = self.type_map[element_type_name]
+        else:
+            self.errors.append("The type of an empty array literal must be declared.")
+            return ir.Constant(self.type_map["int[]"], ir.Undefined), self.type_map["int[]"]
+        if any(type != element_type for _, type in elements):
+            self.errors.append(f"Array literal elements must all be of type {element_type}.")
+
+        array = self._allocate_array(element_type, ir.Constant(ir.IntType(64), len(elements)))
+        data = self._array_data(array)
+        for i, (value, _) in enumerate(elements):
+            self.builder.store(value, self._element_pointer(data, ir.Constant(ir.IntType(64), i)))
+        return array, array_type(element_type)
+
+    def _visit_fill(self, arguments: list[ir.Value], types: list[ir.Type]) -> tuple[ir.Value, ir.Type]:
+        # fill(length, value) creates an array of length copies of value
+        if len(types) != 2 or types[0] != self.type_map["int"] or self._element_type(types[1]) is not None:
+            self.errors.append("fill expects a length and a value.")
+            return ir.Constant(self.type_map["int[]"], ir.Undefined), self.type_map["int[]"]
+        length, value = self.builder.sext(arguments[0], ir.IntType(64)), arguments[1]
+        array = self._allocate_array(types[1], length)
+        data = self._array_data(array)
+        self._counted_loop(length, lambda index: self.builder.store(value, self._element_pointer(data, index)))
+        return array, array_type(types[1])
+
+    def _visit_index_expression(self, node: IndexExpression) -> tuple[ir.Value, ir.Type]:
+        array, type = self._resolve_value(node.array)
+        index, index_type = self._resolve_value(node.index)
+        if self._is_matrix(type) and index_type == self.type_map["int"]:
+            return self._matrix_row(array, index), self.type_map["float[]"]
+        element_type = self._element_type(type)
+        if element_type is None or index_type != self.type_map["int"]:
+            self.errors.append(f"Only arrays can be indexed, and only with an int.")
+            return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+        return self.builder.load(self._element_pointer(self._array_data(array), index)), element_type
+
+    def _visit_index_assign_statement(self, node: IndexAssignStatement):
+        array, type = self._resolve_value(node.array)
+        index, index_type = self._resolve_value(node.index)
+        value, value_type = self._resolve_value(node.expression)
+        element_type = self._element_type(type)
+        if self._is_matrix(type):
+            self.errors.append("Matrix rows cannot be assigned, assign their elements instead.")
+        elif element_type is None or index_type != self.type_map["int"]:
+            self.errors.append(f"Only arrays can be indexed, and only with an int.")
+        else:
+            value, value_type = self._implicit_conversion(value, value_type, element_type)
+            if value_type != element_type:
+                self.errors.append(f"Element of type {element_type} tried to be assigned a value of type {value_type}.")
+                return
+            self.builder.store(value, self._element_pointer(self._array_data(array), index))
+
+    def _visit_elementwise_expression(self, node: InfixExpression | CallExpression) -> tuple[ir.Value, ir.Type]:
+        # a whole tree of elementwise operations and math functions is fused into a single loop without temporary
+        # arrays. The operands that are not elementwise themselves are evaluated once before the loop, scalars are
+        # broadcast
+        leaves: list[tuple[ir.Value, ir.Type]] = []
+        literals: list[bool] = []
+        def collect(expression: Expression):
+            if expression.type() == NodeType.InfixExpression and expression.operator in ELEMENTWISE_OPERATORS and self._is_aggregate(self._expression_type(expression)):
+                return (expression.operator, collect(expression.left_node), collect(expression.right_node))
+            if expression.type() == NodeType.CallExpression and expression.name.value in MATH_FUNCTIONS and self._is_aggregate(self._expression_type(expression)):
+                return (expression.name.value, *[collect(parameter) for parameter in expression.parameters])
+            leaves.append(self._resolve_value(expression))
+            literals.append(expression.type() in (NodeType.IntegerLiteral, NodeType.FloatLiteral))
+            return len(leaves) - 1
+        tree = collect(node)
+
+        # array and matrix operands are replaced by their data pointer and element type, matrices are treated as
+        # arrays of all their elements
+        operands: list[tuple[ir.Value, ir.Type, bool]] = []
+        lengths: list[ir.Value] = []
+        shapes: list[tuple[ir.Value, ir.Value]] = []
+        for value, type in leaves:
+            if self._is_matrix(type):
+                rows, columns, data = [self.builder.extract_value(value, i) for i in range(3)]
+                operands.append((data, self.type_map["float"], True))
+                shapes.append((rows, columns))
+            elif self._element_type(type) is not None:
+                operands.append((self._array_data(value), self._element_type(type), True))
+                lengths.append(self._array_length(value))
+            else:
+                operands.append((value, type, False))
+        if shapes and lengths:
+            self.errors.append("Arrays and matrices cannot be combined elementwise.")
+            return ir.Constant(self.type_map["matrix"], ir.Undefined), self.type_map["matrix"]
+        for rows, columns in shapes[1:]:
+            self._runtime_check(self.builder.and_(self.builder.icmp_signed("==", rows, shapes[0][0]), self.builder.icmp_signed("==", columns, shapes[0][1])), "Matrix shapes do not match.")
+        if shapes:
+            lengths = [self.builder.mul(shapes[0][0], shapes[0][1])]
+        length = lengths[0]
+        for other_length in lengths[1:]:
+            self._runtime_check(self.builder.icmp_signed("==", length, other_length), "Array lengths do not match.")
+
+        result_type = self._expression_type(node)
+        element_type = self.type_map["float"] if shapes else self._element_type(result_type)
+        result_data = self._allocate(element_type, length)
+        if shapes:
+            result = self._matrix_value(shapes[0][0], shapes[0][1], result_data)
+        else:
+            result = self._array_value(element_type, length, result_data)
+
+        def element(tree, index: ir.Value) -> tuple[ir.Value, ir.Type]:
+            if isinstance(tree, int):
+                value, type, is_array = operands[tree]
+                if is_array:
+                    return self.builder.load(self._element_pointer(value, index)), type
+                return value, type
+            operator, *subtrees = tree
+            if operator in MATH_FUNCTIONS:
+                return self._math_function(operator, [element(operand, index) for operand in subtrees])
+            left_value, left_type = element(subtrees[0], index)
+            right_value, right_type = element(subtrees[1], index)
+            literal_exponent = isinstance(subtrees[1], int) and literals[subtrees[1]]
+            return self._apply_operator(operator, left_value, left_type, right_value, right_type, literal_exponent)
+
+        def body(index: ir.Value) -> None:
+            value, type = element(tree, index)
+            if type != element_type:
+                name = f"Operator {node.operator}" if node.type() == NodeType.InfixExpression else f"Function {node.name.value}"
+                self.errors.append(f"{name} is not defined for the operand types of this array expression.")
+                return
+            self.builder.store(value, self._element_pointer(result_data, index))
+
+        self._counted_loop(length, body)
+        return result, result_type
+
+
+    # matrices
+    def _matrix_value(self, rows: ir.Value, columns: ir.Value, data: ir.Value) -> ir.Value:
+        matrix = ir.Constant(self.type_map["matrix"], ir.Undefined)
+        matrix = self.builder.insert_value(matrix, rows, 0)
+        matrix = self.builder.insert_value(matrix, columns, 1)
+        return self.builder.insert_value(matrix, data, 2)
+
+    def _matrix_row(self, matrix: ir.Value, index: ir.Value) -> ir.Value:
+        # a row is a float[] sharing the elements of the matrix
+        columns, data = self.builder.extract_value(matrix, 1), self.builder.extract_value(matrix, 2)
+        row_start = self.builder.mul(self.builder.sext(index, ir.IntType(64)), columns)
+        return self._array_value(self.type_map["float"], columns, self._element_pointer(data, row_start))
+
+    def _visit_fill_matrix(self, arguments: list[ir.Value], types: list[ir.Type]) -> tuple[ir.Value, ir.Type]:
+        # fill(rows, columns, value) creates a rows x columns matrix of copies of value
+        if types != [self.type_map["int"], self.type_map["int"], self.type_map["float"]]:
+            self.errors.append("fill expects the rows, columns and float value of a matrix.")
+            return ir.Constant(self.type_map["matrix"], ir.Undefined), self.type_map["matrix"]
+        rows, columns = self.builder.sext(arguments[0], ir.IntType(64)), self.builder.sext(arguments[1], ir.IntType(64))
+        count = self.builder.mul(rows, columns)
+        data = self._allocate(self.type_map["float"], count)
+        self._counted_loop(count, lambda index: self.builder.store(arguments[2], self._element_pointer(data, index)))
+        return self._matrix_value(rows, columns, data), self.type_map["matrix"]
+
+    def _visit_reshape(self, arguments: list[ir.Value], types: list[ir.Type]) -> tuple[ir.Value, ir.Type]:
+        # reshape(array, rows, columns) views the elements of a float[] as a matrix without copying them
+        if types != [self.type_map["float[]"], self.type_map["int"], self.type_map["int"]]:
+            self.errors.append("reshape expects a float[] and the rows and columns of the matrix.")
+            return ir.Constant(self.type_map["matrix"], ir.Undefined), self.type_map["matrix"]
+        rows, columns = self.builder.sext(arguments[1], ir.IntType(64)), self.builder.sext(arguments[2], ir.IntType(64))
+        self._runtime_check(self.builder.icmp_signed("==", self.builder.mul(rows, columns), self._array_length(arguments[0])), "Array length does not match the matrix shape.")
+        return self._matrix_value(rows, columns, self._array_data(arguments[0])), self.type_map["matrix"]
+
+    def _visit_transpose(self, arguments: list[ir.Value], types: list[ir.Type]) -> tuple[ir.Value, ir.Type]:
+        if len(types) != 1 or not self._is_matrix(types[0]):
+            self.errors.append("transpose expects one matrix.")
+            return ir.Constant(self.type_map["matrix"], ir.Undefined), self.type_map["matrix"]
+        rows, columns, data = [self.builder.extract_value(arguments[0], i) for i in range(3)]
+        result = self._allocate(self.type_map["float"], self.builder.mul(rows, columns))
+        self.builder.call(self._transpose_function(), [data, result, rows, columns])
+        return self._matrix_value(columns, rows, result), self.type_map["matrix"]
+
+    def _visit_matmul_expression(self, node: InfixExpression) -> tuple[ir.Value, ir.Type]:
+        left_value, left_type = self._resolve_value(node.left_node)
+        right_value, right_type = self._resolve_value(node.right_node)
+        if not self._is_matrix(left_type) or not (self._is_matrix(right_type) or right_type == self.type_map["float[]"]):
+            self.errors.append(f"Operator @ is not defined for {left_type} and {right_type}.")
+            return ir.Constant(self.type_map["matrix"], ir.Undefined), self.type_map["matrix"]
+        rows, depth, left_data = [self.builder.extract_value(left_value, i) for i in range(3)]
+
+        if self._is_matrix(right_type):
+            right_rows, columns, right_data = [self.builder.extract_value(right_value, i) for i in range(3)]
+            self._runtime_check(self.builder.icmp_signed("==", depth, right_rows), "Matrix shapes do not match.")
+            result = self._allocate(self.type_map["float"], self.builder.mul(rows, columns), zeroed=True)
+            self.builder.call(self._matmul_function(), [left_data, right_data, result, rows, columns, depth])
+            return self._matrix_value(rows, columns, result), self.type_map["matrix"]
+
+        self._runtime_check(self.builder.icmp_signed("==", depth, self._array_length(right_value)), "Matrix and vector shapes do not match.")
+        result = self._allocate(self.type_map["float"], rows)
+        self.builder.call(self._matvec_function(), [left_data, self._array_data(right_value), result, rows, depth])
+        return self._array_value(self.type_map["float"], rows, result), self.type_map["float[]"]
+
+    def _kernel_function(self, name: str, argument_names: list[str], argument_types: list[ir.Type], emit_body, return_type: ir.Type = ir.VoidType()) -> ir.Function:
+        # matrix and reduction kernels are emitted once per module as internal functions, and pointer arguments never
+        # alias an output since it is always newly allocated. emit_body returns the result of a non-void kernel
+        if name in self.module.globals:
+            return self.module.globals[name]
+        function = ir.Function(self.module, ir.FunctionType(return_type, argument_types), name=name)
+        function.linkage = "internal"
+        for argument, argument_name in zip(function.args, argument_names):
+            argument.name = argument_name
+            if isinstance(argument.type, ir.PointerType):
+                argument.add_attribute("noalias")
+
+        previous_builder = self.builder
+        self.builder = ir.IRBuilder(function.append_basic_block(f"{name}_entry"))
+        result = emit_body(*function.args)
+        if isinstance(return_type, ir.VoidType):
+            self.builder.ret_void()
+        else:
+            self.builder.ret(result)
+        self.builder = previous_builder
+        return function
+
+    def _index(self, *terms) -> ir.Value:
+        # row * columns + column style i64 index arithmetic, terms are values or (value, value) products
+        total = None
+        for term in terms:
+            value = self.builder.mul(*term) if isinstance(term, tuple) else term
+            total = value if total is None else self.builder.add(total, value)
+        return total
+
+    def _minimum(self, a: ir.Value, b: ir.Value) -> ir.Value:
+        return self.builder.select(self.builder.icmp_signed("<", a, b), a, b)
+
+    def _round_down(self, value: ir.Value, multiple: int) -> ir.Value:
+        return self.builder.sub(value, self.builder.srem(value, ir.Constant(ir.IntType(64), multiple)))
+
+    def _ceiling_division(self, a: ir.Value, b: ir.Value) -> ir.Value:
+        # for a >= 0 and b > 0
+        return self.builder.sdiv(self.builder.add(a, self.builder.sub(b, ir.Constant(b.type, 1))), b)
+
+    def _vector_pointer(self, data: ir.Value, index: ir.Value) -> ir.Value:
+        return self.builder.bitcast(self._element_pointer(data, index), ir.VectorType(data.type.pointee, VECTOR_WIDTH).as_pointer())
+
+    def _vector_fmuladd(self, width: int = VECTOR_WIDTH) -> ir.Function:
+        # a * b + c, fused into an fma instruction where the target has one
+        type = ir.VectorType(self.type_map["float"], width) if width > 1 else self.type_map["float"]
+        return self._declaration(f"llvm.fmuladd.v{width}f32" if width > 1 else "llvm.fmuladd.f32", type, [type] * 3)
+
+    def _splat(self, value: ir.Value) -> ir.Value:
+        vector_type = ir.VectorType(value.type, VECTOR_WIDTH)
+        vector = self.builder.insert_element(ir.Constant(vector_type, ir.Undefined), value, ir.Constant(ir.IntType(32), 0))
+        return self.builder.shuffle_vector(vector, ir.Constant(vector_type, ir.Undefined), ir.Constant(ir.VectorType(ir.IntType(32), VECTOR_WIDTH), [0] * VECTOR_WIDTH))
+
+    def _matmul_function(self) -> ir.Function:
+        # c (m x n) += a (m x k) @ b (k x n), all row-major
+        i64, pointer = ir.IntType(64), self.type_map["float"].as_pointer()
+        return self._kernel_function("calclite.matmul", ["a", "b", "c", "m", "n", "k"], [pointer, pointer, pointer, i64, i64, i64], self._emit_matmul)
+
+    def _emit_matmul(self, a, b, c, m, n, k) -> None:
+        zero = ir.Constant(ir.IntType(64), 0)
+        tile_columns = MATMUL_VECTORS * VECTOR_WIDTH
+        main_rows, main_columns = self._round_down(m, MATMUL_ROWS), self._round_down(n, tile_columns)
+
+        # the rows and columns that fill whole register tiles, blocked so that the part of b a tile walks over stays
+        # in cache while every row of a passes over it
+        def column_block(j0):
+            j1 = self._minimum(self.builder.add(j0, ir.Constant(ir.IntType(64), MATMUL_COLUMN_BLOCK)), main_columns)
+            def depth_block(k0):
+                k1 = self._minimum(self.builder.add(k0, ir.Constant(ir.IntType(64), MATMUL_DEPTH_BLOCK)), k)
+                self._loop(zero, main_rows, MATMUL_ROWS, lambda i: self._loop(j0, j1, tile_columns, lambda j: self._emit_matmul_tile(a, b, c, n, k, i, j, k0, k1)))
+            self._loop(zero, k, MATMUL_DEPTH_BLOCK, depth_block)
+        self._loop(zero, main_columns, MATMUL_COLUMN_BLOCK, column_block)
+
+        # the remaining columns of the tiled rows and all columns of the remaining rows
+        self._emit_matmul_scalar(a, b, c, n, k, zero, main_rows, main_columns, n)
+        self._emit_matmul_scalar(a, b, c, n, k, main_rows, m, zero, n)
+
+    def _emit_matmul_tile(self, a, b, c, n, k, i, j, k0, k1) -> None:
+        # MATMUL_ROWS x MATMUL_VECTORS accumulator vectors are carried through the loop over the depth block in
+        # registers, every step loads one row segment of b and broadcasts one element of each row of a
+        fmuladd = self._vector_fmuladd()
+        rows = [self.builder.add(i, ir.Constant(ir.IntType(64), row)) for row in range(MATMUL_ROWS)]
+        zero = ir.Constant(ir.VectorType(self.type_map["float"], VECTOR_WIDTH), None)
+
+        def step(kk, *accumulators):
+            b_vectors = [self.builder.load(self._vector_pointer(b, self._index((kk, n), j, ir.Constant(ir.IntType(64), vector * VECTOR_WIDTH))), align=4) for vector in range(MATMUL_VECTORS)]
+            next_accumulators = []
+            for row in rows:
+                a_vector = self._splat(self.builder.load(self._element_pointer(a, self._index((row, k), kk))))
+                for vector in range(MATMUL_VECTORS):
+                    next_accumulators.append(self.builder.call(fmuladd, [a_vector, b_vectors[vector], accumulators[len(next_accumulators)]]))
+            return next_accumulators
+        accumulators = self._loop(k0, k1, 1, step, [zero] * (MATMUL_ROWS * MATMUL_VECTORS))
+
+        for r, row in enumerate(rows):
+            for vector in range(MATMUL_VECTORS):
+                pointer = self._vector_pointer(c, self._index((row, n), j, ir.Constant(ir.IntType(64), vector * VECTOR_WIDTH)))
+                total = self.builder.fadd(self.builder.load(pointer, align=4), accumulators[r * MATMUL_VECTORS + vector])
+                self.builder.store(total, pointer, align=4)
+
+    def _emit_matmul_scalar(self, a, b, c, n, k, row_start, row_stop, column_start, column_stop) -> None:
+        # i-k-j order, so the innermost loop runs along rows of b and c and is left to the loop vectorizer
+        def row(i):
+            def depth(kk):
+                a_value = self.builder.load(self._element_pointer(a, self._index((i, k), kk)))
+                def column(j):
+                    pointer = self._element_pointer(c, self._index((i, n), j))
+                    product = self.builder.fmul(a_value, self.builder.load(self._element_pointer(b, self._index((kk, n), j))))
+                    self.builder.store(self.builder.fadd(self.builder.load(pointer), product), pointer)
+                self._loop(column_start, column_stop, 1, column)
+            self._loop(ir.Constant(ir.IntType(64), 0), k, 1, depth)
+        self._loop(row_start, row_stop, 1, row)
+
+    def _matvec_function(self) -> ir.Function:
+        # y (m) = a (m x k) @ x (k)
+        i64, pointer = ir.IntType(64), self.type_map["float"].as_pointer()
+        return self._kernel_function("calclite.matvec", ["a", "x", "y", "m", "k"], [pointer, pointer, pointer, i64, i64], self._emit_matvec)
+
+    def _emit_matvec(self, a, x, y, m, k) -> None:
+        # MATMUL_ROWS rows at a time share every load of x
+        main_rows = self._round_down(m, MATMUL_ROWS)
+        self._loop(ir.Constant(ir.IntType(64), 0), main_rows, MATMUL_ROWS, lambda i: self._emit_matvec_rows(a, x, y, k, i, MATMUL_ROWS))
+        self._loop(main_rows, m, 1, lambda i: self._emit_matvec_rows(a, x, y, k, i, 1))
+
+    def _emit_matvec_rows(self, a, x, y, k, i, count: int) -> None:
+        # vector partial sums over the columns that fill whole vectors, then a scalar tail
+        fmuladd = self._vector_fmuladd()
+        rows = [self.builder.add(i, ir.Constant(ir.IntType(64), row)) for row in range(count)]
+        main_columns = self._round_down(k, VECTOR_WIDTH)
+
+        def vector_step(kk, *accumulators):
+            x_vector = self.builder.load(self._vector_pointer(x, kk), align=4)
+            return [self.builder.call(fmuladd, [self.builder.load(self._vector_pointer(a, self._index((row, k), kk)), align=4), x_vector, accumulator]) for row, accumulator in zip(rows, accumulators)]
+        accumulators = self._loop(ir.Constant(ir.IntType(64), 0), main_columns, VECTOR_WIDTH, vector_step, [ir.Constant(ir.VectorType(self.type_map["float"], VECTOR_WIDTH), None)] * count)
+
+        sums = []
+        for accumulator in accumulators:
+            total = self.builder.extract_element(accumulator, ir.Constant(ir.IntType(32), 0))
+            for lane in range(1, VECTOR_WIDTH):
+                total = self.builder.fadd(total, self.builder.extract_element(accumulator, ir.Constant(ir.IntType(32), lane)))
+            sums.append(total)
+
+        def scalar_step(kk, *partial_sums):
+            x_value = self.builder.load(self._element_pointer(x, kk))
+            return [self.builder.fadd(total, self.builder.fmul(self.builder.load(self._element_pointer(a, self._index((row, k), kk))), x_value)) for row, total in zip(rows, partial_sums)]
+        sums = self._loop(main_columns, k, 1, scalar_step, sums)
+        for row, total in zip(rows, sums):
+            self.builder.store(total, self._element_pointer(y, row))
+
+    def _transpose_function(self) -> ir.Function:
+        # t (columns x rows) = transpose of a (rows x columns), in square blocks so that both the reads and the
+        # writes stay within a few cache lines
+        i64, pointer = ir.IntType(64), self.type_map["float"].as_pointer()
+        return self._kernel_function("calclite.transpose", ["a", "t", "rows", "columns"], [pointer, pointer, i64, i64], self._emit_transpose)
+
+    def _emit_transpose(self, a, t, rows, columns) -> None:
+        zero, block = ir.Constant(ir.IntType(64), 0), ir.Constant(ir.IntType(64), TRANSPOSE_BLOCK)
+        def row_block(i0):
+            def column_block(j0):
+                def row(i):
+                    def column(j):
+                        value = self.builder.load(self._element_pointer(a, self._index((i, columns), j)))
+                        self.builder.store(value, self._element_pointer(t, self._index((j, rows), i)))
+                    self._loop(j0, self._minimum(self.builder.add(j0, block), columns), 1, column)
+                self._loop(i0, self._minimum(self.builder.add(i0, block), rows), 1, row)
+            self._loop(zero, columns, TRANSPOSE_BLOCK, column_block)
+        self._loop(zero, rows, TRANSPOSE_BLOCK, row_block)
+
+
+
+    # reductions
+    def _visit_reduction(self, name: str, arguments: list[ir.Value], types: list[ir.Type]) -> tuple[ir.Value, ir.Type]:
+        # sum, prod, min and max of the elements of an array or matrix, and dot of two arrays of the same length.
+        # min and max of two ints or floats are their smaller and larger value, in their promoted type
+        if name in ("min", "max") and len(types) == 2 and self._promoted_type(*types) is not None:
+            type = self._promoted_type(*types)
+            return self._combine(name, self._convert(arguments[0], types[0], type), self._convert(arguments[1], types[1], type)), type
+        element_type = self.type_map["float"] if types and self._is_matrix(types[0]) else self._element_type(types[0]) if types else None
+        if len(types) != (2 if name == "dot" else 1) or any(type != types[0] for type in types) or element_type not in (self.type_map["int"], self.type_map["float"]) or (name == "dot" and self._is_matrix(types[0])):
+            if name == "dot":
+                self.errors.append("dot expects two int[] or two float[] arrays.")
+            else:
+                self.errors.append(f"{name} expects an int[], float[] or matrix{', or two ints or floats' if name in ('min', 'max') else ''}.")
+            return ir.Constant(self.type_map["int"], ir.Undefined), self.type_map["int"]
+
+        if self._is_matrix(types[0]):
+            rows, columns, data = [self.builder.extract_value(arguments[0], i) for i in range(3)]
+            length = self.builder.mul(rows, columns)
+        else:
+            length, data = self._array_length(arguments[0]), self._array_data(arguments[0])
+        other = data
+        if name == "dot":
+            self._runtime_check(self.builder.icmp_signed("==", length, self._array_length(arguments[1])), "Array lengths do not match.")
+            other = self._array_data(arguments[1])
+        return self.builder.call(self._reduction_function(name, element_type), [data, other, length]), element_type
+
+    def _identity(self, operation: str, type: ir.Type) -> ir.Constant:
+        # the value a reduction starts from, so the sum of nothing is 0 and the minimum of nothing the largest value
+        if _is_float(type):
+            value = {"sum": 0.0, "dot": 0.0, "prod": 1.0, "min": float("inf"), "max": float("-inf")}[operation]
+        else:
+            bits = type.width - 1
+            value = {"sum": 0, "dot": 0, "prod": 1, "min": 2**bits - 1, "max": -2**bits}[operation]
+        return ir.Constant(type, value)
+
+    def _combine(self, operation: str, a: ir.Value, b: ir.Value) -> ir.Value:
+        # one step of a reduction, on scalars or vectors
+        is_float = _is_float(a.type)
+        flags = self._reduction_flags
+        match operation:
+            case "sum" | "dot":
+                return self.builder.fadd(a, b, flags=flags) if is_float else self.builder.add(a, b)
+            case "prod":
+                return self.builder.fmul(a, b, flags=flags) if is_float else self.builder.mul(a, b)
+            case "min" | "max":
+                comparison = "<" if operation == "min" else ">"
+                test = self.builder.fcmp_ordered(comparison, a, b, flags=flags) if is_float else self.builder.icmp_signed(comparison, a, b)
+                return self.builder.select(test, a, b)
+
+    def _accumulate(self, operation: str, accumulator: ir.Value, x: ir.Value, y: ir.Value) -> ir.Value:
+        # combines the next element, or for dot the product of the next elements, into an accumulator
+        if operation != "dot":
+            return self._combine(operation, accumulator, x)
+        if not _is_float(accumulator.type):
+            return self.builder.add(accumulator, self.builder.mul(x, y))
+        if "contract" in self._reduction_flags:
+            width = accumulator.type.count if isinstance(accumulator.type, ir.VectorType) else 1
+            return self.builder.call(self._vector_fmuladd(width), [x, y, accumulator])
+        # a separate multiply and add round the same way on every target
+        return self.builder.fadd(accumulator, self.builder.fmul(x, y, flags=self._reduction_flags), flags=self._reduction_flags)
+
+    def _reduction_function(self, operation: str, element_type: ir.Type) -> ir.Function:
+        # calclite.<operation>.<type>(x, y, length), where y is only read by dot. Up to REDUCTION_BLOCK elements are
+        # reduced in one go, longer arrays in blocks whose partial results are reduced in turn. The blocks do not
+        # depend on the number of threads, and neither does the result
+        pointer, i64 = element_type.as_pointer(), ir.IntType(64)
+        name = f"calclite.{operation}.{_type_suffix(element_type)}"
+        return self._kernel_function(name, ["x", "y", "length"], [pointer, pointer, i64], lambda x, y, length: self._emit_reduction(operation, x, y, length), element_type)
+
+    def _emit_reduction(self, operation: str, x, y, length) -> ir.Value:
+        i64 = ir.IntType(64)
+        element_type = x.type.pointee
+        range_function = self._reduction_range_function(operation, element_type)
+        current_function = self.builder.block.function
+        short_block = current_function.append_basic_block("short")
+        blocked_block = current_function.append_basic_block("blocked")
+        self.builder.cbranch(self.builder.icmp_signed("<=", length, ir.Constant(i64, REDUCTION_BLOCK)), short_block, blocked_block)
+        self.builder.position_at_end(short_block)
+        self.builder.ret(self.builder.call(range_function, [x, y, ir.Constant(i64, 0), length]))
+
+        self.builder.position_at_end(blocked_block)
+        blocks = self._ceiling_division(length, ir.Constant(i64, REDUCTION_BLOCK))
+        partials = self._allocate(element_type, blocks)
+        context = self._create_entry_alloca(ir.ArrayType(Runtime.VOID_POINTER, 4), name="context")
+        length_slot = self._create_entry_alloca(i64, name="length")
+        self.builder.store(length, length_slot)
+        for i, value in enumerate([x, y, partials, length_slot]):
+            self.builder.store(self.builder.bitcast(value, Runtime.VOID_POINTER), self.builder.gep(context, [ir.Constant(ir.IntType(32), 0), ir.Constant(ir.IntType(32), i)], inbounds=True))
+        context = self.builder.bitcast(context, Runtime.CONTEXT)
+        blocks_function = self._reduction_blocks_function(operation, range_function)
+
+        # a few blocks are not worth waking the thread pool for
+        pool_block = current_function.append_basic_block("pool")
+        direct_block = current_function.append_basic_block("direct")
+        combine_block = current_function.append_basic_block("combine")
+        self.builder.cbranch(self.builder.icmp_signed(">=", blocks, ir.Constant(i64, REDUCTION_PARALLEL_BLOCKS)), pool_block, direct_block)
+        self.builder.position_at_end(pool_block)
+        parallel_for = self._runtime_function(Runtime.PARALLEL_FOR, Runtime.PARALLEL_FOR_TYPE)
+        self.builder.call(parallel_for, [blocks_function, context, ir.Constant(i64, 0), blocks, ir.Constant(ir.IntType(8), 0), ir.Constant(i64, 0)])
+        self.builder.branch(combine_block)
+        self.builder.position_at_end(direct_block)
+        self.builder.call(blocks_function, [context, ir.Constant(i64, 0), blocks])
+        self.builder.branch(combine_block)
+
+        self.builder.position_at_end(combine_block)
+        combined = self.builder.call(self._reduction_range_function("sum" if operation == "dot" else operation, element_type), [partials, partials, ir.Constant(i64, 0), blocks])
+        free, _ = self.environment.lookup("free")
+        self.builder.call(free, [self.builder.bitcast(partials, ir.IntType(8).as_pointer())])
+        return combined
+
+    def _reduction_blocks_function(self, operation: str, range_function: ir.Function) -> ir.Function:
+        # body of the thread pool that reduces the blocks first..last of the array into their partial results, with
+        # the context x, y, partials and a pointer to the length
+        def emit(context, first, last):
+            def slot(i: int, type: ir.Type) -> ir.Value:
+                pointer = self.builder.load(self.builder.gep(context, [ir.Constant(ir.IntType(32), i)], inbounds=True))
+                return self.builder.bitcast(pointer, type)
+            pointer = range_function.args[0].type
+            x, y, partials = slot(0, pointer), slot(1, pointer), slot(2, pointer)
+            length = self.builder.load(slot(3, ir.IntType(64).as_pointer()))
+            def block(index):
+                low = self.builder.mul(index, ir.Constant(ir.IntType(64), REDUCTION_BLOCK))
+                high = self._minimum(self.builder.add(low, ir.Constant(ir.IntType(64), REDUCTION_BLOCK)), length)
+                self.builder.store(self.builder.call(range_function, [x, y, low, high]), self._element_pointer(partials, index))
+            self._loop(first, last, 1, block)
+        return self._kernel_function(f"{range_function.name[:-len('.range')]}.blocks", ["context", "first", "last"], list(Runtime.BODY.args), emit)
+
+    def _reduction_range_function(self, operation: str, element_type: ir.Type) -> ir.Function:
+        # calclite.<operation>.<type>.range(x, y, start, stop) reduces the elements start..stop in one thread
+        pointer, i64 = element_type.as_pointer(), ir.IntType(64)
+        name = f"calclite.{operation}.{_type_suffix(element_type)}.range"
+        return self._kernel_function(name, ["x", "y", "start", "stop"], [pointer, pointer, i64, i64], lambda x, y, start, stop: self._emit_reduction_range(operation, x, y, start, stop), element_type)
+
+    def _emit_reduction_range(self, operation: str, x, y, start, stop) -> ir.Value:
+        # REDUCTION_VECTORS independent vector accumulators hide the latency of the combining instruction. They are
+        # combined pairwise and then halved lane by lane, followed by the scalar tail, so the order of the operations
+        # is fixed by the range alone
+        i64, i32 = ir.IntType(64), ir.IntType(32)
+        element_type = x.type.pointee
+        combine = "sum" if operation == "dot" else operation
+        step = VECTOR_WIDTH * REDUCTION_VECTORS
+        main_stop = self.builder.add(start, self._round_down(self.builder.sub(stop, start), step))
+        identity = self._identity(combine, element_type)
+
+        def vector_step(index, *accumulators):
+            results = []
+            for vector, accumulator in enumerate(accumulators):
+                offset = self.builder.add(index, ir.Constant(i64, vector * VECTOR_WIDTH))
+                x_vector = self.builder.load(self._vector_pointer(x, offset), align=4)
+                y_vector = self.builder.load(self._vector_pointer(y, offset), align=4) if operation == "dot" else None
+                results.append(self._accumulate(operation, accumulator, x_vector, y_vector))
+            return results
+        accumulators = self._loop(start, main_stop, step, vector_step, [ir.Constant(ir.VectorType(element_type, VECTOR_WIDTH), [identity] * VECTOR_WIDTH)] * REDUCTION_VECTORS)
+
+        while len(accumulators) > 1:
+            accumulators = [self._combine(combine, a, b) for a, b in zip(accumulators[0::2], accumulators[1::2])]
+        total, lanes = accumulators[0], VECTOR_WIDTH
+        while lanes > 1:
+            lanes //= 2
+            halves = [self.builder.shuffle_vector(total, ir.Constant(total.type, ir.Undefined), ir.Constant(ir.VectorType(i32, lanes), list(range(offset, offset + lanes)))) for offset in (0, lanes)]
+            total = self._combine(combine, *halves)
+        total = self.builder.extract_element(total, ir.Constant(i32, 0))
+
+        def scalar_step(index, total):
+            x_value = self.builder.load(self._element_pointer(x, index))
+            y_value = self.builder.load(self._element_pointer(y, index)) if operation == "dot" else None
+            return [self._accumulate(operation, total, x_value, y_value)]
+        return self._loop(main_stop, stop, 1, scalar_step, [total])[0]
+
+
+class _CaptureEnvironment(Environment):
+    # parent scope of an outlined parallel for body. A value of the enclosing function is loaded from the context
+    # array on its first use, while functions, globals and constants are used as they are. Captured variables cannot
+    # be assigned, since the iterations run concurrently
+    def __init__(self, outer: Environment, context: ir.Argument, builder: ir.IRBuilder, errors: list[str]) -> None:
+        super().__init__(records={}, name="Captures")
+        self.outer = outer
+        self.context = context
+        self.builder = builder
+        self.errors = errors
+        self.captured: list[tuple[ir.Value, ir.Type]] = []
+        self.loaded: dict[ir.Value, ir.Value] = {} # captured values to their copies in the body
+
+    def lookup(self, name: str) -> tuple[ir.Value, ir.Type] | None:
+        return self._captured(self.outer.lookup(name), lambda: name)
+
+    def resolve(self, depth: int, slot: int) -> tuple[ir.Value, ir.Type] | None:
+        return self._captured(self.outer.resolve(depth - 1, slot), lambda: self._name(depth, slot))
+
+    def scope(self, depth: int) -> Environment:
+        return self.outer.scope(depth - 1) if depth else self
+
+    def assign(self, name: str, value: ir.Value) -> bool:
+        self.errors.append(f"Variable {name} cannot be assigned inside a parallel for, use a variable declared in its body or a reduce clause.")
+        return True
+
+    def assign_at(self, depth: int, slot: int, value: ir.Value) -> None:
+        self.assign(self._name(depth, slot), value)
+
+    def _name(self, depth: int, slot: int) -> str:
+        return next(name for name, other in self.scope(depth).slots.items() if other == slot)
+
+    def _captured(self, record: tuple[ir.Value, ir.Type] | None, name) -> tuple[ir.Value, ir.Type] | None:
+        # every value is loaded once, named after the variable it is first used through
+        if record is None or not isinstance(record[0], (ir.Instruction, ir.Argument)):
+            return record
+        value, type = record
+        if value not in self.loaded:
+            self.loaded[value] = self.capture(value, type, name=name())
+        return self.loaded[value], type
+
+    def capture(self, value: ir.Value, type: ir.Type, name: str = "") -> ir.Value:
+        # also passes values of the enclosing function that no variable refers to
+        slot = self.builder.load(self.builder.gep(self.context, [ir.Constant(ir.IntType(32), len(self.captured))], inbounds=True))
+        self.captured.append((value, type))
+        return self.builder.load(self.builder.bitcast(slot, type.as_pointer()), name=name)
+
+
+def _created_arrays(node: FunctionStatement) -> set[str]:
+    # the variables of a function that only ever hold arrays and matrices it created itself. fill, transpose, array
+    # literals, elementwise operations, math functions and products allocate new elements, while a variable, a row
+    # of a matrix, reshape or the result of a call can share the elements of an argument. A variable only counts as
+    # created if every value it is declared or assigned with does
+    values: dict[str, list[Expression]] = {}
+    pending = [node.body]
+    while pending:
+        current = pending.pop()
+        if current is None: continue
+        match current.type():
+            case NodeType.FunctionStatement:
+                continue
+            case NodeType.VarStatement:
+                values.setdefault(current.name.value, []).append(current.value)
+            case NodeType.AssignStatement:
+                values.setdefault(current.identifier.value, []).append(current.expression)
+        pending.extend(children(current))
+
+    def creates(value: Expression) -> bool:
+        match value.type():
+            case NodeType.ArrayLiteral | NodeType.InfixExpression:
+                return True
+            case NodeType.CallExpression:
+                if value.name.value == "reshape":
+                    return bool(value.parameters) and creates(value.parameters[0])
+                return value.name.value in ("fill", "transpose", *MATH_FUNCTIONS)
+            case NodeType.IndexExpression:
+                return creates(value.array)
+            case NodeType.IdentifierLiteral:
+                return value.value in created
+        return False
+
+    # names are removed until every remaining one is only given created values
+    created = set(values)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(created):
+            if not all(creates(value) for value in values[name]):
+                created.discard(name)
+                changed = True
+    return created
+
+
+def _is_float(type: ir.Type) -> bool:
+    # floats and f64s, and vectors of them
+    if isinstance(type, ir.VectorType):
+        type = type.element
+    return isinstance(type, (ir.FloatType, ir.DoubleType))
+
+
+def _type_suffix(type: ir.Type) -> str:
+    # the name LLVM intrinsics give a scalar type, such as f32 or i64
+    return f"f{64 if isinstance(type, ir.DoubleType) else 32}" if _is_float(type) else f"i{type.width}"
+
+
+def _union(flags: tuple[str, ...], other: tuple[str, ...]) -> tuple[str, ...]:
+    return tuple(dict.fromkeys((*flags, *other)))
+
+
+def _is_call_to(node: Expression | None, name: str) -> bool:
+    return node is not None and node.type() == NodeType.CallExpression and node.name.value == name
+
+
+def _tail_recursion(node: FunctionStatement) -> str | None:
+    # how the recursive calls of a function can be compiled as jumps back to its start: "" if every one is returned
+    # directly, "+" or "*" if some are returned added to or multiplied with an integer, which is then accumulated
+    # instead, and None if there are none or one of them has to stay a call
+    name = node.name.value
+    local_names = {parameter.name for parameter in node.parameters}
+    if name in local_names:
+        return None
+    returns, calls = [], 0
+    pending = [node.body]
+    while pending:
+        current = pending.pop()
+        if current is None: continue
+        match current.type():
+            case NodeType.FunctionStatement:
+                # nested functions have frames of their own
+                if current.name.value == name:
+                    return None
+                continue
+            case NodeType.VarStatement:
+                if current.name.value == name:
+                    return None
+                local_names.add(current.name.value)
+            case NodeType.ReturnStatement:
+                returns.append(current.return_value)
+            case NodeType.CallExpression if current.name.value == name:
+                calls += 1
+        pending.extend(children(current))
+
+    operators, tail_calls = set(), 0
+    for value in returns:
+        if _is_call_to(value, name):
+            tail_calls += 1
+        elif value is not None and value.type() == NodeType.InfixExpression and value.operator in ("+", "*"):
+            # an operand after the call is evaluated before the jump, so the recursion must not be able to change it
+            if _is_call_to(value.left_node, name) and _is_local_arithmetic(value.right_node, local_names) or _is_call_to(value.right_node, name):
+                tail_calls += 1
+                operators.add(value.operator)
+    # float arithmetic is not associative, so only int results can be accumulated in a different order
+    if tail_calls == 0 or tail_calls != calls or len(operators) > 1 or operators and node.return_type not in ("int", "i64"):
+        return None
+    return operators.pop() if operators else ""
+
+
+def _is_local_arithmetic(node: Expression, names: set[str]) -> bool:
+    # literals and variables of the function combined with operators
+    match node.type():
+        case NodeType.IntegerLiteral | NodeType.FloatLiteral | NodeType.BooleanLiteral:
+            return True
+        case NodeType.IdentifierLiteral:
+            return node.value in names
+        case NodeType.InfixExpression:
+            return node.operator != "@" and _is_local_arithmetic(node.left_node, names) and _is_local_arithmetic(node.right_node, names)
+    return False
+
+
+def _assigned_names(node: Node) -> set[str]:
+    # names assigned anywhere in the statement, not counting nested function definitions
+    names = set()
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        if current is None: continue
+        match current.type():
+            case NodeType.AssignStatement:
+                names.add(current.identifier.value)
+            case NodeType.BlockStatement:
+                pending.extend(current.statements)
+            case NodeType.ExpressionStatement:
+                pending.append(current.expression)
+            case NodeType.IfStatement:
+                pending.extend([current.consequence, current.alternative])
+            case NodeType.WhileStatement | NodeType.ForStatement:
+                pending.append(current.body)
+    return names
@@ -2,15 +2,62 @@ from llvmlite import ir
 
 
 class Environment:
-    def __init__(self, records: dict[str, tuple[ir.Value, ir.Type]], parent=None, name="Global") -> None:
-        self.records = records # name to (pointer, variable ir type)
+    # a scope of variables. Every name has a slot, the index of its record in values, given on its first definition
+    # or up front by names. The Compiler reads variables through the (depth, slot) the Resolver bound their
+    # identifiers to, where depth counts the parents to go up, and only looks names up for identifiers it left unbound
+    def __init__(self, records: dict[str, tuple[ir.Value, ir.Type]], parent=None, name="Global", names=()) -> None:
+        self.slots: dict[str, int] = {variable: slot for slot, variable in enumerate(names)}
+        self.values: list[tuple[ir.Value, ir.Type] | None] = [None] * len(self.slots) # slot to (pointer, variable ir type), None if not defined
         self.parent = parent
         self.name = name
+        for variable, record in records.items():
+            self.values[self.slot(variable)] = record
+
+    @property
+    def records(self) -> dict[str, tuple[ir.Value, ir.Type]]:
+        return {name: self.values[slot] for name, slot in self.slots.items() if self.values[slot] is not None}
+
+    def slot(self, name: str) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.values)
+            self.values.append(None)
+        return slot
 
     def define(self, name: str, value: ir.Value, type: ir.Type) -> None:
-        self.records[name] = (value, type)
-    
+        self.values[self.slot(name)] = (value, type)
+
+    def set(self, slot: int, record: tuple[ir.Value, ir.Type] | None) -> None:
+        self.values[slot] = record
+
     def lookup(self, name: str) -> tuple[ir.Value, ir.Type] | None:
-        if name in self.records: return self.records[name]
+        slot = self.slots.get(name)
+        if slot is not None and self.values[slot] is not None: return self.values[slot]
         elif self.parent: return self.parent.lookup(name)
         return None
+
+    def assign(self, name: str, value: ir.Value) -> bool:
+        slot = self.slots.get(name)
+        if slot is not None and self.values[slot] is not None:
+            self.values[slot] = (value, self.values[slot][1])
+            return True
+        elif self.parent: return self.parent.assign(name, value)
+        return False
+
+    def scope(self, depth: int) -> "Environment":
+        return self.parent.scope(depth - 1) if depth else self
+
+    def resolve(self, depth: int, slot: int) -> tuple[ir.Value, ir.Type] | None:
+        if depth: return self.parent.resolve(depth - 1, slot)
+        return self.values[slot]
+
+    def assign_at(self, depth: int, slot: int, value: ir.Value) -> None:
+        if depth: return self.parent.assign_at(depth - 1, slot, value)
+        self.values[slot] = (value, self.values[slot][1])
+
+    def snapshot(self) -> list[tuple[ir.Value, ir.Type] | None]:
+        return list(self.values)
+
+    def restore(self, snapshot: list[tuple[ir.Value, ir.Type] | None]) -> None:
+        # names given a slot after the snapshot are not defined in it
+        self.values = [*snapshot, *[None] * (len(self.slots) - len(snapshot))]
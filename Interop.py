@@ -0,0 +1,268 @@
+import sys
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
+from llvmlite import ir
+import llvmlite.binding as llvm
+
+from TableLexer import TableLexer
+from Parser import Parser
+from AST import NodeType, FunctionStatement
+from Compiler import Compiler, DEFAULT_COMPILE_TIME_STEPS
+from Optimizer import Optimizer
+from Interpreter import CTYPES_MAP
+import JIT
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# C layouts of the aggregate types, see Compiler.array_type and Compiler.matrix_type
+class IntArray(ctypes.Structure):
+    _fields_ = [("length", ctypes.c_int64), ("data", ctypes.POINTER(ctypes.c_int32))]
+
+class FloatArray(ctypes.Structure):
+    _fields_ = [("length", ctypes.c_int64), ("data", ctypes.POINTER(ctypes.c_float))]
+
+class Matrix(ctypes.Structure):
+    _fields_ = [("rows", ctypes.c_int64), ("columns", ctypes.c_int64), ("data", ctypes.POINTER(ctypes.c_float))]
+
+
+# type name: (ctypes structure, element type, dimensions, accepted buffer format characters)
+BUFFER_TYPES = {
+    "int[]": (IntArray, ctypes.c_int32, 1, ("i", "l")),
+    "float[]": (FloatArray, ctypes.c_float, 1, ("f",)),
+    "matrix": (Matrix, ctypes.c_float, 2, ("f",)),
+}
+# scalar type: (element type, accepted buffer format characters) of the buffers taken by batch calls
+ELEMENT_TYPES = {
+    "int": (ctypes.c_int32, ("i", "l")),
+    "i64": (ctypes.c_int64, ("q", "l")),
+    "float": (ctypes.c_float, ("f",)),
+    "f64": (ctypes.c_double, ("d",)),
+    "bool": (ctypes.c_bool, ("?",)),
+}
+ELEMENT_NAMES = {ctypes.c_int32: "32 bit integer", ctypes.c_int64: "64 bit integer", ctypes.c_float: "32 bit float", ctypes.c_double: "64 bit float", ctypes.c_bool: "bool"}
+NUMPY_TYPES = {ctypes.c_int32: "int32", ctypes.c_int64: "int64", ctypes.c_float: "float32", ctypes.c_double: "float64", ctypes.c_bool: "bool"}
+# buffer formats may be prefixed with their byte order, which has to be the native one
+NATIVE_BYTE_ORDERS = ("@", "=", "<" if sys.byteorder == "little" else ">")
+
+
+class InteropError(Exception):
+    pass
+
+
+class NativeFunction:
+    # calls a compiled function with Python scalars and buffer protocol objects such as NumPy arrays. A buffer is
+    # passed as a pointer to its own memory plus its shape, so nothing is copied and elements the function assigns
+    # are visible in the caller's array afterwards. The call goes through the function's export wrapper, see _export
+    def __init__(self, module: "NativeModule", node: FunctionStatement) -> None:
+        self.module = module # keeps the engine, and with it the machine code, alive
+        self.name = node.name.value
+        self.parameter_types = [parameter.value_type for parameter in node.parameters]
+        self.return_type = node.return_type
+        parameters = [ctypes.POINTER(_ctype(type)) if type in BUFFER_TYPES else _ctype(type) for type in self.parameter_types]
+        if self.return_type in BUFFER_TYPES:
+            signature = ctypes.CFUNCTYPE(None, ctypes.POINTER(_ctype(self.return_type)), *parameters)
+        else:
+            signature = ctypes.CFUNCTYPE(_ctype(self.return_type), *parameters)
+        self._function = signature(module.engine.get_function_address(f"{self.name}.export"))
+        # scalar functions also have a loop wrapper, see Compiler._batch_function
+        self._batch = None
+        if all(type in ELEMENT_TYPES for type in [*self.parameter_types, self.return_type]):
+            batch_parameters = [ctypes.c_int64, ctypes.c_int64]
+            for _ in self.parameter_types:
+                batch_parameters += [ctypes.c_void_p, ctypes.c_int64]
+            self._batch = ctypes.CFUNCTYPE(None, *batch_parameters, ctypes.c_void_p)(module.engine.get_function_address(f"{self.name}.batch"))
+
+    def __call__(self, *arguments):
+        if len(arguments) != len(self.parameter_types):
+            raise TypeError(f"{self.name} takes {len(self.parameter_types)} arguments, got {len(arguments)}.")
+        # the exported buffers stay referenced by the converted arguments until the call returns
+        converted = [self._argument(i, argument, type) for i, (argument, type) in enumerate(zip(arguments, self.parameter_types))]
+        if self.return_type in BUFFER_TYPES:
+            result = _ctype(self.return_type)()
+            self._function(ctypes.byref(result), *converted)
+        else:
+            result = self._function(*converted)
+        JIT.flush_output()
+        if self.return_type in BUFFER_TYPES:
+            return _wrap(result, self.return_type)
+        return result
+
+    def batch(self, *arguments, out=None, threads: int = 1):
+        # applies a scalar function elementwise like a NumPy ufunc: one dimensional buffers are read element by
+        # element, scalars are broadcast, and the results are written to out, which is allocated if not given. The
+        # whole batch is one native call, or one per thread with threads > 1, since ctypes releases the GIL
+        if self._batch is None:
+            raise TypeError(f"{self.name} does not take and return only int, float and bool, so it cannot be batched.")
+        if len(arguments) != len(self.parameter_types):
+            raise TypeError(f"{self.name} takes {len(self.parameter_types)} arguments, got {len(arguments)}.")
+        if threads < 1:
+            raise ValueError(f"threads must be at least 1, got {threads}.")
+
+        length = None
+        converted = []
+        for i, (argument, type) in enumerate(zip(arguments, self.parameter_types)):
+            element_type, formats = ELEMENT_TYPES[type]
+            try:
+                view = memoryview(argument)
+            except TypeError:
+                view = None
+            if view is None or view.ndim == 0:
+                converted += [ctypes.cast(ctypes.pointer(element_type(argument)), ctypes.c_void_p), 0]
+                continue
+            view = self._view(i, view, type, element_type, formats, 1)
+            if length is not None and len(view) != length:
+                raise ValueError(f"Argument {i} of {self.name} has {len(view)} elements, expected {length}.")
+            length = len(view)
+            converted += [_pointer(view, ctypes.c_void_p), 1]
+
+        element_type, formats = ELEMENT_TYPES[self.return_type]
+        if out is None:
+            if length is None:
+                raise TypeError(f"Batched calls of {self.name} need an array argument or out.")
+            # ctypes arrays export formats like '<f', which memoryviews cannot read, so the view is cast to the plain one
+            out = np.empty(length, dtype=NUMPY_TYPES[element_type]) if np is not None else memoryview((element_type * length)()).cast("B").cast(formats[0])
+        out_view = self._view("out", memoryview(out), self.return_type, element_type, formats, 1)
+        if length is not None and len(out_view) != length:
+            raise ValueError(f"out of {self.name} has {len(out_view)} elements, expected {length}.")
+        length = len(out_view)
+        output = _pointer(out_view, ctypes.c_void_p)
+
+        if threads == 1 or length < threads:
+            self._batch(0, length, *converted, output)
+        else:
+            bounds = [length * thread // threads for thread in range(threads + 1)]
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                for future in [executor.submit(self._batch, start, stop, *converted, output) for start, stop in zip(bounds, bounds[1:])]:
+                    future.result()
+        JIT.flush_output()
+        return out
+
+    def _argument(self, index: int, argument, type: str):
+        if type not in BUFFER_TYPES:
+            return argument
+        structure, element_type, dimensions, formats = BUFFER_TYPES[type]
+        try:
+            view = memoryview(argument)
+        except TypeError:
+            raise TypeError(f"Argument {index} of {self.name} must be a {type} buffer, got {argument.__class__.__name__}.") from None
+        view = self._view(index, view, type, element_type, formats, dimensions)
+        return ctypes.byref(structure(*view.shape, _pointer(view, ctypes.POINTER(element_type))))
+
+    def _view(self, index, view: memoryview, type: str, element_type, formats: tuple[str, ...], dimensions: int) -> memoryview:
+        # checks that a buffer has the element type, shape and layout the compiled code expects
+        name = "out" if index == "out" else f"Argument {index}"
+        format = view.format[1:] if view.format[:1] in NATIVE_BYTE_ORDERS else view.format
+        if format not in formats or view.itemsize != ctypes.sizeof(element_type):
+            raise TypeError(f"{name} of {self.name} is {type}, which needs {ELEMENT_NAMES[element_type]} elements, got format {view.format!r} with {view.itemsize} byte elements.")
+        if view.ndim != dimensions:
+            raise TypeError(f"{name} of {self.name} is {type}, which needs {dimensions} dimensions, got {view.ndim}.")
+        if not view.c_contiguous:
+            raise ValueError(f"{name} of {self.name} must be C contiguous.")
+        # CalcLite has no read-only arrays, so every buffer may be written to
+        if view.readonly:
+            raise ValueError(f"{name} of {self.name} must be writable.")
+        return view
+
+
+class NativeModule:
+    # compiles a CalcLite program once and exposes its top level functions as callables, e.g.
+    # NativeModule(code).scale(x, 2.0). The top level code only runs when run() is called
+    def __init__(self, code: str, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL, fast_reductions: bool = False, fast_math: tuple[str, ...] = ()) -> None:
+        parser = Parser(lexer=TableLexer(code=code))
+        program = parser.parse()
+        if parser.errors:
+            raise InteropError("\n".join(parser.errors))
+        if opt_level > 0:
+            program = Optimizer().optimize(program)
+        compiler = Compiler(batch_functions=True, fast_reductions=fast_reductions, fast_math=fast_math, compile_time_steps=DEFAULT_COMPILE_TIME_STEPS if opt_level > 0 else 0)
+        compiler.compile(node=program)
+        if compiler.errors:
+            raise InteropError("\n".join(compiler.errors))
+        statements = [statement for statement in program.statements if statement.type() == NodeType.FunctionStatement]
+        for statement in statements:
+            _export(compiler.module, compiler.module.get_global(statement.name.value))
+        compiler.module.triple = llvm.get_default_triple()
+        self.engine = JIT.create_engine(compiler.module, opt_level=opt_level)
+
+        self.functions: dict[str, NativeFunction] = {}
+        for statement in statements:
+            self.functions[statement.name.value] = NativeFunction(self, statement)
+
+    @classmethod
+    def load(cls, path: str, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL, fast_reductions: bool = False, fast_math: tuple[str, ...] = ()) -> "NativeModule":
+        with open(path, "r") as f:
+            return cls(f.read(), opt_level=opt_level, fast_reductions=fast_reductions, fast_math=fast_math)
+
+    def __getattr__(self, name: str) -> NativeFunction:
+        functions = self.__dict__.get("functions", {})
+        if name not in functions:
+            raise AttributeError(f"Function {name} is not defined.")
+        return functions[name]
+
+    def run(self) -> int:
+        result = ctypes.CFUNCTYPE(ctypes.c_int)(self.engine.get_function_address("main"))()
+        JIT.flush_output()
+        return result
+
+
+def _export(module: ir.Module, function: ir.Function) -> ir.Function:
+    # CalcLite passes arrays and matrices as LLVM structs by value, which for matrices does not match the C calling
+    # convention ctypes uses. The wrapper <name>.export takes them by pointer instead and writes an aggregate result
+    # to a structure passed as its first argument
+    function_type = function.function_type
+    returns_aggregate = isinstance(function_type.return_type, ir.LiteralStructType)
+    parameter_types = [type.as_pointer() if isinstance(type, ir.LiteralStructType) else type for type in function_type.args]
+    if returns_aggregate:
+        wrapper_type = ir.FunctionType(ir.VoidType(), [function_type.return_type.as_pointer(), *parameter_types])
+    else:
+        wrapper_type = ir.FunctionType(function_type.return_type, parameter_types)
+    wrapper = ir.Function(module, wrapper_type, name=f"{function.name}.export")
+    builder = ir.IRBuilder(wrapper.append_basic_block("entry"))
+
+    arguments = list(wrapper.args)
+    result_pointer = arguments.pop(0) if returns_aggregate else None
+    values = [builder.load(argument) if isinstance(type, ir.LiteralStructType) else argument for argument, type in zip(arguments, function_type.args)]
+    result = builder.call(function, values)
+    if returns_aggregate:
+        builder.store(result, result_pointer)
+        builder.ret_void()
+    else:
+        builder.ret(result)
+    return wrapper
+
+
+def _pointer(view: memoryview, pointer_type):
+    # address of the first element, the returned pointer keeps the buffer exported while it is alive
+    return ctypes.cast((ctypes.c_char * view.nbytes).from_buffer(view), pointer_type)
+
+
+def _ctype(type: str):
+    if type in BUFFER_TYPES:
+        return BUFFER_TYPES[type][0]
+    if type in CTYPES_MAP:
+        return CTYPES_MAP[type]
+    raise InteropError(f"Type {type} cannot be passed between Python and CalcLite.")
+
+
+def _wrap(result: ctypes.Structure, type: str):
+    # returned buffers are allocated by the compiled code and never freed, so they are wrapped without copying. Copies
+    # of a CalcLite array share its elements, so a returned argument aliases the caller's buffer
+    _, element_type, _, _ = BUFFER_TYPES[type]
+    shape = (result.rows, result.columns) if type == "matrix" else (result.length,)
+    count = 1
+    for size in shape:
+        count *= size
+    if np is not None:
+        if count == 0:
+            return np.empty(shape, dtype=np.float32 if element_type is ctypes.c_float else np.int32)
+        return np.ctypeslib.as_array(result.data, shape=shape)
+    format = "f" if element_type is ctypes.c_float else "i"
+    # a memoryview cannot take a shape with a zero in it, so empty results are one dimensional
+    if count == 0:
+        return memoryview((element_type * 0)()).cast("B").cast(format)
+    elements = (element_type * count).from_address(ctypes.addressof(result.data.contents))
+    return memoryview(elements).cast("B").cast(format, shape)
@@ -0,0 +1,765 @@
+import sys
+import math
+import os
+import struct
+import ctypes
+
+from AST import Node, NodeType, Statement, Expression, Program
+from AST import ExpressionStatement, VarStatement, BlockStatement, FunctionStatement, ReturnStatement, AssignStatement
+from AST import IfStatement, WhileStatement, IndexAssignStatement, ForStatement
+from AST import InfixExpression, CallExpression, IndexExpression, ArrayLiteral
+from Environment import Environment
+from Token import NUMERIC_TYPES
+
+
+DEFAULT_HOT_THRESHOLD = 1000
+CONVERSION_FUNCTIONS = NUMERIC_TYPES
+# math functions and the libm functions behind them, whose float versions have an f suffix. They take one argument
+# unless MATH_ARITIES says otherwise
+MATH_FUNCTIONS = {
+    "sqrt": "sqrt", "abs": "fabs", "floor": "floor", "ceil": "ceil", "trunc": "trunc", "round": "round", "fma": "fma",
+    "exp": "exp", "exp2": "exp2", "log": "log", "log2": "log2", "log10": "log10",
+    "sin": "sin", "cos": "cos", "tan": "tan", "asin": "asin", "acos": "acos", "atan": "atan", "atan2": "atan2",
+    "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+}
+MATH_ARITIES = {"atan2": 2, "fma": 3}
+# float powers with a literal whole exponent up to this size are unrolled into multiplications
+MAX_UNROLLED_EXPONENT = 16
+BUILTIN_FUNCTIONS = ("print", "fill", "len", "reshape", "transpose", "rows", "cols", "sum", "prod", "min", "max", "dot", *CONVERSION_FUNCTIONS, *MATH_FUNCTIONS)
+REDUCTION_IDENTITIES = {
+    "int": {"sum": 0, "dot": 0, "prod": 1, "min": 2**31 - 1, "max": -2**31},
+    "float": {"sum": 0.0, "dot": 0.0, "prod": 1.0, "min": math.inf, "max": -math.inf},
+}
+
+CTYPES_MAP = {
+    "int": ctypes.c_int32,
+    "i64": ctypes.c_int64,
+    "float": ctypes.c_float,
+    "f64": ctypes.c_double,
+    "bool": ctypes.c_bool,
+}
+
+
+def _wrap_int(value: int) -> int:
+    # int is a 32 bit two's complement integer in compiled code
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+
+def _wrap_long(value: int) -> int:
+    # and i64 a 64 bit one
+    return (value + 0x8000000000000000) % 0x10000000000000000 - 0x8000000000000000
+
+
+def _printed(value, type: str) -> str:
+    # the same text as the print functions of the native runtime
+    match type:
+        case "float" | "f64":
+            return f"{value:.10f}\n"
+        case "int[]" | "float[]":
+            return f"[{', '.join(_printed(element, type[:-2])[:-1] for element in value)}]\n"
+        case "matrix":
+            return "".join(_printed(row, "float[]") for row in value)
+    return f"{int(value)}\n"
+
+
+def _round_float(value: float) -> float:
+    # float is a 32 bit IEEE float in compiled code, where values beyond its range round to infinity
+    try:
+        return struct.unpack("f", struct.pack("f", value))[0]
+    except OverflowError:
+        return math.copysign(math.inf, value)
+
+
+# how results of every numeric type are brought into its range
+ROUNDING = {"int": _wrap_int, "i64": _wrap_long, "float": _round_float, "f64": float}
+
+
+def _int_power(base: int, exponent: int, bits: int = 32) -> int:
+    if exponent < 0:
+        if base == 1: return 1
+        if base == -1: return -1 if exponent % 2 else 1
+        return 0
+    return pow(base, exponent, 1 << bits)
+
+
+def float_power(base: float, type: str, exponent, exponent_type: str, literal: bool) -> float:
+    # base ^ exponent of a float or f64 base as compiled code computes it (see Compiler._float_power): literal whole
+    # exponents up to MAX_UNROLLED_EXPONENT and int exponents are multiplied out by repeated squaring in the type of
+    # the base, with a reciprocal for negative ones, a literal 0.5 is a square root and everything else calls pow
+    rounding = ROUNDING[type]
+    if exponent_type == "int" or literal and float(exponent).is_integer() and abs(exponent) <= MAX_UNROLLED_EXPONENT:
+        magnitude, power, square = abs(int(exponent)), 1.0, base
+        while magnitude:
+            if magnitude & 1:
+                power = rounding(power * square)
+            magnitude >>= 1
+            square = rounding(square * square)
+        if exponent >= 0:
+            return power
+        return rounding(1.0 / power) if power else math.copysign(math.inf, power)
+    if literal and exponent == 0.5:
+        return math.inf if base == -math.inf else rounding(abs(math.sqrt(base))) if base >= 0 else math.nan
+    return rounding(_pow(base, float(exponent)))
+
+
+def _pow(base: float, exponent: float) -> float:
+    # pow of the C library: a zero base with a negative exponent and results beyond the range of a double are
+    # infinities, negative for a negative base and an odd exponent, and a negative base with a fractional exponent is NaN
+    try:
+        return math.pow(base, exponent)
+    except ValueError:
+        if base != 0:
+            return math.nan
+    except OverflowError:
+        pass
+    return math.copysign(math.inf, base) if math.fmod(exponent, 2) in (1, -1) else math.inf
+
+
+def promoted_type(left_type: str, right_type: str) -> str | None:
+    # the type both operands of an arithmetic operator are converted to, see Compiler._promoted_type
+    if left_type not in NUMERIC_TYPES or right_type not in NUMERIC_TYPES:
+        return None
+    if left_type == right_type:
+        return left_type
+    if "float" not in (left_type, right_type) and "f64" not in (left_type, right_type):
+        return "i64"
+    if "f64" in (left_type, right_type) or "i64" in (left_type, right_type):
+        return "f64"
+    return "float"
+
+
+def convert(value, type: str, target: str):
+    # a numeric value as another numeric type, as the conversion instructions of compiled code. Floats are
+    # truncated towards zero and saturate at the limits of the int type, and NaN becomes 0
+    if target in ("int", "i64") and type in ("float", "f64"):
+        limit = 2 ** (31 if target == "int" else 63)
+        value = 0 if math.isnan(value) else limit - 1 if value >= limit else -limit if value <= -limit else int(value)
+    elif target in ("float", "f64"):
+        value = float(value)
+    return ROUNDING[target](value)
+
+
+def _converts_exactly(node: Expression, type: str | None) -> bool:
+    # whether a literal is converted to a type by giving it that type, because the type is wider than its own
+    literal_type = {NodeType.IntegerLiteral: "int", NodeType.FloatLiteral: "float"}.get(node.type())
+    return literal_type is not None and literal_type != type and promoted_type(literal_type, type) == type
+
+
+def implicit_conversion(value, type: str, target: str) -> tuple:
+    # an int or float widened to the target type if that is its promoted type, other values are left unchanged
+    if type != target and promoted_type(type, target) == target:
+        return convert(value, type, target), target
+    return value, type
+
+
+class InterpreterError(Exception):
+    pass
+
+
+class StepBudgetExceeded(InterpreterError):
+    pass
+
+
+def apply_operator(operator: str, left_value, left_type: str, right_value, right_type: str, literal_exponent: bool = False) -> tuple:
+    # a scalar operator with the semantics of compiled code, after converting mixed operands to their promoted type.
+    # literal_exponent is whether the right operand is a literal of the program, see float_power
+    exponent, exponent_type = right_value, right_type
+    type = promoted_type(left_type, right_type)
+    if type is not None and left_type != right_type:
+        left_value, left_type = convert(left_value, left_type, type), type
+        right_value, right_type = convert(right_value, right_type, type), type
+    if left_type in ("int", "i64", "bool") and right_type in ("int", "i64", "bool"):
+        type = "i64" if "i64" in (left_type, right_type) else "int"
+        wrap = ROUNDING[type]
+        match operator:
+            case "+": return wrap(left_value + right_value), type
+            case "-": return wrap(left_value - right_value), type
+            case "*": return wrap(left_value * right_value), type
+            case "/":
+                if right_value == 0:
+                    raise InterpreterError("Integer division by zero.")
+                quotient = abs(left_value) // abs(right_value)
+                return wrap(quotient if (left_value < 0) == (right_value < 0) else -quotient), type
+            case "%":
+                if right_value == 0:
+                    raise InterpreterError("Integer division by zero.")
+                remainder = abs(left_value) % abs(right_value)
+                return wrap(remainder if left_value >= 0 else -remainder), type
+            case "^": return wrap(_int_power(left_value, right_value, 64 if type == "i64" else 32)), type
+    elif left_type in ("float", "f64") and right_type == left_type:
+        type, rounding = left_type, ROUNDING[left_type]
+        match operator:
+            case "+": return rounding(left_value + right_value), type
+            case "-": return rounding(left_value - right_value), type
+            case "*": return rounding(left_value * right_value), type
+            case "/":
+                if right_value == 0:
+                    return rounding(math.copysign(math.inf, left_value) if left_value else math.nan), type
+                return rounding(left_value / right_value), type
+            case "%":
+                return (math.fmod(left_value, right_value) if right_value else math.nan), type
+            case "^":
+                return float_power(left_value, type, exponent, exponent_type, literal_exponent), type
+    else:
+        raise InterpreterError(f"Operator {operator} is not defined for {left_type} and {right_type}.")
+
+    match operator:
+        case "<": return left_value < right_value, "bool"
+        case "<=": return left_value <= right_value, "bool"
+        case ">": return left_value > right_value, "bool"
+        case ">=": return left_value >= right_value, "bool"
+        case "==": return left_value == right_value, "bool"
+        case "!=": return left_value != right_value, "bool"
+    raise InterpreterError(f"Unknown operator {operator}.")
+
+
+def math_type(name: str, types: list[str | None]) -> str | None:
+    # the type of a math function of arguments of the given types, None if it does not take them. abs keeps ints and
+    # every other function works on floats. Arrays and matrices are mapped elementwise with scalars broadcast
+    if len(types) != MATH_ARITIES.get(name, 1):
+        return None
+    aggregates = {type for type in types if type in ("int[]", "float[]", "matrix")}
+    elements = ["float" if type == "matrix" else type[:-2] if type in aggregates else type for type in types]
+    type = elements[0] if elements[0] in NUMERIC_TYPES else None
+    for other in elements[1:]:
+        type = promoted_type(type, other)
+    if type is None:
+        return None
+    if name != "abs" or type not in ("int", "i64"):
+        type = promoted_type(type, "float")
+    if not aggregates:
+        return type
+    if "matrix" in aggregates:
+        return "matrix" if aggregates == {"matrix"} and type == "float" else None
+    return f"{type}[]" if type in ("int", "float") else None
+
+
+def elementwise_type(left_type: str | None, right_type: str | None) -> str | None:
+    # the type of an arithmetic operator with an array or matrix operand, None if it does not take them. The elements
+    # are promoted like scalars, so an int[] and a float give a float[], and the result holds 32 bit values as well
+    types = (left_type, right_type)
+    aggregates = {type for type in types if type in ("int[]", "float[]", "matrix")}
+    if not aggregates:
+        return None
+    type = promoted_type(*["float" if type == "matrix" else type[:-2] if type in aggregates else type for type in types])
+    if "matrix" in aggregates:
+        return "matrix" if type == "float" else None
+    return f"{type}[]" if type in ("int", "float") else None
+
+
+_math_functions: dict[tuple[str, str], ctypes._CFuncPtr] = {}
+
+
+def _libm_function(name: str, type: str):
+    # the libm function of a float or f64 math function, which compiled code calls or LLVM computes the same way
+    if (name, type) not in _math_functions:
+        # the C runtime is part of the process on every platform but Windows, where ucrtbase has the math functions
+        library = ctypes.CDLL(None) if os.name != "nt" else ctypes.CDLL("ucrtbase")
+        function = getattr(library, MATH_FUNCTIONS[name] + ("f" if type == "float" else ""))
+        function.restype = CTYPES_MAP[type]
+        function.argtypes = [CTYPES_MAP[type]] * MATH_ARITIES.get(name, 1)
+        _math_functions[name, type] = function
+    return _math_functions[name, type]
+
+
+def apply_math_function(name: str, arguments: list[tuple]) -> tuple:
+    # a math function of ints and floats, see math_type
+    type = math_type(name, [type for _, type in arguments])
+    if type is None:
+        raise InterpreterError(f"{name} is not defined for {', '.join(type for _, type in arguments)}.")
+    if type in ("int", "i64"):
+        return ROUNDING[type](abs(arguments[0][0])), type
+    return _libm_function(name, type)(*[convert(value, other, type) for value, other in arguments]), type
+
+
+class _Return:
+    def __init__(self, value, type: str) -> None:
+        self.value = value
+        self.type = type
+
+
+class _Function:
+    def __init__(self, node: FunctionStatement, environment: Environment) -> None:
+        self.node = node
+        self.environment = environment
+        self.calls = 0
+        self.back_edges = 0
+        self.native = None
+        self.promotable = True
+
+    @property
+    def heat(self) -> int:
+        return self.calls + self.back_edges
+
+
+class Interpreter:
+    # tree-walking interpreter over the AST. Functions count their calls and loop back-edges, and once a function
+    # gets hot it is compiled through the Compiler together with the functions it calls and switched to native code.
+    # compiler_options are passed to every Compiler that does this, such as fast_math
+    def __init__(self, hot_threshold: int = DEFAULT_HOT_THRESHOLD, opt_level: int = 2, jit: bool = True, step_budget: int | None = None, pure: bool = False, compiler_options: dict | None = None) -> None:
+        self.hot_threshold = hot_threshold
+        self.opt_level = opt_level
+        self.jit = jit
+        self.compiler_options = compiler_options or {}
+        # with a step budget, executing more statements than that raises StepBudgetExceeded
+        self.step_budget = step_budget
+        self.steps = 0
+        # pure says that every function only depends on its arguments, so the results of calls with scalar
+        # arguments are cached (see Compiler._evaluate_at_compile_time)
+        self._results: dict[tuple, object] | None = {} if pure else None
+        self.environment = Environment(records={})
+        self.environment.define("true", True, "bool")
+        self.environment.define("false", False, "bool")
+        self.functions: dict[str, _Function] = {}
+        self.current_function: _Function | None = None
+        self.promoted: list[str] = []
+        self._engines = []
+
+    def check(self, program: Program) -> list[str]:
+        # the undefined, duplicate and foreign names the Compiler reports for the program, see Resolver. run does not
+        # check them, since compile-time evaluation runs functions the Compiler has already resolved
+        from Resolver import Resolver
+        return Resolver(self.environment).resolve(program)
+
+    def run(self, program: Program) -> None:
+        self._execute(program)
+        sys.stdout.flush()
+
+    def evaluate(self, node: Expression):
+        # the value of an expression in the global scope, such as a call of a function defined by run
+        return self._evaluate(node)[0]
+
+    def _execute(self, node: Statement):
+        self.steps += 1
+        if self.step_budget is not None and self.steps > self.step_budget:
+            raise StepBudgetExceeded(f"More than {self.step_budget} steps executed.")
+        match node.type():
+            case NodeType.Program:
+                for statement in node.statements:
+                    self._execute(statement)
+            case NodeType.ExpressionStatement:
+                if node.expression.type() == NodeType.IfStatement:
+                    return self._execute(node.expression)
+                self._evaluate(node.expression)
+            case NodeType.VarStatement:
+                self._execute_var_statement(node)
+            case NodeType.FunctionStatement:
+                self._execute_function_statement(node)
+            case NodeType.BlockStatement:
+                for statement in node.statements:
+                    result = self._execute(statement)
+                    if result is not None:
+                        return result
+            case NodeType.ReturnStatement:
+                if self.current_function is None:
+                    return _Return(*self._evaluate(node.return_value))
+                return _Return(*self._evaluate_converted(node.return_value, self.current_function.node.return_type))
+            case NodeType.AssignStatement:
+                self._execute_assign_statement(node)
+            case NodeType.IfStatement:
+                test, _ = self._evaluate(node.condition)
+                if test:
+                    return self._execute(node.consequence)
+                elif node.alternative:
+                    return self._execute(node.alternative)
+            case NodeType.WhileStatement:
+                return self._execute_while_statement(node)
+            case NodeType.ForStatement:
+                return self._execute_for_statement(node)
+            case NodeType.IndexAssignStatement:
+                self._execute_index_assign_statement(node)
+        return None
+
+    def _execute_var_statement(self, node: VarStatement) -> None:
+        value, type = self._evaluate(node.value, node.value_type)
+        value, _ = implicit_conversion(value, type, node.value_type)
+        self.environment.define(node.name.value, value, node.value_type)
+
+    def _execute_function_statement(self, node: FunctionStatement) -> None:
+        function = _Function(node, self.environment)
+        self.functions[node.name.value] = function
+        self.environment.define(node.name.value, function, node.return_type)
+
+    def _execute_assign_statement(self, node: AssignStatement) -> None:
+        name = node.identifier.value
+        record = self.environment.lookup(name)
+        if record is None:
+            raise InterpreterError(f"Identifier {name} was not declared before re-assignment.")
+        value, type = self._evaluate_converted(node.expression, record[1])
+        if type != record[1]:
+            raise InterpreterError(f"Identifier {name} of type {record[1]} tried to be re-assigned to {type}.")
+        self.environment.assign(name, value)
+
+    def _execute_index_assign_statement(self, node: IndexAssignStatement) -> None:
+        array, type = self._evaluate(node.array)
+        index, _ = self._evaluate(node.index)
+        value, value_type = self._evaluate(node.expression)
+        if not type.endswith("[]"):
+            raise InterpreterError(f"Only arrays can be indexed, and only with an int.")
+        value, value_type = implicit_conversion(value, value_type, type[:-2])
+        if value_type != type[:-2]:
+            raise InterpreterError(f"Element of type {type[:-2]} tried to be assigned a value of type {value_type}.")
+        array[index] = value
+
+    def _execute_while_statement(self, node: WhileStatement):
+        function = self.current_function
+        while self._evaluate(node.condition)[0]:
+            result = self._execute(node.body)
+            if result is not None:
+                return result
+            if function is not None:
+                function.back_edges += 1
+        return None
+
+    def _execute_for_statement(self, node: ForStatement):
+        # a parallel for runs its iterations in order, which is one of the orders the compiled loop may use
+        function = self.current_function
+        start, start_type = self._evaluate(node.start)
+        stop, stop_type = self._evaluate(node.stop)
+        if start_type != "int" or stop_type != "int":
+            raise InterpreterError("The bounds of a for loop must be ints.")
+        name = node.variable.value
+        slot = self.environment.slot(name)
+        previous = self.environment.resolve(0, slot)
+        for index in range(start, stop):
+            self.environment.set(slot, (index, "int"))
+            result = self._execute(node.body)
+            if result is not None:
+                if node.schedule is not None:
+                    raise InterpreterError("A parallel for cannot return from its function.")
+                return result
+            if function is not None:
+                function.back_edges += 1
+        # the loop variable only exists in the body
+        self.environment.set(slot, previous)
+        return None
+
+    def _evaluate(self, node: Expression, value_type: str = None) -> tuple:
+        match node.type():
+            case NodeType.IntegerLiteral:
+                if value_type in NUMERIC_TYPES:
+                    return convert(node.value, "i64", value_type), value_type
+                return _wrap_int(node.value), "int" if value_type is None else value_type
+            case NodeType.FloatLiteral:
+                if value_type in NUMERIC_TYPES:
+                    return convert(node.value, "f64", value_type), value_type
+                return _round_float(node.value), "float" if value_type is None else value_type
+            case NodeType.BooleanLiteral:
+                return node.value, "bool" if value_type is None else value_type
+            case NodeType.IdentifierLiteral:
+                record = self.environment.lookup(node.value)
+                if record is None:
+                    raise InterpreterError(f"Identifier {node.value} is not defined.")
+                return record
+            case NodeType.InfixExpression:
+                return self._evaluate_infix_expression(node)
+            case NodeType.CallExpression:
+                return self._evaluate_call_expression(node)
+            case NodeType.IfStatement:
+                self._execute(node)
+                return None, None
+            case NodeType.ArrayLiteral:
+                element_type = value_type[:-2] if value_type is not None and value_type.endswith("[]") else None
+                elements = [self._evaluate(element, element_type) for element in node.elements]
+                if element_type is None:
+                    if not elements:
+                        raise InterpreterError("The type of an empty array literal must be declared.")
+                    element_type = elements[0][1]
+                return [value for value, _ in elements], f"{element_type}[]"
+            case NodeType.IndexExpression:
+                array, type = self._evaluate(node.array)
+                index, _ = self._evaluate(node.index)
+                if type == "matrix":
+                    return array[index], "float[]"
+                if not type.endswith("[]"):
+                    raise InterpreterError(f"Only arrays can be indexed, and only with an int.")
+                return array[index], type[:-2]
+        raise InterpreterError(f"Cannot evaluate {node.type().value}.")
+
+    def _evaluate_converted(self, node: Expression, type: str) -> tuple:
+        # see Compiler._resolve_converted
+        if _converts_exactly(node, type):
+            return self._evaluate(node, type)
+        return implicit_conversion(*self._evaluate(node), type)
+
+    def _evaluate_infix_expression(self, node: InfixExpression) -> tuple:
+        left_value, left_type = self._evaluate(node.left_node)
+        right_value, right_type = self._evaluate(node.right_node)
+        # a literal is exact in the wider type of the other operand, see Compiler._visit_infix_expression
+        if _converts_exactly(node.left_node, right_type):
+            left_value, left_type = self._evaluate(node.left_node, right_type)
+        if _converts_exactly(node.right_node, left_type):
+            right_value, right_type = self._evaluate(node.right_node, left_type)
+        literal_exponent = node.right_node.type() in (NodeType.IntegerLiteral, NodeType.FloatLiteral)
+        if node.operator == "@":
+            return self._apply_matmul(left_value, left_type, right_value, right_type)
+        if "matrix" in (left_type, right_type):
+            return self._apply_matrix_elementwise(node.operator, left_value, left_type, right_value, right_type, literal_exponent)
+        if left_type.endswith("[]") or right_type.endswith("[]"):
+            return self._apply_elementwise(node.operator, left_value, left_type, right_value, right_type, literal_exponent)
+        return apply_operator(node.operator, left_value, left_type, right_value, right_type, literal_exponent)
+
+    def _apply_elementwise(self, operator: str, left_value, left_type: str, right_value, right_type: str, literal_exponent: bool = False) -> tuple:
+        # scalar operands are broadcast over the array operands
+        if operator not in ("+", "-", "*", "/", "%", "^"):
+            raise InterpreterError(f"Operator {operator} is not defined for arrays.")
+        type = elementwise_type(left_type, right_type)
+        if type is None:
+            raise InterpreterError(f"Operator {operator} is not defined for {left_type} and {right_type}.")
+        length = len(left_value) if left_type.endswith("[]") else len(right_value)
+        if left_type.endswith("[]") and right_type.endswith("[]") and len(left_value) != len(right_value):
+            raise InterpreterError("Array lengths do not match.")
+        lefts = left_value if left_type.endswith("[]") else [left_value] * length
+        rights = right_value if right_type.endswith("[]") else [right_value] * length
+        left_element_type, right_element_type = left_type.removesuffix("[]"), right_type.removesuffix("[]")
+        return [apply_operator(operator, left, left_element_type, right, right_element_type, literal_exponent)[0] for left, right in zip(lefts, rights)], type
+
+    def _apply_matrix_elementwise(self, operator: str, left_value, left_type: str, right_value, right_type: str, literal_exponent: bool = False) -> tuple:
+        # matrices are lists of rows, so they are combined row by row
+        if left_type.endswith("[]") or right_type.endswith("[]"):
+            raise InterpreterError("Arrays and matrices cannot be combined elementwise.")
+        if elementwise_type(left_type, right_type) is None:
+            raise InterpreterError(f"Operator {operator} is not defined for {left_type} and {right_type}.")
+        if left_type == right_type == "matrix" and (len(left_value) != len(right_value) or any(len(left) != len(right) for left, right in zip(left_value, right_value))):
+            raise InterpreterError("Matrix shapes do not match.")
+        rows = len(left_value) if left_type == "matrix" else len(right_value)
+        lefts = left_value if left_type == "matrix" else [left_value] * rows
+        rights = right_value if right_type == "matrix" else [right_value] * rows
+        row_type = lambda type: "float[]" if type == "matrix" else type
+        return [self._apply_elementwise(operator, left, row_type(left_type), right, row_type(right_type), literal_exponent)[0] for left, right in zip(lefts, rights)], "matrix"
+
+    def _apply_matmul(self, left_value, left_type: str, right_value, right_type: str) -> tuple:
+        if left_type != "matrix" or right_type not in ("matrix", "float[]"):
+            raise InterpreterError(f"Operator @ is not defined for {left_type} and {right_type}.")
+        depth = len(left_value[0]) if left_value else 0
+        if right_type == "float[]":
+            if len(right_value) != depth:
+                raise InterpreterError("Matrix and vector shapes do not match.")
+            return [_round_float(sum(a * x for a, x in zip(row, right_value))) for row in left_value], "float[]"
+        if len(right_value) != depth:
+            raise InterpreterError("Matrix shapes do not match.")
+        columns = list(zip(*right_value))
+        return [[_round_float(sum(a * b for a, b in zip(row, column))) for column in columns] for row in left_value], "matrix"
+
+    def _evaluate_call_expression(self, node: CallExpression) -> tuple:
+        arguments = [self._evaluate(expression) for expression in node.parameters]
+
+        if node.name.value == "print":
+            for value, type in arguments:
+                sys.stdout.write(_printed(value, type))
+            return None, None
+        if node.name.value == "fill":
+            if len(arguments) == 3:
+                (rows, _), (columns, _), (value, _) = arguments
+                return [[value] * columns for _ in range(rows)], "matrix"
+            (length, _), (value, type) = arguments
+            return [value] * length, f"{type}[]"
+        if node.name.value == "reshape":
+            # unlike compiled code, the matrix does not share the elements of the array
+            (array, _), (rows, _), (columns, _) = arguments
+            if rows * columns != len(array):
+                raise InterpreterError("Array length does not match the matrix shape.")
+            return [array[row * columns:(row + 1) * columns] for row in range(rows)], "matrix"
+        if node.name.value == "transpose":
+            return [list(column) for column in zip(*arguments[0][0])], "matrix"
+        if node.name.value in ("rows", "cols"):
+            matrix = arguments[0][0]
+            return len(matrix) if node.name.value == "rows" else len(matrix[0]) if matrix else 0, "int"
+        if node.name.value == "len":
+            return len(arguments[0][0]), "int"
+        if node.name.value in ("sum", "prod", "min", "max", "dot"):
+            return self._reduce(node.name.value, arguments)
+        if node.name.value in CONVERSION_FUNCTIONS:
+            if len(arguments) != 1 or arguments[0][1] not in NUMERIC_TYPES:
+                raise InterpreterError(f"{node.name.value} converts one int or float.")
+            (value, type), = arguments
+            return convert(value, type, node.name.value), node.name.value
+        if node.name.value in MATH_FUNCTIONS:
+            return self._math_function(node.name.value, arguments)
+
+        record = self.environment.lookup(node.name.value)
+        if record is None or not isinstance(record[0], _Function):
+            raise InterpreterError(f"Function {node.name.value} is not defined.")
+        function, return_type = record
+        # literal arguments are exact in the parameter types, like in compiled calls
+        arguments = [self._evaluate(expression, parameter.value_type) if _converts_exactly(expression, parameter.value_type) else argument for expression, argument, parameter in zip(node.parameters, arguments, function.node.parameters)] + arguments[len(function.node.parameters):]
+        function.calls += 1
+        if function.native is None and self.jit and function.promotable and function.heat >= self.hot_threshold:
+            self._promote(function)
+        if function.native is not None:
+            return self._call_native(function, [value for value, _ in arguments]), return_type
+        if self._results is not None and all(type in CTYPES_MAP for _, type in arguments):
+            # repr tells -0.0 from 0.0, which compare equal
+            key = (node.name.value, *[repr(value) for value, _ in arguments])
+            if key not in self._results:
+                self._results[key] = self._call_interpreted(function, arguments)
+            return self._results[key], return_type
+        return self._call_interpreted(function, arguments), return_type
+
+    def _reduce(self, name: str, arguments: list[tuple]) -> tuple:
+        # float sums are computed exactly and rounded once, so they can differ from the compiled blocked sums in the
+        # last bits
+        if name in ("min", "max") and len(arguments) == 2:
+            (a, type), (b, other_type) = arguments
+            if promoted_type(type, other_type) is not None:
+                type = promoted_type(type, other_type)
+                a, b = convert(a, arguments[0][1], type), convert(b, other_type, type)
+            return (min if name == "min" else max)(a, b), type
+        values, type = arguments[0]
+        if type == "matrix":
+            values, element_type = [value for row in values for value in row], "float"
+        else:
+            element_type = type[:-2]
+        if name == "dot":
+            other = arguments[1][0]
+            if len(other) != len(values):
+                raise InterpreterError("Array lengths do not match.")
+            values = [a * b for a, b in zip(values, other)]
+        identity = REDUCTION_IDENTITIES[element_type][name]
+        match name:
+            case "sum" | "dot":
+                result = math.fsum(values) if element_type == "float" else sum(values)
+            case "prod":
+                result = math.prod(values, start=identity)
+            case "min":
+                result = min(values, default=identity)
+            case "max":
+                result = max(values, default=identity)
+        return (_round_float(result) if element_type == "float" else _wrap_int(result)), element_type
+
+    def _math_function(self, name: str, arguments: list[tuple]) -> tuple:
+        # arrays and matrices are mapped elementwise, matrices as arrays of all their elements
+        type = math_type(name, [type for _, type in arguments])
+        if type not in ("int[]", "float[]", "matrix"):
+            return apply_math_function(name, arguments)
+        shapes = {(len(value), len(value[0]) if value else 0) for value, argument_type in arguments if argument_type == "matrix"}
+        if len(shapes) > 1:
+            raise InterpreterError("Matrix shapes do not match.")
+        columns = []
+        for value, argument_type in arguments:
+            if argument_type == "matrix":
+                columns.append(([element for row in value for element in row], "float"))
+            elif argument_type.endswith("[]"):
+                columns.append((value, argument_type[:-2]))
+            else:
+                columns.append(None)
+        lengths = {len(column[0]) for column in columns if column is not None}
+        if len(lengths) > 1:
+            raise InterpreterError("Array lengths do not match.")
+        length, = lengths
+        result = [apply_math_function(name, [(column[0][i], column[1]) if column is not None else argument for column, argument in zip(columns, arguments)])[0] for i in range(length)]
+        if type == "matrix":
+            rows, cols = shapes.pop()
+            return [result[row * cols:(row + 1) * cols] for row in range(rows)], type
+        return result, type
+
+    def _call_interpreted(self, function: _Function, arguments: list[tuple]):
+        parameters = function.node.parameters
+        if len(parameters) != len(arguments):
+            raise InterpreterError(f"Function {function.node.name.value} expects {len(parameters)} arguments, got {len(arguments)}.")
+
+        previous_environment, previous_function = self.environment, self.current_function
+        self.environment = Environment({}, function.environment, name=function.node.name.value)
+        self.current_function = function
+        for parameter, (value, type) in zip(parameters, arguments):
+            self.environment.define(parameter.name, implicit_conversion(value, type, parameter.value_type)[0], parameter.value_type)
+        try:
+            result = self._execute(function.node.body)
+        finally:
+            self.environment, self.current_function = previous_environment, previous_function
+        return result.value if result is not None else None
+
+    def _call_native(self, function: _Function, arguments: list):
+        # interpreter and native prints go through different stdout buffers
+        import JIT
+        sys.stdout.flush()
+        result = function.native(*arguments)
+        JIT.flush_output()
+        return result
+
+    def _callees(self, function: _Function) -> list[_Function] | None:
+        # the function and every function it calls transitively, or None if one of them is not known globally
+        found: dict[str, _Function] = {}
+        pending = [function]
+        while pending:
+            current = pending.pop()
+            if current.node.name.value in found: continue
+            found[current.node.name.value] = current
+            for name in _called_names(current.node.body):
+                if name in BUILTIN_FUNCTIONS or name in found: continue
+                callee = self.functions.get(name)
+                if callee is None or not callee.promotable: return None
+                pending.append(callee)
+        return list(found.values())
+
+    def _promote(self, function: _Function) -> None:
+        import llvmlite.binding as llvm
+        from Compiler import Compiler
+        import JIT
+
+        functions = self._callees(function)
+        if functions is None or any(type not in CTYPES_MAP for f in functions for type in [f.node.return_type] + [parameter.value_type for parameter in f.node.parameters]):
+            function.promotable = False
+            return
+        # callees first so that every call resolves to an already defined function
+        functions.sort(key=lambda f: self._definition_order(f))
+        try:
+            compiler = Compiler(**self.compiler_options)
+            compiler.compile(Program([f.node for f in functions]))
+            if compiler.errors:
+                raise InterpreterError("\n".join(compiler.errors))
+            compiler.module.triple = llvm.get_default_triple()
+            engine = JIT.create_engine(compiler.module, opt_level=self.opt_level)
+        except Exception:
+            function.promotable = False
+            return
+
+        self._engines.append(engine)
+        for f in functions:
+            if f.native is not None: continue
+            address = engine.get_function_address(f.node.name.value)
+            signature = ctypes.CFUNCTYPE(CTYPES_MAP[f.node.return_type], *[CTYPES_MAP[parameter.value_type] for parameter in f.node.parameters])
+            f.native = signature(address)
+            self.promoted.append(f.node.name.value)
+
+    def _definition_order(self, function: _Function) -> int:
+        return list(self.functions).index(function.node.name.value)
+
+
+def _called_names(node: Node) -> set[str]:
+    names = set()
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        if current is None: continue
+        match current.type():
+            case NodeType.CallExpression:
+                names.add(current.name.value)
+                pending.extend(current.parameters)
+            case NodeType.BlockStatement | NodeType.Program:
+                pending.extend(current.statements)
+            case NodeType.ExpressionStatement:
+                pending.append(current.expression)
+            case NodeType.VarStatement:
+                pending.append(current.value)
+            case NodeType.AssignStatement:
+                pending.append(current.expression)
+            case NodeType.ReturnStatement:
+                pending.append(current.return_value)
+            case NodeType.IfStatement:
+                pending.extend([current.condition, current.consequence, current.alternative])
+            case NodeType.WhileStatement:
+                pending.extend([current.condition, current.body])
+            case NodeType.ForStatement:
+                pending.extend([current.start, current.stop, current.chunk, current.body])
+            case NodeType.InfixExpression:
+                pending.extend([current.left_node, current.right_node])
+            case NodeType.FunctionStatement:
+                pending.append(current.body)
+            case NodeType.IndexExpression:
+                pending.extend([current.array, current.index])
+            case NodeType.IndexAssignStatement:
+                pending.extend([current.array, current.index, current.expression])
+            case NodeType.ArrayLiteral:
+                pending.extend(current.elements)
+    return names
@@ -0,0 +1,138 @@
+import ctypes
+from llvmlite import ir
+import llvmlite.binding as llvm
+
+import Runtime
+
+
+OPTIMIZATION_LEVELS = (0, 1, 2, 3)
+DEFAULT_OPTIMIZATION_LEVEL = 2
+
+_initialised = False
+_runtime_engine = None
+
+try:
+    _libc = ctypes.CDLL(None)
+except OSError:
+    _libc = ctypes.cdll.msvcrt
+
+
+def initialise() -> None:
+    global _initialised
+    if _initialised: return
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+    _initialised = True
+
+
+def create_target_machine(opt_level: int = DEFAULT_OPTIMIZATION_LEVEL, reloc: str = "default") -> llvm.TargetMachine:
+    # codegen optimization level matches the IR pipeline level
+    initialise()
+    target = llvm.Target.from_default_triple()
+    return target.create_target_machine(
+        cpu=llvm.get_host_cpu_name(),
+        features=llvm.get_host_cpu_features().flatten(),
+        opt=opt_level,
+        reloc=reloc,
+    )
+
+
+def optimize(module: llvm.ModuleRef, target_machine: llvm.TargetMachine, opt_level: int = DEFAULT_OPTIMIZATION_LEVEL) -> None:
+    # runs LLVM's default<On> pipeline in place: from -O1 upwards mem2reg (SROA), instcombine, GVN, inlining
+    # and loop unrolling, from -O2 upwards also the loop and SLP vectorizers. -O0 leaves the module untouched.
+    if opt_level not in OPTIMIZATION_LEVELS:
+        raise ValueError(f"Optimization level must be one of {OPTIMIZATION_LEVELS}, got {opt_level}.")
+    if opt_level == 0:
+        return
+
+    tuning_options = llvm.create_pipeline_tuning_options(speed_level=opt_level, size_level=0)
+    tuning_options.loop_unrolling = True
+    tuning_options.loop_vectorization = opt_level >= 2
+    tuning_options.slp_vectorization = opt_level >= 2
+    tuning_options.loop_interleaving = opt_level >= 2
+
+    pass_builder = llvm.create_pass_builder(target_machine, tuning_options)
+    pass_manager = pass_builder.getModulePassManager()
+    pass_manager.run(module, pass_builder)
+
+
+def load_runtime() -> llvm.ExecutionEngine:
+    # the runtime is compiled once per process and its functions are registered as symbols, so every engine links
+    # against the same thread pool
+    global _runtime_engine
+    if _runtime_engine is None:
+        module = Runtime.runtime_module()
+        module.triple = llvm.get_default_triple()
+        _runtime_engine = create_engine(module)
+        for name in Runtime.EXPORTED:
+            llvm.add_symbol(name, _runtime_engine.get_function_address(name))
+    return _runtime_engine
+
+
+def set_threads(threads: int) -> None:
+    # threads of parallel for loops from the next one on, 0 goes back to CALCLITE_THREADS or the number of processors
+    engine = load_runtime()
+    ctypes.CFUNCTYPE(None, ctypes.c_int32)(engine.get_function_address(Runtime.SET_THREADS))(threads)
+
+
+def uses_runtime(module: ir.Module) -> bool:
+    functions = [module.globals.get(name) for name in Runtime.EXPORTED]
+    return any(function is not None and function.is_declaration for function in functions)
+
+
+def parse_module(module: ir.Module) -> llvm.ModuleRef:
+    parsed_module = llvm.parse_assembly(str(module))
+    parsed_module.verify()
+    return parsed_module
+
+
+def create_engine(module: ir.Module, opt_level: int = DEFAULT_OPTIMIZATION_LEVEL, notify_object=None) -> llvm.ExecutionEngine:
+    # the engine owns the machine code, so keep it alive while any function address taken from it is in use.
+    # notify_object is called with the emitted object code, e.g. to store it in a Cache.ObjectCache
+    if uses_runtime(module):
+        load_runtime()
+    target_machine = create_target_machine(opt_level)
+    parsed_module = parse_module(module)
+    optimize(parsed_module, target_machine, opt_level)
+
+    engine = llvm.create_mcjit_compiler(parsed_module, target_machine)
+    if notify_object is not None:
+        engine.set_object_cache(notify_func=lambda _, data: notify_object(data))
+    engine.finalize_object()
+    return engine
+
+
+def create_empty_engine(opt_level: int = DEFAULT_OPTIMIZATION_LEVEL) -> llvm.ExecutionEngine:
+    # an engine without code, which modules and object files are added to later
+    return llvm.create_mcjit_compiler(llvm.parse_assembly(""), create_target_machine(opt_level))
+
+
+def load_engine(object_data: bytes, opt_level: int = DEFAULT_OPTIMIZATION_LEVEL) -> llvm.ExecutionEngine:
+    # links previously emitted object code into an engine without running the front end or the pass pipeline
+    if any(name.encode("utf-8") in object_data for name in Runtime.EXPORTED):
+        load_runtime()
+    engine = create_empty_engine(opt_level)
+    engine.add_object_file(llvm.ObjectFileRef.from_data(object_data))
+    engine.finalize_object()
+    return engine
+
+
+def add_module(engine: llvm.ExecutionEngine, module: ir.Module, opt_level: int = DEFAULT_OPTIMIZATION_LEVEL) -> None:
+    # compiles another module into a running engine, its external symbols resolve against the modules already in it.
+    # Modules are optimized separately, so nothing is inlined across them
+    if uses_runtime(module):
+        load_runtime()
+    target_machine = create_target_machine(opt_level)
+    parsed_module = parse_module(module)
+    optimize(parsed_module, target_machine, opt_level)
+    engine.add_module(parsed_module)
+    engine.finalize_object()
+
+
+def flush_output() -> None:
+    # native code prints through the output buffer of its thread in the runtime, which is separate from sys.stdout.
+    # This writes out the buffer of the calling thread, workers of the pool write out theirs after every job
+    _libc.fflush(None)
+    if _runtime_engine is not None:
+        ctypes.CFUNCTYPE(None)(_runtime_engine.get_function_address(Runtime.FLUSH))()
@@ -0,0 +1,96 @@
+import os
+import sys
+import ctypes
+import llvmlite.binding as llvm
+from time import perf_counter
+
+from AST import NodeType, Program, FunctionStatement
+from Compiler import Compiler, DEFAULT_COMPILE_TIME_STEPS
+from Interpreter import CTYPES_MAP
+import JIT
+
+
+class LazyJIT:
+    # the top level code is compiled into main right away, but every top level function gets its own module that is
+    # only generated, optimized and linked into the engine on the first call. Until then calls go through a function
+    # pointer that points at a ctypes stub, which compiles the function and redirects the pointer to the native code,
+    # so later calls cost one indirect call and functions that never run are never compiled. Functions whose
+    # signature ctypes cannot express, such as ones taking arrays, are compiled into main up front. Every module is
+    # compiled with the same options, and the modules share the step budget of compile-time evaluation
+    def __init__(self, program: Program, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL, fast_reductions: bool = False, fast_math: tuple[str, ...] = (), compile_time_steps: int = DEFAULT_COMPILE_TIME_STEPS) -> None:
+        self.program = program
+        self.opt_level = opt_level
+        self.fast_reductions = fast_reductions
+        self.fast_math = fast_math
+        self.compile_time_steps = compile_time_steps if opt_level > 0 else 0
+        self.functions: dict[str, FunctionStatement] = {}
+        self.compiled: dict[str, float] = {} # name to codegen and JIT time in seconds
+        self.errors: list[str] = []
+        self.engine = None
+        self._signatures = {}
+        self._stubs = {}
+
+    def load(self) -> bool:
+        for statement in self.program.statements:
+            if statement.type() == NodeType.FunctionStatement:
+                self.functions[statement.name.value] = statement
+        for name, node in self.functions.items():
+            if any(type not in CTYPES_MAP for type in [node.return_type] + [parameter.value_type for parameter in node.parameters]):
+                continue
+            signature = ctypes.CFUNCTYPE(CTYPES_MAP[node.return_type], *[CTYPES_MAP[parameter.value_type] for parameter in node.parameters])
+            self._signatures[name] = signature
+            self._stubs[name] = signature(self._stub(name))
+        addresses = {name: ctypes.cast(stub, ctypes.c_void_p).value for name, stub in self._stubs.items()}
+        compiler = self._compiler(function_addresses=addresses)
+        compiler.compile(node=self.program)
+        self.compile_time_steps = compiler.compile_time_steps
+        if compiler.errors:
+            self.errors.extend(compiler.errors)
+            return False
+        compiler.module.triple = llvm.get_default_triple()
+        self.engine = JIT.create_engine(compiler.module, opt_level=self.opt_level)
+        return True
+
+    def run(self) -> int:
+        main = ctypes.CFUNCTYPE(ctypes.c_int)(self.engine.get_function_address("main"))
+        result = main()
+        # prints of lazily compiled functions are not written out by main, which only knows its own
+        JIT.flush_output()
+        return result
+
+    def _compiler(self, function_addresses: dict[str, int] | None = None) -> Compiler:
+        return Compiler(function_addresses=function_addresses, fast_reductions=self.fast_reductions, fast_math=self.fast_math, compile_time_steps=self.compile_time_steps)
+
+    def _stub(self, name: str):
+        def stub(*arguments):
+            if name not in self.compiled:
+                self._compile(name)
+            return self._signatures[name](self.engine.get_function_address(name))(*arguments)
+        return stub
+
+    def _compile(self, name: str) -> None:
+        start = perf_counter()
+        node = self.functions[name]
+        compiler = self._compiler()
+        # like in a single module, a function sees the functions defined before it and itself
+        for other in self.functions:
+            if other == name: break
+            if other in self._stubs:
+                compiler.declare_function_pointer(self.functions[other])
+            else:
+                compiler.declare_function(self.functions[other])
+        compiler.compile(node=node)
+        self.compile_time_steps = compiler.compile_time_steps
+        if compiler.errors:
+            # the stub runs inside native code, so an exception could not unwind through it
+            JIT.flush_output()
+            for error in compiler.errors:
+                print(error)
+            sys.stdout.flush()
+            os._exit(1)
+        compiler.module.triple = llvm.get_default_triple()
+        JIT.add_module(self.engine, compiler.module, opt_level=self.opt_level)
+
+        pointer = self.engine.get_global_value_address(f"{name}.address")
+        ctypes.c_void_p.from_address(pointer).value = self.engine.get_function_address(name)
+        self.compiled[name] = perf_counter() - start
@@ -34,6 +34,9 @@ class Lexer:
         number = ""
         comma_counter = 0
         while self._is_number() or self.current_character == ".":
+            # the range 0..n is the integer 0 followed by ..
+            if self.current_character == "." and self._peek_character() == ".":
+                break
             if self.current_character == ".":
                 comma_counter += 1
             number += self.current_character
@@ -74,6 +77,8 @@ class Lexer:
                 token = self._create_token(TokenType.EXPONENT, self.current_character)
             case "%":
                 token = self._create_token(TokenType.MODULO, self.current_character)
+            case "@":
+                token = self._create_token(TokenType.AT, self.current_character)
             case "=":
                 if self._peek_character() == "=":
                     self._next_character()
@@ -110,6 +115,16 @@ class Lexer:
                 token = self._create_token(TokenType.LBRACE, self.current_character)
             case "}":
                 token = self._create_token(TokenType.RBRACE, self.current_character)
+            case "[":
+                token = self._create_token(TokenType.LBRACKET, self.current_character)
+            case "]":
+                token = self._create_token(TokenType.RBRACKET, self.current_character)
+            case ".":
+                if self._peek_character() == ".":
+                    self._next_character()
+                    token = self._create_token(TokenType.DOTDOT, "..")
+                else:
+                    token = self._create_token(TokenType.EXCEPTION, self.current_character)
             case "\n":
                 token = self._create_token(TokenType.EOL, self.current_character)
                 self.line_number += 1
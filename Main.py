@@ -1,12 +1,24 @@
-from Lexer import Lexer
+from TableLexer import TableLexer
 from Parser import Parser
-from Compiler import Compiler
+from Compiler import Compiler, DEFAULT_COMPILE_TIME_STEPS, FAST_MATH_FLAGS
+from Optimizer import Optimizer
+import ASTArena
+import AOT
 from Token import TokenType
+import JIT
+import Runtime
+from Interpreter import Interpreter, InterpreterError, DEFAULT_HOT_THRESHOLD
+from LazyJIT import LazyJIT
+from REPL import REPL
+from Cache import ObjectCache, DEFAULT_CACHE_DIRECTORY, DEFAULT_MAX_SIZE
 
+import os
+import sys
 import json
+import argparse
 from llvmlite import ir
 import llvmlite.binding as llvm
-from ctypes import CFUNCTYPE, c_int, c_float
+from ctypes import CFUNCTYPE, c_int, c_int64, c_float
 from time import perf_counter
 
 
@@ -16,66 +28,175 @@ if __name__ == "__main__":
     DEBUG_COMPILER = False
     RUN_CODE = True
 
-    with open("Testing/Test.txt", "r") as f:
-        code = f.read()
+    argument_parser = argparse.ArgumentParser(description="Compile and run a CalcLite program.")
+    argument_parser.add_argument("file", nargs="?", default="Testing/Test.txt", help="CalcLite source, or a binary AST written by --emit-ast")
+    argument_parser.add_argument("-O", dest="opt_level", type=int, choices=JIT.OPTIMIZATION_LEVELS, default=JIT.DEFAULT_OPTIMIZATION_LEVEL, help="optimization level")
+    argument_parser.add_argument("--emit", choices=AOT.OUTPUT_KINDS, help="compile ahead of time to an object file, shared library or executable instead of running")
+    argument_parser.add_argument("-o", dest="output", help="output path for --emit")
+    argument_parser.add_argument("--emit-ast", metavar="PATH", help="write the parsed program as a binary AST and exit")
+    argument_parser.add_argument("--tiered", action="store_true", help="start in the interpreter and JIT compile hot functions")
+    argument_parser.add_argument("--hot-threshold", type=int, default=DEFAULT_HOT_THRESHOLD, help="calls plus loop iterations before a function is compiled")
+    argument_parser.add_argument("--lazy", action="store_true", help="compile each function on its first call instead of up front")
+    argument_parser.add_argument("--repl", action="store_true", help="start an interactive session instead of running a file")
+    argument_parser.add_argument("--time", action="store_true", help="print how long every REPL entry took to compile and run")
+    argument_parser.add_argument("--fast-reductions", action="store_true", help="let float reductions be reordered, which vectorizes reduce loops but changes rounding")
+    argument_parser.add_argument("--fast-math", nargs="?", const="reassoc,contract", default="", metavar="FLAGS", help=f"comma separated fast-math flags for all float arithmetic, some of {','.join(FAST_MATH_FLAGS)} or fast for all (default: reassoc,contract)")
+    argument_parser.add_argument("--compile-time-steps", type=int, default=DEFAULT_COMPILE_TIME_STEPS, metavar="N", help="statements the compiler may interpret to evaluate pure calls with literal arguments, 0 turns this off")
+    argument_parser.add_argument("--ast-stats", action="store_true", help="print how many AST nodes the optimizer removed")
+    argument_parser.add_argument("--memo-stats", action="store_true", help="count and print the cache hits and misses of @memo functions")
+    argument_parser.add_argument("--threads", type=int, help="threads of parallel for loops (default: CALCLITE_THREADS or the number of processors)")
+    argument_parser.add_argument("--output", choices=Runtime.OUTPUT_MODES, help="when printed output is written (default: CALCLITE_OUTPUT, or line on a terminal and block otherwise)")
+    argument_parser.add_argument("--no-cache", action="store_true", help="always recompile instead of using the object cache")
+    argument_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIRECTORY)
+    argument_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), help="object cache size limit in MB")
+    argument_parser.add_argument("--cache-stats", action="store_true", help="print object cache statistics and exit")
+    arguments = argument_parser.parse_args()
 
-    lexer = Lexer(code=code)
+    fast_math = tuple(flag for flag in arguments.fast_math.split(",") if flag)
+    unknown = [flag for flag in fast_math if flag not in (*FAST_MATH_FLAGS, "fast")]
+    if unknown:
+        argument_parser.error(f"unknown fast-math flags: {', '.join(unknown)}")
 
-    if DEBUG_LEXER:
-        token = lexer.get_next_token()
-        while True:
-            print(token)
-            if token.type == TokenType.EOF:
-                break
-            token = lexer.get_next_token()
-        exit()
-    
-    parser = Parser(lexer=lexer)
-    program = parser.parse()
-    if parser.errors:
-        for error in parser.errors:
-            print(error)
+    # -O0 compiles the program exactly as it was written
+    compile_time_steps = arguments.compile_time_steps if arguments.opt_level > 0 else 0
+
+    # read by the runtime when the first parallel for starts its thread pool
+    if arguments.threads is not None:
+        os.environ[Runtime.THREADS_VARIABLE] = str(arguments.threads)
+    # read by the runtime when the first value is printed
+    if arguments.output is not None:
+        os.environ[Runtime.OUTPUT_VARIABLE] = arguments.output
+
+    cache = None
+    if not arguments.no_cache:
+        cache = ObjectCache(directory=arguments.cache_dir, max_size=arguments.cache_size * 1024 * 1024)
+    if arguments.cache_stats:
+        print(json.dumps(cache.stats() if cache else {}, indent=2))
         exit()
 
-    if DEBUG_PARSER:
-        with open("Testing/AST.json", "w") as f:
-            json.dump(program.json(), f, indent=2)
-        print("AST printed succesfully")
+    if arguments.repl:
+        REPL(opt_level=arguments.opt_level, show_time=arguments.time, fast_reductions=arguments.fast_reductions, fast_math=fast_math, compile_time_steps=compile_time_steps).run()
         exit()
+
+    # binary ASTs are loaded as they are, so there is no source to lex, parse or hash
+    code = None
+    if not arguments.file.endswith(".ast"):
+        with open(arguments.file, "r") as f:
+            code = f.read()
+
+    # on a cache hit the lexer, parser and compiler are skipped entirely
+    engine = None
+    cache_key = None
+    if cache is not None and code is not None and RUN_CODE and not (arguments.tiered or arguments.lazy or arguments.emit_ast or arguments.emit or arguments.memo_stats or arguments.ast_stats) and not (DEBUG_LEXER or DEBUG_PARSER or DEBUG_COMPILER):
+        cache_key = cache.key(code, arguments.opt_level, f"{'fast-reductions ' if arguments.fast_reductions else ''}fast-math={','.join(fast_math)} compile-time-steps={compile_time_steps}")
+        object_data = cache.load(cache_key)
+        if object_data is not None:
+            engine = JIT.load_engine(object_data, opt_level=arguments.opt_level)
+
+    if engine is None:
+        if code is None:
+            program = ASTArena.load(arguments.file)
+        else:
+            lexer = TableLexer(code=code)
+
+            if DEBUG_LEXER:
+                token = lexer.get_next_token()
+                while True:
+                    print(token)
+                    if token.type == TokenType.EOF:
+                        break
+                    token = lexer.get_next_token()
+                exit()
     
-    compiler = Compiler()
-    compiler.compile(node=program)
-    if compiler.errors:
-        for error in compiler.errors:
-            print(error)
-        exit()
+            parser = Parser(lexer=lexer)
+            program = parser.parse()
+            if parser.errors:
+                for error in parser.errors:
+                    print(error)
+                exit()
+
+        if DEBUG_PARSER:
+            with open("Testing/AST.json", "w") as f:
+                json.dump(program.json(), f, indent=2)
+            print("AST printed succesfully")
+            exit()
 
-    module = compiler.module
-    module.triple = llvm.get_default_triple()
+        if arguments.emit_ast:
+            ASTArena.dump(program, arguments.emit_ast)
+            exit()
+
+        if arguments.opt_level > 0:
+            optimizer = Optimizer()
+            program = optimizer.optimize(program)
+            if arguments.ast_stats:
+                print(f"AST optimizer removed {optimizer.removed} nodes ({', '.join(f'{kind}: {count}' for kind, count in optimizer.rewrites.items())})")
+
+        if arguments.tiered and RUN_CODE:
+            interpreter = Interpreter(hot_threshold=arguments.hot_threshold, opt_level=arguments.opt_level, compiler_options={"fast_reductions": arguments.fast_reductions, "fast_math": fast_math, "compile_time_steps": compile_time_steps})
+            errors = interpreter.check(program)
+            if errors:
+                for error in errors:
+                    print(error)
+                exit()
+            start = perf_counter()
+            try:
+                interpreter.run(program)
+            except InterpreterError as e:
+                # reported like the errors compiled code fails with at runtime
+                sys.stdout.flush()
+                print(e)
+                exit(1)
+            end = perf_counter()
+            print(f"Runtime: {(end - start) * 1000:.3f} ms.")
+            if interpreter.promoted:
+                print(f"JIT compiled: {', '.join(interpreter.promoted)}")
+            exit()
+
+        if arguments.lazy and RUN_CODE:
+            lazy_jit = LazyJIT(program, opt_level=arguments.opt_level, fast_reductions=arguments.fast_reductions, fast_math=fast_math, compile_time_steps=compile_time_steps)
+            if not lazy_jit.load():
+                for error in lazy_jit.errors:
+                    print(error)
+                exit()
+            start = perf_counter()
+            lazy_jit.run()
+            end = perf_counter()
+            print(f"Runtime: {(end - start) * 1000:.3f} ms.")
+            if lazy_jit.compiled:
+                print(f"Lazily compiled: {', '.join(f'{name} ({seconds * 1000:.1f} ms)' for name, seconds in lazy_jit.compiled.items())}")
+            exit()
     
-    if DEBUG_COMPILER:
-        with open("Testing/assembly.txt", "w") as f:
-            f.write(str(module))
-        print("Assembly printed succesfully")
-        exit()
+        compiler = Compiler(fast_reductions=arguments.fast_reductions, fast_math=fast_math, memo_counters=arguments.memo_stats, compile_time_steps=compile_time_steps)
+        compiler.compile(node=program)
+        if compiler.errors:
+            for error in compiler.errors:
+                print(error)
+            exit()
+
+        module = compiler.module
+        module.triple = llvm.get_default_triple()
     
-    if RUN_CODE:
-        llvm.initialize()
-        llvm.initialize_native_target()
-        llvm.initialize_native_asmprinter()
+        if DEBUG_COMPILER:
+            with open("Testing/assembly.txt", "w") as f:
+                f.write(str(module))
+            print("Assembly printed succesfully")
+            exit()
 
+        if arguments.emit:
+            output_path = arguments.output or AOT.default_output_path(arguments.file, arguments.emit)
+            for path in AOT.build(module, output_path, arguments.emit, opt_level=arguments.opt_level):
+                print(f"Wrote {path}")
+            exit()
+    
+    if RUN_CODE:
         try:
-            parsed_assembly = llvm.parse_assembly(str(module))
-            parsed_assembly.verify()
+            if engine is None:
+                notify_object = (lambda data: cache.store(cache_key, data)) if cache_key is not None else None
+                engine = JIT.create_engine(module, opt_level=arguments.opt_level, notify_object=notify_object)
         except Exception as e:
             print(e)
             raise
 
-        target_machine = llvm.Target.from_default_triple().create_target_machine()
-
-        engine = llvm.create_mcjit_compiler(parsed_assembly, target_machine)
-        engine.finalize_object()
-
         entry = engine.get_function_address("main")
         cfunc = CFUNCTYPE(c_int)(entry)
 
@@ -83,4 +204,8 @@ if __name__ == "__main__":
         result = cfunc()
         end = perf_counter()
 
-        print(f"Runtime: {end - start} ms.")
+        print(f"Runtime: {(end - start) * 1000:.3f} ms.")
+        if arguments.memo_stats:
+            for name in compiler.memo_functions:
+                hits, misses = [c_int64.from_address(engine.get_global_value_address(f"{name}.memo.{counter}")).value for counter in ("hits", "misses")]
+                print(f"{name}: {hits} hits, {misses} misses")
@@ -0,0 +1,350 @@
+import math
+from collections import Counter
+
+from AST import Node, NodeType, Statement, Expression, Program, children
+from AST import VarStatement, FunctionStatement, IfStatement
+from AST import InfixExpression
+from AST import IntegerLiteral, FloatLiteral, BooleanLiteral
+from Interpreter import InterpreterError, CONVERSION_FUNCTIONS, MATH_FUNCTIONS, apply_operator, promoted_type, math_type, _round_float
+from Token import NUMERIC_TYPES
+
+
+INT_MIN, INT_MAX = -2**31, 2**31 - 1
+ARITHMETIC_OPERATORS = ("+", "-", "*", "/", "%", "^")
+COMPARISON_OPERATORS = ("<", "<=", ">", ">=", "==", "!=")
+# the kinds of rewrites counted in Optimizer.rewrites
+REWRITES = ("folded", "propagated", "identities", "strength", "branches", "unreachable")
+
+
+class Optimizer:
+    # AST pass that runs between the Parser and the Compiler. It folds operators on literals with the 32 bit
+    # semantics of compiled code, replaces variables that are initialised with a literal and never assigned by the
+    # literal, removes identities such as x * 1, turns x ^ 2 and x * 2 into x * x and x + x, and removes branches
+    # and loops whose condition is constant as well as statements after a return. Rewrites keep the types the
+    # Compiler infers, so a program with a type error reports the same error after the pass
+    def __init__(self) -> None:
+        self.removed = 0 # nodes removed from the program
+        self.rewrites = dict.fromkeys(REWRITES, 0)
+        self._types: dict[str, str | None] = {} # type of every variable in scope, None if it is not known
+        self._constants: dict[str, Expression] = {} # literals of the variables that are never assigned
+        self._assigned: set[str] = set()
+        self._declarations: Counter = Counter()
+        self._functions: dict[str, str] = {} # return types of the functions defined so far
+
+    def optimize(self, program: Program) -> Program:
+        before = count_nodes(program)
+        self._assigned, self._declarations = _scope_names(program.statements)
+        program.statements = self._statements(program.statements)
+        self.removed += before - count_nodes(program)
+        return program
+
+    # statements
+    def _statements(self, statements: list[Statement]) -> list[Statement]:
+        result = []
+        for i, statement in enumerate(statements):
+            if statement is None: continue
+            result.extend(self._statement(statement))
+            # like in the Compiler, nothing after a return runs
+            if result and result[-1].type() == NodeType.ReturnStatement:
+                self.rewrites["unreachable"] += len(statements) - i - 1
+                break
+        return result
+
+    def _statement(self, node: Statement) -> list[Statement]:
+        match node.type():
+            case NodeType.ExpressionStatement:
+                if node.expression is not None and node.expression.type() == NodeType.IfStatement:
+                    return self._if_statement(node.expression, node)
+                if node.expression is not None:
+                    node.expression = self._expression(node.expression)
+            case NodeType.IfStatement:
+                return self._if_statement(node, node)
+            case NodeType.VarStatement:
+                self._var_statement(node)
+            case NodeType.FunctionStatement:
+                self._function_statement(node)
+            case NodeType.BlockStatement:
+                node.statements = self._statements(node.statements)
+            case NodeType.ReturnStatement:
+                node.return_value = self._expression(node.return_value)
+            case NodeType.AssignStatement:
+                node.expression = self._expression(node.expression)
+            case NodeType.WhileStatement:
+                node.condition = self._expression(node.condition)
+                if _is_literal(node.condition, "bool") and not node.condition.value:
+                    self.rewrites["branches"] += 1
+                    return []
+                node.body.statements = self._statements(node.body.statements)
+            case NodeType.ForStatement:
+                node.start, node.stop = self._expression(node.start), self._expression(node.stop)
+                if node.chunk is not None:
+                    node.chunk = self._expression(node.chunk)
+                if node.schedule is None and _is_literal(node.start, "int") and _is_literal(node.stop, "int") and node.start.value >= node.stop.value:
+                    self.rewrites["branches"] += 1
+                    return []
+                # the loop variable hides a variable of the same name in the body
+                name = node.variable.value
+                previous_type, previous_constant = self._types.get(name), self._constants.pop(name, None)
+                self._types[name] = "int"
+                node.body.statements = self._statements(node.body.statements)
+                self._types[name] = previous_type
+                if previous_constant is not None:
+                    self._constants[name] = previous_constant
+            case NodeType.IndexAssignStatement:
+                node.array, node.index, node.expression = self._expression(node.array), self._expression(node.index), self._expression(node.expression)
+        return [node]
+
+    def _if_statement(self, node: IfStatement, statement: Statement) -> list[Statement]:
+        # statement is the if itself or the expression statement wrapping it
+        node.condition = self._expression(node.condition)
+        if _is_literal(node.condition, "bool"):
+            # blocks do not open a scope, so the statements of the branch that runs replace the if
+            self.rewrites["branches"] += 1
+            branch = node.consequence if node.condition.value else node.alternative
+            return self._statements(branch.statements) if branch is not None else []
+        node.consequence.statements = self._statements(node.consequence.statements)
+        if node.alternative is not None:
+            node.alternative.statements = self._statements(node.alternative.statements)
+        return [statement]
+
+    def _var_statement(self, node: VarStatement) -> None:
+        name = node.name.value
+        node.value = self._expression(node.value, node.value_type)
+        type = self._type(node.value, node.value_type)
+        self._types[name] = type
+        if name in self._assigned or self._declarations[name] != 1 or not _is_literal(node.value):
+            return
+        # the literal as the Compiler converts it to the declared type, float literals rounded as well, since the
+        # Compiler makes a literal next to an f64 exact in f64
+        literal = node.value
+        if type == "float" and literal.type() in (NodeType.IntegerLiteral, NodeType.FloatLiteral):
+            literal = FloatLiteral(_round_float(float(literal.value)))
+        if _literal_type(literal) == type and not (type == "int" and not INT_MIN <= literal.value <= INT_MAX):
+            self._constants[name] = literal
+
+    def _function_statement(self, node: FunctionStatement) -> None:
+        # a function only sees its parameters and the functions defined before it
+        self._functions[node.name.value] = node.return_type
+        scope = self._types, self._constants, self._assigned, self._declarations
+        self._types = {parameter.name: parameter.value_type for parameter in node.parameters}
+        self._constants = {}
+        self._assigned, self._declarations = _scope_names(node.body.statements)
+        node.body.statements = self._statements(node.body.statements)
+        self._types, self._constants, self._assigned, self._declarations = scope
+
+    # expressions
+    def _expression(self, node: Expression | None, value_type: str | None = None) -> Expression | None:
+        # value_type is the declared type that literals are converted to, like in Compiler._resolve_value. A
+        # rewrite into a literal of another type would change the type of the result, so it is not made
+        if node is None:
+            return None
+        match node.type():
+            case NodeType.IdentifierLiteral:
+                constant = self._constants.get(node.value)
+                if constant is not None and value_type in (None, _literal_type(constant)):
+                    self.rewrites["propagated"] += 1
+                    return _literal(constant.value, _literal_type(constant))
+            case NodeType.InfixExpression:
+                left, right = self._expression(node.left_node), self._expression(node.right_node)
+                # compiled code only unrolls float powers whose exponent is a literal in the program, so an exponent
+                # that is not one stays as it is, see Compiler._float_power
+                if node.operator == "^" and _is_literal(right, "float") and not _is_literal(node.right_node):
+                    right = node.right_node
+                node.left_node, node.right_node = left, right
+                result = self._infix_expression(node)
+                if value_type is not None and _is_literal(result) and _literal_type(result) != value_type:
+                    return node
+                return result
+            case NodeType.CallExpression:
+                node.parameters = [self._expression(parameter) for parameter in node.parameters]
+            case NodeType.IndexExpression:
+                node.array, node.index = self._expression(node.array), self._expression(node.index)
+            case NodeType.ArrayLiteral:
+                element_type = value_type[:-2] if value_type is not None and value_type.endswith("[]") else None
+                node.elements = [self._expression(element, element_type) for element in node.elements]
+        return node
+
+    def _infix_expression(self, node: InfixExpression) -> Expression:
+        folded = self._fold(node)
+        if folded is not None:
+            self.rewrites["folded"] += 1
+            return folded
+        left_type, right_type = self._type(node.left_node), self._type(node.right_node)
+        if left_type != right_type or left_type not in ("int", "float"):
+            return node
+        return self._simplify(node, left_type)
+
+    def _fold(self, node: InfixExpression) -> Expression | None:
+        # the literal result of an operator on two literals, None if it cannot be computed or the Compiler would
+        # report an error or produce undefined behaviour, such as for a division by zero
+        left, operator, right = node.left_node, node.operator, node.right_node
+        if not _is_literal(left) or not _is_literal(right) or operator not in ARITHMETIC_OPERATORS + COMPARISON_OPERATORS:
+            return None
+        type = _literal_type(left)
+        if type != _literal_type(right) or (type == "bool" and operator not in ("==", "!=")):
+            return None
+        left_value, right_value = left.value, right.value
+        if type == "int":
+            if not (INT_MIN <= left_value <= INT_MAX and INT_MIN <= right_value <= INT_MAX):
+                return None
+            if operator in ("/", "%") and (right_value == 0 or (left_value == INT_MIN and right_value == -1)):
+                return None
+        elif type == "float":
+            left_value, right_value = _round_float(left_value), _round_float(right_value)
+        try:
+            value, value_type = apply_operator(operator, left_value, type, right_value, type, literal_exponent=True)
+        except InterpreterError:
+            return None
+        if value_type == "float" and not math.isfinite(value):
+            return None
+        return _literal(value, value_type)
+
+    def _simplify(self, node: InfixExpression, type: str) -> Expression:
+        # identities and strength reductions of an operator on two operands of type, which is int or float. Float
+        # rewrites are exact, so x + 0.0 stays since it turns -0.0 into 0.0
+        left, operator, right = node.left_node, node.operator, node.right_node
+        def value(expression: Expression, number) -> bool:
+            return _is_literal(expression, type) and expression.value == number
+        def identity(result: Expression) -> Expression:
+            self.rewrites["identities"] += 1
+            return result
+        def strength(result: Expression) -> Expression:
+            self.rewrites["strength"] += 1
+            return result
+
+        match operator:
+            case "+":
+                if type == "int" and value(right, 0): return identity(left)
+                if type == "int" and value(left, 0): return identity(right)
+                # (x + a) + b is x + (a + b), int arithmetic wraps around and is associative
+                if type == "int" and _is_literal(right) and left.type() == NodeType.InfixExpression and left.operator == "+" and _is_literal(left.right_node, "int"):
+                    folded = self._fold(InfixExpression(left.right_node, "+", right))
+                    if folded is not None:
+                        return identity(InfixExpression(left.left_node, "+", folded))
+            case "-":
+                if value(right, 0): return identity(left)
+                if type == "int" and _same_variable(left, right): return identity(IntegerLiteral(0))
+            case "*":
+                if value(right, 1): return identity(left)
+                if value(left, 1): return identity(right)
+                if type == "int" and value(right, 0) and _is_pure(left): return identity(right)
+                if type == "int" and value(left, 0) and _is_pure(right): return identity(left)
+                if value(right, 2) and left.type() == NodeType.IdentifierLiteral: return strength(InfixExpression(left, "+", left))
+                if value(left, 2) and right.type() == NodeType.IdentifierLiteral: return strength(InfixExpression(right, "+", right))
+                if type == "int" and _is_literal(right) and left.type() == NodeType.InfixExpression and left.operator == "*" and _is_literal(left.right_node, "int"):
+                    folded = self._fold(InfixExpression(left.right_node, "*", right))
+                    if folded is not None:
+                        return identity(InfixExpression(left.left_node, "*", folded))
+            case "/":
+                if value(right, 1): return identity(left)
+                # dividing by a power of two is multiplying by its reciprocal, which is exact
+                if type == "float" and _is_literal(right) and right.value != 0:
+                    mantissa, exponent = math.frexp(abs(_round_float(right.value)))
+                    if mantissa == 0.5 and -126 <= 1 - exponent <= 127:
+                        return strength(InfixExpression(left, "*", FloatLiteral(math.copysign(math.ldexp(1.0, 1 - exponent), right.value))))
+            case "%":
+                if type == "int" and value(right, 1) and _is_pure(left): return identity(IntegerLiteral(0))
+            case "^":
+                if value(right, 1): return identity(left)
+                # pow(x, 0) is 1 for every x, even NaN
+                if value(right, 0) and _is_pure(left): return identity(_literal(1 if type == "int" else 1.0, type))
+                if value(right, 2) and left.type() == NodeType.IdentifierLiteral: return strength(InfixExpression(left, "*", left))
+        return node
+
+    def _type(self, node: Expression | None, value_type: str | None = None) -> str | None:
+        # the type name the Compiler gives an expression, None if it cannot be known up front
+        if node is None:
+            return None
+        match node.type():
+            case NodeType.IntegerLiteral | NodeType.FloatLiteral | NodeType.BooleanLiteral:
+                if value_type is not None and value_type in (*NUMERIC_TYPES, "bool"):
+                    return value_type
+                return _literal_type(node)
+            case NodeType.IdentifierLiteral:
+                return self._types.get(node.value)
+            case NodeType.ArrayLiteral:
+                return value_type
+            case NodeType.IndexExpression:
+                array_type = self._type(node.array)
+                if array_type == "matrix":
+                    return "float[]"
+                return array_type[:-2] if array_type is not None and array_type.endswith("[]") else None
+            case NodeType.CallExpression:
+                if node.name.value in ("len", "rows", "cols"):
+                    return "int"
+                if node.name.value in CONVERSION_FUNCTIONS:
+                    return node.name.value
+                if node.name.value in MATH_FUNCTIONS:
+                    return math_type(node.name.value, [self._type(parameter) for parameter in node.parameters])
+                return self._functions.get(node.name.value)
+            case NodeType.InfixExpression:
+                if node.operator in COMPARISON_OPERATORS:
+                    return "bool"
+                left_type, right_type = self._type(node.left_node), self._type(node.right_node)
+                # bools are not promoted to numbers
+                if node.operator == "@" or left_type == "bool":
+                    return None
+                return left_type if left_type == right_type else promoted_type(left_type, right_type)
+        return None
+
+
+def count_nodes(node: Node | None) -> int:
+    if node is None:
+        return 0
+    return 1 + sum(count_nodes(child) for child in children(node))
+
+
+def _scope_names(statements: list[Statement]) -> tuple[set[str], Counter]:
+    # the names assigned anywhere in the statements, including by reduce clauses and inside nested functions, and
+    # how often every name is declared outside nested functions
+    assigned, declarations = set(), Counter()
+    def visit(node: Node | None, nested: bool) -> None:
+        if node is None: return
+        match node.type():
+            case NodeType.AssignStatement:
+                assigned.add(node.identifier.value)
+            case NodeType.VarStatement if not nested:
+                declarations[node.name.value] += 1
+            case NodeType.ForStatement:
+                assigned.update(variable.value for _, variable in node.reductions)
+            case NodeType.FunctionStatement:
+                nested = True
+        for child in children(node):
+            visit(child, nested)
+    for statement in statements:
+        visit(statement, False)
+    return assigned, declarations
+
+
+def _literal_type(node: Expression) -> str | None:
+    match node.type():
+        case NodeType.IntegerLiteral: return "int"
+        case NodeType.FloatLiteral: return "float"
+        case NodeType.BooleanLiteral: return "bool"
+    return None
+
+
+def _is_literal(node: Expression | None, type: str | None = None) -> bool:
+    if node is None or _literal_type(node) is None:
+        return False
+    return type is None or _literal_type(node) == type
+
+
+def _literal(value, type: str) -> Expression:
+    match type:
+        case "int": return IntegerLiteral(value)
+        case "float": return FloatLiteral(value)
+        case "bool": return BooleanLiteral(value)
+
+
+def _same_variable(a: Expression, b: Expression) -> bool:
+    return a.type() == b.type() == NodeType.IdentifierLiteral and a.value == b.value
+
+
+def _is_pure(node: Expression | None) -> bool:
+    # expressions without calls, which could print, so dropping them does not change what the program does
+    if node is None:
+        return True
+    if node.type() == NodeType.CallExpression:
+        return False
+    return all(_is_pure(child) for child in children(node))
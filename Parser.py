@@ -1,15 +1,19 @@
 from Lexer import Lexer
-from Token import Token, TokenType
+from Token import Token, TokenType, TYPE_ALIASES, NUMERIC_TYPES
 from enum import Enum, auto
 
 from AST import Statement, Expression, Program
 from AST import ExpressionStatement, VarStatement, FunctionStatement, ReturnStatement, BlockStatement, AssignStatement
-from AST import IfStatement, WhileStatement
-from AST import InfixExpression, CallExpression
-from AST import IntegerLiteral, FloatLiteral, IdentifierLiteral, BooleanLiteral
+from AST import IfStatement, WhileStatement, IndexAssignStatement, ForStatement
+from AST import InfixExpression, CallExpression, IndexExpression
+from AST import IntegerLiteral, FloatLiteral, IdentifierLiteral, BooleanLiteral, ArrayLiteral
 from AST import FunctionParameter
 
 
+# results cached by a @memo function without an explicit size
+DEFAULT_MEMO_SIZE = 4096
+
+
 class PrecedenceTypes(Enum):
     P_LOWEST = 0
     P_EQUALS = auto()
@@ -28,6 +32,7 @@ PRECEDENCES = {
     TokenType.MULTIPLY: PrecedenceTypes.P_PRODUCT,
     TokenType.DIVIDE: PrecedenceTypes.P_PRODUCT,
     TokenType.MODULO: PrecedenceTypes.P_PRODUCT,
+    TokenType.AT: PrecedenceTypes.P_PRODUCT,
     TokenType.EXPONENT: PrecedenceTypes.P_EXPONENT,
     TokenType.DOUBLE_EQUALS: PrecedenceTypes.P_EQUALS,
     TokenType.NOT_EQUALS: PrecedenceTypes.P_EQUALS,
@@ -36,6 +41,7 @@ PRECEDENCES = {
     TokenType.GREATERTHAN: PrecedenceTypes.P_LESSGREATER,
     TokenType.GREATERTHAN_EQUALS: PrecedenceTypes.P_LESSGREATER,
     TokenType.LPAREN: PrecedenceTypes.P_CALL,
+    TokenType.LBRACKET: PrecedenceTypes.P_INDEX,
     TokenType.BANG: PrecedenceTypes.P_SUM
 }
 
@@ -54,6 +60,8 @@ class Parser:
             TokenType.IF: self._parse_if_statement,
             TokenType.TRUE: self._parse_boolean_literal,
             TokenType.FALSE: self._parse_boolean_literal,
+            TokenType.LBRACKET: self._parse_array_literal,
+            TokenType.TYPE: self._parse_conversion,
             #TokenType.MINUS: self._parse_minus_literal, TODO: implement minus in front of a number
             #TokenType.BANG: self._parse_bang_expression, TODO: implement parsing bang
         }
@@ -64,6 +72,7 @@ class Parser:
             TokenType.DIVIDE: self._parse_infix_expression,
             TokenType.EXPONENT: self._parse_infix_expression,
             TokenType.MODULO: self._parse_infix_expression,
+            TokenType.AT: self._parse_infix_expression,
             TokenType.DOUBLE_EQUALS: self._parse_infix_expression,
             TokenType.NOT_EQUALS: self._parse_infix_expression,
             TokenType.LESSTHAN: self._parse_infix_expression,
@@ -71,6 +80,7 @@ class Parser:
             TokenType.GREATERTHAN: self._parse_infix_expression,
             TokenType.GREATERTHAN_EQUALS: self._parse_infix_expression,
             TokenType.LPAREN: self._parse_call_expression,
+            TokenType.LBRACKET: self._parse_index_expression,
         }
         self._get_next_token()
         self._get_next_token()
@@ -135,11 +145,19 @@ class Parser:
                 return self._parse_block_statement()
             case TokenType.WHILE:
                 return self._parse_while_statement()
+            case TokenType.FOR:
+                return self._parse_for_statement()
+            case TokenType.PARALLEL:
+                return self._parse_parallel_statement()
+            case TokenType.AT:
+                return self._parse_annotated_function_statement()
             case _:
                 return self._parse_expression_statement()
 
     def _parse_expression_statement(self) -> ExpressionStatement:
         expression = self._parse_expression(PrecedenceTypes.P_LOWEST)
+        if isinstance(expression, IndexExpression) and self._peek_token_is(TokenType.EQUALS):
+            return self._parse_index_assignment_statement(expression)
         if self._peek_token_is(TokenType.EOL):
             self._get_next_token()
         
@@ -155,7 +173,8 @@ class Parser:
 
         # type
         if not self._expect_peek(TokenType.TYPE): return None
-        type = self.current_token.literal
+        type = self._parse_type()
+        if type is None: return None
 
         if not self._expect_peek(TokenType.EQUALS): return None
         self._get_next_token()
@@ -175,12 +194,49 @@ class Parser:
         parameters = self._parse_function_parameters()
         if not self._expect_peek(TokenType.COLON): return None
         if not self._expect_peek(TokenType.TYPE): return None
-        return_type = self.current_token.literal
+        return_type = self._parse_type()
+        if return_type is None: return None
         if not self._expect_peek(TokenType.LBRACE): return None
         body = self._parse_block_statement()
 
         return FunctionStatement(parameters, body, function_name, return_type)
     
+    def _parse_annotated_function_statement(self) -> FunctionStatement:
+        # @pure or @memo, optionally with the cache size @memo(size), on the line before or in front of func
+        if not self._expect_peek(TokenType.IDENTIFIER): return None
+        annotation = self.current_token.literal
+        if annotation not in ("pure", "memo"):
+            self.errors.append(f"Unknown annotation @{annotation}, expected @pure or @memo.")
+            return None
+        memo = DEFAULT_MEMO_SIZE if annotation == "memo" else None
+        if annotation == "memo" and self._peek_token_is(TokenType.LPAREN):
+            self._get_next_token()
+            if not self._expect_peek(TokenType.INT): return None
+            memo = self.current_token.literal
+            if memo < 1:
+                self.errors.append("The cache size of @memo must be positive.")
+                return None
+            if not self._expect_peek(TokenType.RPAREN): return None
+        while self._peek_token_is(TokenType.EOL):
+            self._get_next_token()
+        if not self._expect_peek(TokenType.FUNC): return None
+        function = self._parse_function_statement()
+        if function is not None:
+            function.pure, function.memo = True, memo
+        return function
+
+    def _parse_type(self) -> str | None:
+        # a TYPE token, optionally followed by [] for an array of that type. Arrays hold 32 bit ints and floats
+        value_type = TYPE_ALIASES.get(self.current_token.literal, self.current_token.literal)
+        if self._peek_token_is(TokenType.LBRACKET):
+            if value_type in ("i64", "f64"):
+                self.errors.append(f"Arrays of {value_type} are not supported, arrays hold ints or floats.")
+                return None
+            self._get_next_token()
+            if not self._expect_peek(TokenType.RBRACKET): return None
+            value_type += "[]"
+        return value_type
+    
     def _parse_function_parameters(self) -> list[FunctionParameter]:
         parameters = []
         # skip over LPAREN
@@ -195,7 +251,7 @@ class Parser:
                 return None
             # skip over COLON
             self._get_next_token()
-            parameter_type = self.current_token.literal
+            parameter_type = self._parse_type()
             parameters.append(FunctionParameter(parameter_name, parameter_type))
             # skip to RPAREN or COMMA
             self._get_next_token()
@@ -248,6 +304,15 @@ class Parser:
 
         return AssignStatement(identifier, expression)
     
+    def _parse_index_assignment_statement(self, target: IndexExpression) -> IndexAssignStatement:
+        # skip over EQUALS
+        self._get_next_token()
+        self._get_next_token()
+        expression = self._parse_expression(PrecedenceTypes.P_LOWEST)
+        if expression is None: return None
+
+        return IndexAssignStatement(target.array, target.index, expression)
+    
     def _parse_if_statement(self):
         self._get_next_token()
         condition = self._parse_expression(PrecedenceTypes.P_LOWEST)
@@ -275,6 +340,63 @@ class Parser:
 
         return WhileStatement(condition, body)
 
+    def _parse_for_statement(self, schedule: str | None = None, chunk: Expression | None = None) -> ForStatement:
+        if not self._expect_peek(TokenType.IDENTIFIER): return None
+        variable = IdentifierLiteral(self.current_token.literal)
+        if not self._expect_peek(TokenType.IN): return None
+        self._get_next_token()
+        start = self._parse_expression(PrecedenceTypes.P_LOWEST)
+        if not self._expect_peek(TokenType.DOTDOT): return None
+        self._get_next_token()
+        stop = self._parse_expression(PrecedenceTypes.P_LOWEST)
+
+        reductions = []
+        if self._peek_token_is(TokenType.REDUCE):
+            reductions = self._parse_reductions()
+            if reductions is None: return None
+
+        if not self._expect_peek(TokenType.LBRACE): return None
+        body = self._parse_block_statement()
+
+        return ForStatement(variable, start, stop, body, schedule, chunk, reductions)
+
+    def _parse_reductions(self) -> list[tuple[str, IdentifierLiteral]] | None:
+        # reduce(operator: variable, ...) with the operators +, *, min and max
+        self._get_next_token()
+        if not self._expect_peek(TokenType.LPAREN): return None
+        reductions = []
+        while True:
+            self._get_next_token()
+            operator = self.current_token.literal
+            if self.current_token.type not in (TokenType.PLUS, TokenType.MULTIPLY, TokenType.IDENTIFIER) or operator not in ("+", "*", "min", "max"):
+                self.errors.append(f"Unknown reduction operator {operator}, expected +, *, min or max.")
+                return None
+            if not self._expect_peek(TokenType.COLON): return None
+            if not self._expect_peek(TokenType.IDENTIFIER): return None
+            reductions.append((operator, IdentifierLiteral(self.current_token.literal)))
+            if not self._peek_token_is(TokenType.COMMA): break
+            self._get_next_token()
+        if not self._expect_peek(TokenType.RPAREN): return None
+        return reductions
+
+    def _parse_parallel_statement(self) -> ForStatement:
+        # parallel for, or parallel(schedule) for and parallel(schedule, chunk) for
+        schedule, chunk = "static", None
+        if self._peek_token_is(TokenType.LPAREN):
+            self._get_next_token()
+            if not self._expect_peek(TokenType.IDENTIFIER): return None
+            schedule = self.current_token.literal
+            if schedule not in ("static", "dynamic"):
+                self.errors.append(f"Unknown schedule {schedule}, expected static or dynamic.")
+                return None
+            if self._peek_token_is(TokenType.COMMA):
+                self._get_next_token()
+                self._get_next_token()
+                chunk = self._parse_expression(PrecedenceTypes.P_LOWEST)
+            if not self._expect_peek(TokenType.RPAREN): return None
+        if not self._expect_peek(TokenType.FOR): return None
+        return self._parse_for_statement(schedule, chunk)
+
     
     def _parse_expression(self, precedence: PrecedenceTypes) -> Expression | None:
         prefix_function = self.prefix_parse_functions.get(self.current_token.type)
@@ -315,6 +437,14 @@ class Parser:
 
         return CallExpression(name, parameters)
     
+    def _parse_index_expression(self, array: Expression) -> IndexExpression:
+        self._get_next_token()
+        index = self._parse_expression(PrecedenceTypes.P_LOWEST)
+
+        if not self._expect_peek(TokenType.RBRACKET):
+            return None
+        return IndexExpression(array, index)
+    
     def _parse_expression_list(self, end_token: TokenType) -> list[Expression]:
         expression_list = []
         if self._peek_token_is(end_token):
@@ -355,5 +485,18 @@ class Parser:
     def _parse_identifier(self) -> IdentifierLiteral:
         return IdentifierLiteral(value=self.current_token.literal)
     
+    def _parse_conversion(self) -> IdentifierLiteral:
+        # a numeric type in front of ( is the function converting its argument to that type, e.g. f64(x)
+        name = TYPE_ALIASES.get(self.current_token.literal, self.current_token.literal)
+        if name not in NUMERIC_TYPES or not self._peek_token_is(TokenType.LPAREN):
+            self.errors.append(f"Type {self.current_token.literal} cannot be used as a value.")
+            return None
+        return IdentifierLiteral(value=name)
+
     def _parse_boolean_literal(self) -> BooleanLiteral:
         return BooleanLiteral(self._current_token_is(TokenType.TRUE))
+
+    def _parse_array_literal(self) -> ArrayLiteral:
+        elements = self._parse_expression_list(TokenType.RBRACKET)
+        if elements is None: return None
+        return ArrayLiteral(elements)
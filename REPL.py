@@ -0,0 +1,105 @@
+import sys
+import ctypes
+from llvmlite import ir
+import llvmlite.binding as llvm
+from time import perf_counter
+
+from TableLexer import TableLexer
+from Parser import Parser
+from AST import NodeType
+from Compiler import Compiler, DEFAULT_COMPILE_TIME_STEPS
+from Optimizer import Optimizer
+from Environment import Environment
+import JIT
+
+
+class _LinkedEnvironment(Environment):
+    # parent scope of every entry: a name defined by an earlier entry is declared in the entry's module on its first
+    # use and linked against the definition already in the engine, so an entry only declares what it uses
+    def __init__(self, definitions: Environment, module: ir.Module) -> None:
+        super().__init__(records={}, name="Linked")
+        self.definitions = definitions
+        self.module = module
+
+    def lookup(self, name: str) -> tuple[ir.Value, ir.Type] | None:
+        record = super().lookup(name)
+        if record is not None: return record
+        record = self.definitions.lookup(name)
+        if record is None: return None
+        definition, type = record
+        if isinstance(definition, ir.Function):
+            declaration = ir.Function(self.module, definition.ftype, name=definition.name)
+        else:
+            declaration = ir.GlobalVariable(self.module, definition.value_type, name=definition.name)
+        self.define(name, declaration, type)
+        return declaration, type
+
+
+class REPL:
+    # one execution engine stays alive for the whole session. Every entry is compiled into a small module of its own
+    # with its top level code in the function repl.<n>, top level variables become globals of that module, and the
+    # module is linked into the engine next to the earlier ones, which are never recompiled. Entries share the step
+    # budget of compile-time evaluation
+    def __init__(self, opt_level: int = JIT.DEFAULT_OPTIMIZATION_LEVEL, show_time: bool = False, fast_reductions: bool = False, fast_math: tuple[str, ...] = (), compile_time_steps: int = DEFAULT_COMPILE_TIME_STEPS) -> None:
+        self.opt_level = opt_level
+        self.show_time = show_time
+        self.fast_reductions = fast_reductions
+        self.fast_math = fast_math
+        self.compile_time_steps = compile_time_steps if opt_level > 0 else 0
+        self.engine = JIT.create_empty_engine(opt_level)
+        self.environment = Environment(records={}, name="REPL") # functions and globals of all earlier entries
+        self.entries = 0
+
+    def evaluate(self, code: str) -> list[str]:
+        # returns the errors of the entry, an entry with errors is not linked and defines nothing
+        parser = Parser(lexer=TableLexer(code=code + "\n"))
+        program = parser.parse()
+        if parser.errors:
+            return parser.errors
+        if self.opt_level > 0:
+            program = Optimizer().optimize(program)
+
+        entry = f"repl.{self.entries}"
+        compiler = Compiler(entry=entry, global_variables=True, fast_reductions=self.fast_reductions, fast_math=self.fast_math, compile_time_steps=self.compile_time_steps)
+        compiler.environment.parent = _LinkedEnvironment(self.environment, compiler.module)
+        for statement in program.statements:
+            if statement.type() == NodeType.FunctionStatement and self.environment.lookup(statement.name.value) is not None:
+                compiler.errors.append(f"Function {statement.name.value} is already defined.")
+        if not compiler.errors:
+            compiler.compile(node=program)
+            self.compile_time_steps = compiler.compile_time_steps
+        if compiler.errors:
+            return compiler.errors
+        compiler.module.triple = llvm.get_default_triple()
+        JIT.add_module(self.engine, compiler.module, opt_level=self.opt_level)
+        self.entries += 1
+
+        for name, record in compiler.environment.records.items():
+            if name not in compiler.builtins and isinstance(record[0], (ir.Function, ir.GlobalVariable)):
+                self.environment.define(name, *record)
+
+        ctypes.CFUNCTYPE(ctypes.c_int)(self.engine.get_function_address(entry))()
+        JIT.flush_output()
+        return []
+
+    def run(self) -> None:
+        while True:
+            try:
+                code = input(">>> ")
+                # keep reading until every brace is closed, so definitions can span several lines
+                while code.count("{") > code.count("}"):
+                    code += "\n" + input("... ")
+            except (EOFError, KeyboardInterrupt):
+                print()
+                return
+            if not code.strip():
+                continue
+
+            start = perf_counter()
+            errors = self.evaluate(code)
+            end = perf_counter()
+            for error in errors:
+                print(error)
+            if self.show_time:
+                print(f"({(end - start) * 1000:.3f} ms)")
+            sys.stdout.flush()
@@ -0,0 +1,221 @@
+from itertools import zip_longest
+
+from AST import Node, NodeType, Expression, IdentifierLiteral
+from AST import FunctionStatement, IfStatement, ForStatement, BlockStatement
+from Environment import Environment
+from Interpreter import BUILTIN_FUNCTIONS
+
+
+# records of declared names in the scopes of the Resolver. A variable belongs to the function declaring it, while
+# functions and the names the Compiler defines up front can be used in every function that sees them
+DECLARED = (None, None)
+SHARED = (None, "shared")
+
+
+class Resolver:
+    # pass that runs in the Compiler before any code is emitted. It follows the scopes the Compiler creates, one per
+    # function and per parallel for body with a scope of captured values in between, together with which names are
+    # declared at every point, and binds every IdentifierLiteral the Compiler looks up to the depth of the scope
+    # declaring its name, counted from the scope of the use, and the slot of the name there. All undefined and
+    # duplicate names are reported here, as are variables used in another function than the one declaring them, and
+    # the Compiler gets its variables by index instead of by name
+    def __init__(self, environment: Environment, entry: str = "main", global_variables: bool = False) -> None:
+        # the top scope has the slots of the Compiler's scope, whose parent is only searched by name (see REPL)
+        self.environment = Environment({}, names=environment.slots)
+        for name in environment.records:
+            self.environment.define(name, *SHARED)
+        self.outer: Environment | None = environment.parent
+        # the top scope is the body of the function entry, and its variables can be used in other functions too
+        # with global_variables, which keeps them in module globals
+        self.entry = entry
+        self.global_variables = global_variables
+        self.errors: list[str] = []
+        # slots of the names in the scope of every function and parallel for body
+        self.scopes: dict[Node, dict[str, int]] = {}
+        # functions that call themselves outside of nested functions, only their calls can become jumps (see
+        # Compiler._recursion_loop)
+        self.recursive: set[FunctionStatement] = set()
+        self._function: FunctionStatement | None = None
+        self._function_scopes: set[Environment] = set()
+
+    def resolve(self, node: Node) -> list[str]:
+        self._statement(node)
+        return self.errors
+
+    # statements, True if the statement returns, since the Compiler skips the rest of the block
+    def _statement(self, node: Node) -> bool:
+        match node.type():
+            case NodeType.Program:
+                for statement in node.statements:
+                    self._statement(statement)
+            case NodeType.ExpressionStatement:
+                if node.expression is not None:
+                    self._statement(node.expression)
+            case NodeType.VarStatement:
+                self._expression(node.value)
+                if self._find(node.name.value) is not None or self._outside(node.name.value):
+                    self.errors.append(f"Identifier {node.name.value} tried to be declared more than once.")
+                else:
+                    self._declare(node.name)
+            case NodeType.FunctionStatement:
+                self._function_statement(node)
+            case NodeType.BlockStatement:
+                return self._block_statement(node)
+            case NodeType.ReturnStatement:
+                self._expression(node.return_value)
+                return True
+            case NodeType.AssignStatement:
+                declared = self._bind(node.identifier)
+                self._expression(node.expression)
+                if not declared:
+                    self.errors.append(f"Identifier {node.identifier.value} was not declared before re-assignment.")
+            case NodeType.IfStatement:
+                self._if_statement(node)
+            case NodeType.WhileStatement:
+                self._expression(node.condition)
+                at_condition = self.environment.snapshot()
+                self._statement(node.body)
+                self.environment.restore(at_condition)
+            case NodeType.IndexAssignStatement:
+                for expression in (node.array, node.index, node.expression):
+                    self._expression(expression)
+            case NodeType.ForStatement:
+                self._for_statement(node)
+
+            # other expressions are not compiled as statements
+            case NodeType.InfixExpression | NodeType.CallExpression:
+                self._expression(node)
+        return False
+
+    def _block_statement(self, node: BlockStatement) -> bool:
+        for statement in node.statements:
+            if self._statement(statement):
+                return True
+        return False
+
+    def _function_statement(self, node: FunctionStatement) -> None:
+        # the function sees its own name and its parameters in a scope of its own, and is declared after its body.
+        # The bodies of lazily compiled functions are checked here as well, and bound again when they are compiled
+        # (see LazyJIT)
+        name = node.name.value
+        previous, previous_function = self.environment, self._function
+        self.environment, self._function = Environment({}, previous, name=name), node
+        self._function_scopes.add(self.environment)
+        self.environment.define(name, *SHARED)
+        for parameter in node.parameters:
+            self.environment.define(parameter.name, *DECLARED)
+        self._statement(node.body)
+        self.scopes[node] = self.environment.slots
+        self.environment, self._function = previous, previous_function
+        self._declare(node.name, SHARED)
+
+    def _if_statement(self, node: IfStatement) -> None:
+        # every branch starts from the names before the if, and a name stays declared after it if a branch that
+        # does not return declares it
+        self._expression(node.condition)
+        before = self.environment.snapshot()
+        incoming = [] if node.alternative else [before]
+        for branch in (node.consequence, node.alternative):
+            if branch is None: continue
+            self.environment.restore(before)
+            if not self._statement(branch):
+                incoming.append(self.environment.snapshot())
+        if not incoming:
+            self.environment.restore(before)
+            return
+        self.environment.restore([next((record for record in records if record is not None), None) for records in zip_longest(*incoming)])
+
+    def _for_statement(self, node: ForStatement) -> None:
+        self._expression(node.start)
+        self._expression(node.stop)
+        for _, variable in node.reductions:
+            if not self._bind(variable):
+                self.errors.append(f"Reduction variable {variable.value} is not defined.")
+        # the loop variable only exists in the body
+        if node.schedule is None:
+            at_condition = self.environment.snapshot()
+            self._declare(node.variable)
+            self._statement(node.body)
+            self.environment.restore(at_condition)
+            return
+
+        # the body of a parallel for sees the enclosing scopes through the scope of the values it captures, and has
+        # the loop variable and private copies of the reduction variables in its own
+        self._expression(node.chunk)
+        previous = self.environment
+        self.environment = Environment({}, Environment({}, previous, name="Captures"))
+        self._declare(node.variable)
+        for _, variable in node.reductions:
+            self.environment.define(variable.value, *DECLARED)
+        self._statement(node.body)
+        self.scopes[node] = self.environment.slots
+        self.environment = previous
+
+    # expressions
+    def _expression(self, node: Expression | None) -> None:
+        if node is None: return
+        match node.type():
+            case NodeType.IdentifierLiteral:
+                if not self._bind(node):
+                    self.errors.append(f"Identifier {node.value} is not defined.")
+            case NodeType.InfixExpression:
+                self._expression(node.left_node)
+                self._expression(node.right_node)
+            case NodeType.CallExpression:
+                for parameter in node.parameters:
+                    self._expression(parameter)
+                if self._function is not None and node.name.value == self._function.name.value:
+                    self.recursive.add(self._function)
+                # builtins are compiled by name
+                if node.name.value in BUILTIN_FUNCTIONS:
+                    node.name.depth = node.name.slot = None
+                elif not self._bind(node.name):
+                    self.errors.append(f"Function {node.name.value} is not defined.")
+            case NodeType.IndexExpression:
+                self._expression(node.array)
+                self._expression(node.index)
+            case NodeType.ArrayLiteral:
+                for element in node.elements:
+                    self._expression(element)
+
+    # names
+    def _declare(self, identifier: IdentifierLiteral, record: tuple[None, str | None] = DECLARED) -> None:
+        identifier.depth, identifier.slot = 0, self.environment.slot(identifier.value)
+        self.environment.set(identifier.slot, record)
+
+    def _bind(self, identifier: IdentifierLiteral) -> bool:
+        # False if the name is not declared. Names only declared outside the top scope are left unbound
+        found = self._find(identifier.value)
+        identifier.depth, identifier.slot = found if found is not None else (None, None)
+        if found is not None:
+            owner = self._foreign_owner(*found)
+            if owner is not None:
+                self.errors.append(f"Identifier {identifier.value} belongs to function {owner} and cannot be used in {self._function.name.value}.")
+        return found is not None or self._outside(identifier.value)
+
+    def _find(self, name: str) -> tuple[int, int] | None:
+        environment, depth = self.environment, 0
+        while environment is not None:
+            slot = environment.slots.get(name)
+            if slot is not None and environment.values[slot] is not None:
+                return depth, slot
+            environment, depth = environment.parent, depth + 1
+        return None
+
+    def _foreign_owner(self, depth: int, slot: int) -> str | None:
+        # the function a variable belongs to if the function using it is another one. Functions are compiled on
+        # their own, so they do not see the current values of the variables around them
+        environment, crossed = self.environment, False
+        for _ in range(depth):
+            crossed = crossed or environment in self._function_scopes
+            environment = environment.parent
+        if not crossed or environment.values[slot] != DECLARED:
+            return None
+        while environment.parent is not None and environment not in self._function_scopes:
+            environment = environment.parent
+        if environment.parent is None:
+            return None if self.global_variables else self.entry
+        return environment.name
+
+    def _outside(self, name: str) -> bool:
+        return self.outer is not None and self.outer.lookup(name) is not None
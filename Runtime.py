@@ -0,0 +1,612 @@
+import sys
+from llvmlite import ir
+
+
+# native runtime shared by every compiled module. The JIT compiles it once per process and registers its functions
+# as symbols (see JIT.load_runtime), AOT links it into the emitted object
+PARALLEL_FOR = "calclite_parallel_for"
+SET_THREADS = "calclite_set_threads"
+PRINT_INT = "calclite_print_int"
+PRINT_FLOAT = "calclite_print_float"
+PRINT_INTS = "calclite_print_ints"
+PRINT_FLOATS = "calclite_print_floats"
+PRINT_MATRIX = "calclite_print_matrix"
+FLUSH = "calclite_flush"
+FAIL = "calclite_fail"
+PRINT_FUNCTIONS = (PRINT_INT, PRINT_FLOAT, PRINT_INTS, PRINT_FLOATS, PRINT_MATRIX)
+EXPORTED = (PARALLEL_FOR, SET_THREADS, *PRINT_FUNCTIONS, FLUSH, FAIL)
+
+# sysconf(_SC_NPROCESSORS_ONLN), whose value differs between C libraries
+SC_NPROCESSORS_ONLN = {"darwin": 58, "freebsd": 58}.get(sys.platform.rstrip("0123456789"), 84)
+# storage for pthread_mutex_t and pthread_cond_t, at least as large and aligned as on glibc and macOS
+PTHREAD_STORAGE = 64
+THREADS_VARIABLE = "CALCLITE_THREADS"
+# every thread formats its output into a buffer of its own, which is written to stdout when it cannot hold another
+# value and at the latest when the program ends. With line buffering every printed line is written at once, without
+# buffering every value. The default is line buffering on a terminal and block buffering otherwise
+OUTPUT_VARIABLE = "CALCLITE_OUTPUT"
+OUTPUT_MODES = ("line", "block", "none")
+OUTPUT_BUFFER = 1 << 16
+# room for the longest formatted value, an f64 with 309 digits before and 10 after the point, and its separator
+OUTPUT_RESERVE = 336
+FLOAT_FORMAT = "%.10f"
+STDOUT = 1
+
+i8, i32, i64 = ir.IntType(8), ir.IntType(32), ir.IntType(64)
+VOID_POINTER = i8.as_pointer()
+CONTEXT = VOID_POINTER.as_pointer()
+# outlined loop bodies run the iterations [start, stop) with the captured values in context, see
+# Compiler._visit_parallel_for
+BODY = ir.FunctionType(ir.VoidType(), [CONTEXT, i64, i64])
+PARALLEL_FOR_TYPE = ir.FunctionType(ir.VoidType(), [BODY.as_pointer(), CONTEXT, i64, i64, i8, i64])
+SET_THREADS_TYPE = ir.FunctionType(ir.VoidType(), [i32])
+f32, f64 = ir.FloatType(), ir.DoubleType()
+# scalars are printed at their widest, the compiler extends ints to i64 and floats to f64
+PRINT_INT_TYPE = ir.FunctionType(ir.VoidType(), [i64])
+PRINT_FLOAT_TYPE = ir.FunctionType(ir.VoidType(), [f64])
+PRINT_INTS_TYPE = ir.FunctionType(ir.VoidType(), [i32.as_pointer(), i64])
+PRINT_FLOATS_TYPE = ir.FunctionType(ir.VoidType(), [f32.as_pointer(), i64])
+PRINT_MATRIX_TYPE = ir.FunctionType(ir.VoidType(), [f32.as_pointer(), i64, i64])
+FLUSH_TYPE = ir.FunctionType(ir.VoidType(), [])
+# prints the message after the output so far and exits with status 1
+FAIL_TYPE = ir.FunctionType(ir.VoidType(), [VOID_POINTER])
+# the used bytes and the bytes of an output buffer
+OUTPUT = ir.LiteralStructType([i64, ir.ArrayType(i8, OUTPUT_BUFFER)])
+
+
+def runtime_module() -> ir.Module:
+    return _RuntimeBuilder().module
+
+
+class _RuntimeBuilder:
+    # a pool of worker threads that sleep on a condition variable until a parallel for publishes a job. The thread
+    # that runs the parallel for takes part as participant 0 and waits until every worker has finished its share.
+    # The generation and pending counters are accessed atomically even under the mutex, so the optimizer cannot
+    # keep them in registers across pthread_cond_wait, which it knows cannot see these internal globals.
+    # Only one parallel for uses the pool at a time: a nested one, or one started from another thread while the pool
+    # is busy, runs sequentially on its own thread instead.
+    # Output goes through per-thread buffers kept under a pthread key, whose destructor writes out the buffer of a
+    # thread that exits. Workers write out their buffer after every share of a job, and a parallel for writes out
+    # the buffer of its thread before it starts, so the output of a loop comes after the output before it
+    def __init__(self) -> None:
+        self.module = ir.Module("Runtime")
+        self.builder: ir.IRBuilder = None
+
+        def variable(name: str, type: ir.Type, part: str = "pool") -> ir.GlobalVariable:
+            variable = ir.GlobalVariable(self.module, type, name=f"calclite.{part}.{name}")
+            variable.initializer = ir.Constant(type, None)
+            variable.linkage = "internal"
+            return variable
+
+        storage = ir.ArrayType(i8, PTHREAD_STORAGE)
+        self.mutex, self.wake, self.done = variable("mutex", storage), variable("wake", storage), variable("done", storage)
+        for synchronisation in (self.mutex, self.wake, self.done):
+            synchronisation.align = 16
+        self.threads = variable("threads", i32) # participants of a parallel for, 0 until configured
+        self.workers = variable("workers", i32) # worker threads started so far
+        self.busy = variable("busy", i32)
+        self.generation = variable("generation", i64)
+        self.pending = variable("pending", i32) # workers that have not finished the current job
+        self.size = variable("size", i32)
+        self.body = variable("body", BODY.as_pointer())
+        self.context = variable("context", CONTEXT)
+        self.stop = variable("stop", i64)
+        self.chunk = variable("chunk", i64)
+        self.dynamic = variable("dynamic", i8)
+        self.next = variable("next", i64) # first iteration not yet handed out, for static scheduling the start
+        # 0 until the first thread prints, 1 while it creates the key and 2 afterwards
+        self.output_state = variable("state", i32, "output")
+        # pthread_key_t is an unsigned int or long, which is passed in the same register either way
+        self.output_key = variable("key", i64, "output")
+        self.output_mode = variable("mode", i32, "output") # index into OUTPUT_MODES
+
+        def declare(name: str, return_type: ir.Type, *argument_types: ir.Type) -> ir.Function:
+            return ir.Function(self.module, ir.FunctionType(return_type, argument_types), name=name)
+
+        self.mutex_init = declare("pthread_mutex_init", i32, VOID_POINTER, VOID_POINTER)
+        self.mutex_lock = declare("pthread_mutex_lock", i32, VOID_POINTER)
+        self.mutex_unlock = declare("pthread_mutex_unlock", i32, VOID_POINTER)
+        self.cond_init = declare("pthread_cond_init", i32, VOID_POINTER, VOID_POINTER)
+        self.cond_wait = declare("pthread_cond_wait", i32, VOID_POINTER, VOID_POINTER)
+        self.cond_broadcast = declare("pthread_cond_broadcast", i32, VOID_POINTER)
+        self.cond_signal = declare("pthread_cond_signal", i32, VOID_POINTER)
+        self.worker_type = ir.FunctionType(VOID_POINTER, [VOID_POINTER])
+        self.pthread_create = declare("pthread_create", i32, VOID_POINTER, VOID_POINTER, self.worker_type.as_pointer(), VOID_POINTER)
+        self.getenv = declare("getenv", VOID_POINTER, VOID_POINTER)
+        self.atoi = declare("atoi", i32, VOID_POINTER)
+        self.sysconf = declare("sysconf", i64, i32)
+        self.destructor_type = ir.FunctionType(ir.VoidType(), [VOID_POINTER])
+        self.key_create = declare("pthread_key_create", i32, VOID_POINTER, self.destructor_type.as_pointer())
+        self.get_specific = declare("pthread_getspecific", VOID_POINTER, i64)
+        self.set_specific = declare("pthread_setspecific", i32, i64, VOID_POINTER)
+        self.malloc = declare("malloc", VOID_POINTER, i64)
+        self.free = declare("free", ir.VoidType(), VOID_POINTER)
+        self.write = declare("write", i64, i32, VOID_POINTER, i64)
+        self.strlen = declare("strlen", i64, VOID_POINTER)
+        self.isatty = declare("isatty", i32, i32)
+        self.exit = declare("exit", ir.VoidType(), i32)
+        self.snprintf = ir.Function(self.module, ir.FunctionType(i32, [VOID_POINTER, i64, VOID_POINTER], var_arg=True), name="snprintf")
+
+        output_pointer = OUTPUT.as_pointer()
+        self.output_flush = self._function("calclite.output.flush", ir.FunctionType(ir.VoidType(), [output_pointer]), self._emit_output_flush)
+        self.output_release = self._function("calclite.output.release", self.destructor_type, self._emit_output_release)
+        self.output_setup = self._function("calclite.output.setup", ir.FunctionType(ir.VoidType(), []), self._emit_output_setup)
+        self.output_buffer = self._function("calclite.output.buffer", ir.FunctionType(output_pointer, []), self._emit_output_buffer)
+        self.output_written = self._function("calclite.output.written", ir.FunctionType(ir.VoidType(), [output_pointer, ir.IntType(1)]), self._emit_output_written)
+        self.format_int = self._function("calclite.output.int", ir.FunctionType(ir.VoidType(), [output_pointer, i64]), self._emit_format_int)
+        self.format_float = self._function("calclite.output.float", ir.FunctionType(ir.VoidType(), [output_pointer, f64]), self._emit_format_float)
+        print_int = self._function(PRINT_INT, PRINT_INT_TYPE, lambda value: self._emit_print(self.format_int, value))
+        print_float = self._function(PRINT_FLOAT, PRINT_FLOAT_TYPE, lambda value: self._emit_print(self.format_float, value))
+        print_ints = self._function(PRINT_INTS, PRINT_INTS_TYPE, lambda data, length: self._emit_print_array(self.format_int, data, length))
+        self.print_floats = self._function(PRINT_FLOATS, PRINT_FLOATS_TYPE, lambda data, length: self._emit_print_array(self.format_float, data, length))
+        print_matrix = self._function(PRINT_MATRIX, PRINT_MATRIX_TYPE, self._emit_print_matrix)
+        self.flush = self._function(FLUSH, FLUSH_TYPE, self._emit_flush)
+        fail = self._function(FAIL, FAIL_TYPE, self._emit_fail)
+        for function in (print_int, print_float, print_ints, self.print_floats, print_matrix, self.flush, fail):
+            function.linkage = "external"
+
+        self.run = self._function("calclite.pool.run", ir.FunctionType(ir.VoidType(), [i32, i32]), self._emit_run)
+        self.worker = self._function("calclite.pool.worker", self.worker_type, self._emit_worker)
+        self.start = self._function("calclite.pool.start", ir.FunctionType(i32, []), self._emit_start)
+        self.spawn = self._function("calclite.pool.spawn", ir.FunctionType(i32, []), self._emit_spawn)
+        set_threads = self._function(SET_THREADS, SET_THREADS_TYPE, self._emit_set_threads)
+        parallel_for = self._function(PARALLEL_FOR, PARALLEL_FOR_TYPE, self._emit_parallel_for)
+        set_threads.linkage = parallel_for.linkage = "external"
+
+    def _function(self, name: str, type: ir.FunctionType, emit_body) -> ir.Function:
+        function = ir.Function(self.module, type, name=name)
+        function.linkage = "internal"
+        self.builder = ir.IRBuilder(function.append_basic_block("entry"))
+        emit_body(*function.args)
+        return function
+
+    # helpers
+    def _pointer(self, variable: ir.GlobalVariable) -> ir.Value:
+        return self.builder.bitcast(variable, VOID_POINTER)
+
+    def _lock(self) -> None:
+        self.builder.call(self.mutex_lock, [self._pointer(self.mutex)])
+
+    def _unlock(self) -> None:
+        self.builder.call(self.mutex_unlock, [self._pointer(self.mutex)])
+
+    def _wait_while(self, condition, cond: ir.GlobalVariable) -> None:
+        # while (condition()) pthread_cond_wait(cond, mutex), with the mutex held
+        function = self.builder.block.function
+        check_block = function.append_basic_block("wait_check")
+        wait_block = function.append_basic_block("wait")
+        after_block = function.append_basic_block("wait_after")
+        self.builder.branch(check_block)
+        self.builder.position_at_end(check_block)
+        self.builder.cbranch(condition(), wait_block, after_block)
+        self.builder.position_at_end(wait_block)
+        self.builder.call(self.cond_wait, [self._pointer(cond), self._pointer(self.mutex)])
+        self.builder.branch(check_block)
+        self.builder.position_at_end(after_block)
+
+    def _minimum(self, a: ir.Value, b: ir.Value) -> ir.Value:
+        return self.builder.select(self.builder.icmp_signed("<", a, b), a, b)
+
+    def _string(self, name: str, text: str) -> ir.Value:
+        # a pointer to a NUL terminated copy of text
+        string = ir.GlobalVariable(self.module, ir.ArrayType(i8, len(text) + 1), name=name)
+        string.initializer = ir.Constant(string.value_type, bytearray(text.encode("utf-8") + b"\0"))
+        string.global_constant = True
+        string.linkage = "internal"
+        return self._pointer(string)
+
+    def _loop(self, count: ir.Value, body) -> None:
+        # body(index) for every index in [0, count)
+        builder = self.builder
+        function = builder.block.function
+        preheader_block = builder.block
+        check_block = function.append_basic_block("loop_check")
+        body_block = function.append_basic_block("loop_body")
+        after_block = function.append_basic_block("loop_after")
+        builder.branch(check_block)
+        builder.position_at_end(check_block)
+        index = builder.phi(i64, name="index")
+        index.add_incoming(ir.Constant(i64, 0), preheader_block)
+        builder.cbranch(builder.icmp_signed("<", index, count), body_block, after_block)
+        builder.position_at_end(body_block)
+        body(index)
+        index.add_incoming(builder.add(index, ir.Constant(i64, 1)), builder.block)
+        builder.branch(check_block)
+        builder.position_at_end(after_block)
+
+    def _used(self, buffer: ir.Value) -> ir.Value:
+        return self.builder.gep(buffer, [ir.Constant(i32, 0), ir.Constant(i32, 0)], inbounds=True)
+
+    def _output_data(self, buffer: ir.Value, offset: ir.Value) -> ir.Value:
+        return self.builder.gep(buffer, [ir.Constant(i32, 0), ir.Constant(i32, 1), offset], inbounds=True)
+
+    def _reserve(self, buffer: ir.Value) -> None:
+        # makes room for one more formatted value
+        builder = self.builder
+        full = builder.icmp_signed(">", builder.load(self._used(buffer)), ir.Constant(i64, OUTPUT_BUFFER - OUTPUT_RESERVE))
+        with builder.if_then(full, likely=False):
+            builder.call(self.output_flush, [buffer])
+
+    def _append(self, buffer: ir.Value, text: str) -> None:
+        # text is short enough to fit into the reserved room
+        builder = self.builder
+        used_pointer = self._used(buffer)
+        used = builder.load(used_pointer)
+        for i, character in enumerate(text.encode("utf-8")):
+            builder.store(ir.Constant(i8, character), self._output_data(buffer, builder.add(used, ir.Constant(i64, i))))
+        builder.store(builder.add(used, ir.Constant(i64, len(text))), used_pointer)
+
+    # output
+    def _emit_output_flush(self, buffer: ir.Argument) -> None:
+        # writes the buffer to stdout, continuing after partial writes. After an error the rest is dropped
+        builder = self.builder
+        function = builder.block.function
+        used_pointer = self._used(buffer)
+        used = builder.load(used_pointer)
+        entry_block = builder.block
+        loop_block = function.append_basic_block("loop")
+        write_block = function.append_basic_block("write")
+        exit_block = function.append_basic_block("exit")
+        builder.branch(loop_block)
+        builder.position_at_end(loop_block)
+        offset = builder.phi(i64, name="offset")
+        offset.add_incoming(ir.Constant(i64, 0), entry_block)
+        builder.cbranch(builder.icmp_signed("<", offset, used), write_block, exit_block)
+        builder.position_at_end(write_block)
+        written = builder.call(self.write, [ir.Constant(i32, STDOUT), self._output_data(buffer, offset), builder.sub(used, offset)])
+        offset.add_incoming(builder.select(builder.icmp_signed(">", written, ir.Constant(i64, 0)), builder.add(offset, written), used), write_block)
+        builder.branch(loop_block)
+        builder.position_at_end(exit_block)
+        builder.store(ir.Constant(i64, 0), used_pointer)
+        builder.ret_void()
+
+    def _emit_output_release(self, pointer: ir.Argument) -> None:
+        # destructor of the key, called when a thread with a buffer exits
+        self.builder.call(self.output_flush, [self.builder.bitcast(pointer, OUTPUT.as_pointer())])
+        self.builder.call(self.free, [pointer])
+        self.builder.ret_void()
+
+    def _emit_output_setup(self) -> None:
+        # the first thread that prints creates the key and reads the buffering mode, the others wait until it is done
+        builder = self.builder
+        function = builder.block.function
+        create_block = function.append_basic_block("create")
+        wait_block = function.append_basic_block("wait")
+        exit_block = function.append_basic_block("exit")
+        reservation = builder.cmpxchg(self.output_state, ir.Constant(i32, 0), ir.Constant(i32, 1), "acquire", "monotonic")
+        builder.cbranch(builder.extract_value(reservation, 1), create_block, wait_block)
+
+        builder.position_at_end(create_block)
+        builder.call(self.key_create, [self._pointer(self.output_key), self.output_release])
+        # only the first letter of CALCLITE_OUTPUT is looked at
+        terminal = builder.icmp_signed("!=", builder.call(self.isatty, [ir.Constant(i32, STDOUT)]), ir.Constant(i32, 0))
+        builder.store(builder.select(terminal, ir.Constant(i32, OUTPUT_MODES.index("line")), ir.Constant(i32, OUTPUT_MODES.index("block"))), self.output_mode)
+        value = builder.call(self.getenv, [self._string("calclite.output.variable", OUTPUT_VARIABLE)])
+        with builder.if_then(builder.icmp_unsigned("!=", value, ir.Constant(VOID_POINTER, None))):
+            letter = builder.load(value)
+            mode = builder.load(self.output_mode)
+            for index, name in enumerate(OUTPUT_MODES):
+                mode = builder.select(builder.icmp_unsigned("==", letter, ir.Constant(i8, ord(name[0]))), ir.Constant(i32, index), mode)
+            builder.store(mode, self.output_mode)
+        builder.store_atomic(ir.Constant(i32, 2), self.output_state, "release", 4)
+        builder.branch(exit_block)
+
+        builder.position_at_end(wait_block)
+        builder.cbranch(builder.icmp_signed("==", builder.load_atomic(self.output_state, "acquire", 4), ir.Constant(i32, 2)), exit_block, wait_block)
+        builder.position_at_end(exit_block)
+        builder.ret_void()
+
+    def _emit_output_buffer(self) -> None:
+        # the buffer of the calling thread, allocated when it first prints
+        builder = self.builder
+        with builder.if_then(builder.icmp_signed("!=", builder.load_atomic(self.output_state, "acquire", 4), ir.Constant(i32, 2)), likely=False):
+            builder.call(self.output_setup, [])
+        key = builder.load(self.output_key)
+        pointer = builder.call(self.get_specific, [key])
+        with builder.if_then(builder.icmp_unsigned("==", pointer, ir.Constant(VOID_POINTER, None)), likely=False):
+            size = builder.ptrtoint(builder.gep(ir.Constant(OUTPUT.as_pointer(), None), [ir.Constant(i32, 1)]), i64)
+            allocated = builder.call(self.malloc, [size])
+            builder.store(ir.Constant(i64, 0), self._used(builder.bitcast(allocated, OUTPUT.as_pointer())))
+            builder.call(self.set_specific, [key, allocated])
+        builder.ret(builder.bitcast(builder.call(self.get_specific, [key]), OUTPUT.as_pointer()))
+
+    def _emit_output_written(self, buffer: ir.Argument, end_of_line: ir.Argument) -> None:
+        # called after every value and line, writes the buffer out as the buffering mode asks for
+        builder = self.builder
+        mode = builder.load(self.output_mode)
+        unbuffered = builder.icmp_signed("==", mode, ir.Constant(i32, OUTPUT_MODES.index("none")))
+        line = builder.and_(builder.icmp_signed("==", mode, ir.Constant(i32, OUTPUT_MODES.index("line"))), end_of_line)
+        with builder.if_then(builder.or_(unbuffered, line)):
+            builder.call(self.output_flush, [buffer])
+        builder.ret_void()
+
+    def _emit_format_int(self, buffer: ir.Argument, value: ir.Argument) -> None:
+        # the digits are counted first and then written from the last one. The magnitude is divided unsigned, so
+        # that -2^63 negated is 2^63
+        builder = self.builder
+        function = builder.block.function
+        ten = ir.Constant(i64, 10)
+        used_pointer = self._used(buffer)
+        used = builder.load(used_pointer)
+        negative = builder.icmp_signed("<", value, ir.Constant(i64, 0))
+        magnitude = builder.select(negative, builder.neg(value), value)
+        with builder.if_then(negative):
+            builder.store(ir.Constant(i8, ord("-")), self._output_data(buffer, used))
+        start = builder.add(used, builder.zext(negative, i64))
+
+        entry_block = builder.block
+        count_block = function.append_basic_block("count")
+        write_block = function.append_basic_block("write")
+        exit_block = function.append_basic_block("exit")
+        first_rest = builder.udiv(magnitude, ten)
+        builder.branch(count_block)
+        builder.position_at_end(count_block)
+        rest = builder.phi(i64, name="rest")
+        digits = builder.phi(i64, name="digits")
+        rest.add_incoming(first_rest, entry_block)
+        digits.add_incoming(ir.Constant(i64, 1), entry_block)
+        rest.add_incoming(builder.udiv(rest, ten), count_block)
+        digits.add_incoming(builder.add(digits, ir.Constant(i64, 1)), count_block)
+        last = builder.add(start, builder.sub(digits, ir.Constant(i64, 1)))
+        builder.cbranch(builder.icmp_unsigned("!=", rest, ir.Constant(i64, 0)), count_block, write_block)
+
+        builder.position_at_end(write_block)
+        remaining = builder.phi(i64, name="remaining")
+        position = builder.phi(i64, name="position")
+        remaining.add_incoming(magnitude, count_block)
+        position.add_incoming(last, count_block)
+        digit = builder.trunc(builder.urem(remaining, ten), i8)
+        builder.store(builder.add(digit, ir.Constant(i8, ord("0"))), self._output_data(buffer, position))
+        next_remaining = builder.udiv(remaining, ten)
+        remaining.add_incoming(next_remaining, write_block)
+        position.add_incoming(builder.sub(position, ir.Constant(i64, 1)), write_block)
+        builder.cbranch(builder.icmp_unsigned("!=", next_remaining, ir.Constant(i64, 0)), write_block, exit_block)
+
+        builder.position_at_end(exit_block)
+        builder.store(builder.add(start, digits), used_pointer)
+        builder.ret_void()
+
+    def _emit_format_float(self, buffer: ir.Argument, value: ir.Argument) -> None:
+        builder = self.builder
+        used_pointer = self._used(buffer)
+        used = builder.load(used_pointer)
+        room = builder.sub(ir.Constant(i64, OUTPUT_BUFFER), used)
+        length = builder.call(self.snprintf, [self._output_data(buffer, used), room, self._string("calclite.output.float_format", FLOAT_FORMAT), value])
+        builder.store(builder.add(used, builder.sext(length, i64)), used_pointer)
+        builder.ret_void()
+
+    def _emit_print(self, format: ir.Function, value: ir.Argument) -> None:
+        # one value on a line of its own
+        buffer = self.builder.call(self.output_buffer, [])
+        self._reserve(buffer)
+        self.builder.call(format, [buffer, value])
+        self._append(buffer, "\n")
+        self.builder.call(self.output_written, [buffer, ir.Constant(ir.IntType(1), 1)])
+        self.builder.ret_void()
+
+    def _emit_print_array(self, format: ir.Function, data: ir.Argument, length: ir.Argument) -> None:
+        # the elements on one line as [a, b, c]
+        builder = self.builder
+        buffer = builder.call(self.output_buffer, [])
+        self._reserve(buffer)
+        self._append(buffer, "[")
+        def element(index):
+            self._reserve(buffer)
+            with builder.if_then(builder.icmp_signed(">", index, ir.Constant(i64, 0))):
+                self._append(buffer, ", ")
+            element = builder.load(builder.gep(data, [index], inbounds=True))
+            builder.call(format, [buffer, builder.fpext(element, f64) if element.type == f32 else builder.sext(element, i64)])
+            builder.call(self.output_written, [buffer, ir.Constant(ir.IntType(1), 0)])
+        self._loop(length, element)
+        self._reserve(buffer)
+        self._append(buffer, "]\n")
+        builder.call(self.output_written, [buffer, ir.Constant(ir.IntType(1), 1)])
+        builder.ret_void()
+
+    def _emit_print_matrix(self, data: ir.Argument, rows: ir.Argument, columns: ir.Argument) -> None:
+        # one line per row
+        builder = self.builder
+        self._loop(rows, lambda row: builder.call(self.print_floats, [builder.gep(data, [builder.mul(row, columns)], inbounds=True), columns]))
+        builder.ret_void()
+
+    def _emit_flush(self) -> None:
+        # writes out the buffer of the calling thread, if it has one
+        builder = self.builder
+        with builder.if_then(builder.icmp_signed("==", builder.load_atomic(self.output_state, "acquire", 4), ir.Constant(i32, 2))):
+            pointer = builder.call(self.get_specific, [builder.load(self.output_key)])
+            with builder.if_then(builder.icmp_unsigned("!=", pointer, ir.Constant(VOID_POINTER, None))):
+                builder.call(self.output_flush, [builder.bitcast(pointer, OUTPUT.as_pointer())])
+        builder.ret_void()
+
+    def _emit_fail(self, message: ir.Argument) -> None:
+        builder = self.builder
+        builder.call(self.flush, [])
+        builder.call(self.write, [ir.Constant(i32, STDOUT), message, builder.call(self.strlen, [message])])
+        builder.call(self.exit, [ir.Constant(i32, 1)])
+        builder.unreachable()
+
+    # thread pool
+    def _emit_run(self, participant: ir.Argument, size: ir.Argument) -> None:
+        # runs the share of participant of the current job. With dynamic scheduling chunks are claimed from a shared
+        # counter until none are left, with static scheduling participant p runs chunks p, p + size, p + 2 size, ...
+        builder = self.builder
+        function = builder.block.function
+        body, context = builder.load(self.body), builder.load(self.context)
+        stop, chunk = builder.load(self.stop), builder.load(self.chunk)
+        dynamic_block = function.append_basic_block("dynamic")
+        static_block = function.append_basic_block("static")
+        exit_block = function.append_basic_block("exit")
+        builder.cbranch(builder.icmp_unsigned("!=", builder.load(self.dynamic), ir.Constant(i8, 0)), dynamic_block, static_block)
+
+        builder.position_at_end(dynamic_block)
+        claim_block = function.append_basic_block("claim")
+        builder.branch(claim_block)
+        builder.position_at_end(claim_block)
+        first = builder.atomic_rmw("add", self.next, chunk, "monotonic")
+        run_block = function.append_basic_block("dynamic_run")
+        builder.cbranch(builder.icmp_signed("<", first, stop), run_block, exit_block)
+        builder.position_at_end(run_block)
+        builder.call(body, [context, first, self._minimum(builder.add(first, chunk), stop)])
+        builder.branch(claim_block)
+
+        builder.position_at_end(static_block)
+        start = builder.add(builder.load(self.next), builder.mul(builder.sext(participant, i64), chunk))
+        stride = builder.mul(builder.sext(size, i64), chunk)
+        loop_block = function.append_basic_block("static_loop")
+        step_block = function.append_basic_block("static_run")
+        builder.branch(loop_block)
+        builder.position_at_end(loop_block)
+        first = builder.phi(i64)
+        first.add_incoming(start, static_block)
+        builder.cbranch(builder.icmp_signed("<", first, stop), step_block, exit_block)
+        builder.position_at_end(step_block)
+        builder.call(body, [context, first, self._minimum(builder.add(first, chunk), stop)])
+        first.add_incoming(builder.add(first, stride), step_block)
+        builder.branch(loop_block)
+
+        builder.position_at_end(exit_block)
+        builder.ret_void()
+
+    def _emit_worker(self, argument: ir.Argument) -> None:
+        # worker threads never return, they sleep until the generation changes, run their share of the new job and
+        # report back. Workers beyond the current size only report back
+        builder = self.builder
+        function = builder.block.function
+        participant = builder.trunc(builder.ptrtoint(argument, i64), i32)
+        entry_block = builder.block
+        loop_block = function.append_basic_block("loop")
+        builder.branch(loop_block)
+
+        builder.position_at_end(loop_block)
+        seen = builder.phi(i64, name="seen")
+        seen.add_incoming(ir.Constant(i64, 0), entry_block)
+        self._lock()
+        self._wait_while(lambda: builder.icmp_unsigned("==", builder.load_atomic(self.generation, "acquire", 8), seen), self.wake)
+        generation = builder.load_atomic(self.generation, "acquire", 8)
+        size = builder.load(self.size)
+        self._unlock()
+
+        run_block = function.append_basic_block("run")
+        report_block = function.append_basic_block("report")
+        builder.cbranch(builder.icmp_signed("<", participant, size), run_block, report_block)
+        builder.position_at_end(run_block)
+        builder.call(self.run, [participant, size])
+        builder.call(self.flush, [])
+        builder.branch(report_block)
+
+        builder.position_at_end(report_block)
+        self._lock()
+        pending = builder.sub(builder.load_atomic(self.pending, "acquire", 4), ir.Constant(i32, 1))
+        builder.store_atomic(pending, self.pending, "release", 4)
+        with builder.if_then(builder.icmp_signed("==", pending, ir.Constant(i32, 0))):
+            builder.call(self.cond_signal, [self._pointer(self.done)])
+        self._unlock()
+        seen.add_incoming(generation, builder.block)
+        builder.branch(loop_block)
+
+    def _emit_start(self) -> None:
+        # called with the pool reserved, returns the number of participants. The first call initialises the mutex and
+        # condition variables and reads the thread count from the environment
+        builder = self.builder
+        with builder.if_then(builder.icmp_signed("==", builder.load(self.workers), ir.Constant(i32, 0))):
+            null = ir.Constant(VOID_POINTER, None)
+            builder.call(self.mutex_init, [self._pointer(self.mutex), null])
+            builder.call(self.cond_init, [self._pointer(self.wake), null])
+            builder.call(self.cond_init, [self._pointer(self.done), null])
+
+        with builder.if_then(builder.icmp_signed("<=", builder.load(self.threads), ir.Constant(i32, 0))):
+            value = builder.call(self.getenv, [self._string("calclite.pool.variable", THREADS_VARIABLE)])
+            configured = builder.alloca(i32)
+            builder.store(ir.Constant(i32, 0), configured)
+            with builder.if_then(builder.icmp_unsigned("!=", value, ir.Constant(VOID_POINTER, None))):
+                builder.store(builder.call(self.atoi, [value]), configured)
+            with builder.if_then(builder.icmp_signed("<=", builder.load(configured), ir.Constant(i32, 0))):
+                builder.store(builder.trunc(builder.call(self.sysconf, [ir.Constant(i32, SC_NPROCESSORS_ONLN)]), i32), configured)
+            threads = builder.load(configured)
+            builder.store(builder.select(builder.icmp_signed("<", threads, ir.Constant(i32, 1)), ir.Constant(i32, 1), threads), self.threads)
+        builder.ret(builder.load(self.threads))
+
+    def _emit_spawn(self) -> None:
+        # called with the mutex held right before a job is published, starts missing workers and returns the number
+        # of participants. A new worker waits for the mutex and then sees the generation of that job as new, so it
+        # never runs an older job whose context is gone. Workers are numbered from 1, the calling thread is
+        # participant 0
+        builder = self.builder
+        function = builder.block.function
+        handle = builder.alloca(i64)
+        check_block = function.append_basic_block("spawn_check")
+        spawn_block = function.append_basic_block("spawn")
+        after_block = function.append_basic_block("spawn_after")
+        builder.branch(check_block)
+        builder.position_at_end(check_block)
+        workers = builder.load(self.workers)
+        builder.cbranch(builder.icmp_signed("<", builder.add(workers, ir.Constant(i32, 1)), builder.load(self.threads)), spawn_block, after_block)
+        builder.position_at_end(spawn_block)
+        participant = builder.inttoptr(builder.zext(builder.add(workers, ir.Constant(i32, 1)), i64), VOID_POINTER)
+        status = builder.call(self.pthread_create, [builder.bitcast(handle, VOID_POINTER), ir.Constant(VOID_POINTER, None), self.worker, participant])
+        created_block = function.append_basic_block("spawned")
+        failed_block = function.append_basic_block("spawn_failed")
+        builder.cbranch(builder.icmp_signed("==", status, ir.Constant(i32, 0)), created_block, failed_block)
+        builder.position_at_end(created_block)
+        builder.store(builder.add(workers, ir.Constant(i32, 1)), self.workers)
+        builder.branch(check_block)
+        # without more threads the pool stays at the workers it has
+        builder.position_at_end(failed_block)
+        builder.store(builder.add(workers, ir.Constant(i32, 1)), self.threads)
+        builder.branch(after_block)
+        builder.position_at_end(after_block)
+        builder.ret(builder.load(self.threads))
+
+    def _emit_set_threads(self, threads: ir.Argument) -> None:
+        # takes effect at the next parallel for, 0 or less goes back to CALCLITE_THREADS or the number of processors
+        self.builder.store(threads, self.threads)
+        self.builder.ret_void()
+
+    def _emit_parallel_for(self, body: ir.Argument, context: ir.Argument, start: ir.Argument, stop: ir.Argument, dynamic: ir.Argument, chunk: ir.Argument) -> None:
+        # runs body over [start, stop) on the pool. A chunk of 0 or less means 1 for dynamic scheduling and an equal
+        # share per participant for static scheduling
+        builder = self.builder
+        function = builder.block.function
+        sequential_block = function.append_basic_block("sequential")
+        reserved_block = function.append_basic_block("reserved")
+        with builder.if_then(builder.icmp_signed(">=", start, stop)):
+            builder.ret_void()
+        reservation = builder.cmpxchg(self.busy, ir.Constant(i32, 0), ir.Constant(i32, 1), "acquire", "monotonic")
+        builder.cbranch(builder.extract_value(reservation, 1), reserved_block, sequential_block)
+
+        builder.position_at_end(sequential_block)
+        builder.call(body, [context, start, stop])
+        builder.ret_void()
+
+        builder.position_at_end(reserved_block)
+        size = builder.call(self.start, [])
+        alone_block = function.append_basic_block("alone")
+        shared_block = function.append_basic_block("shared")
+        builder.cbranch(builder.icmp_signed("==", size, ir.Constant(i32, 1)), alone_block, shared_block)
+        builder.position_at_end(alone_block)
+        builder.call(body, [context, start, stop])
+        builder.store_atomic(ir.Constant(i32, 0), self.busy, "release", 4)
+        builder.ret_void()
+
+        builder.position_at_end(shared_block)
+        builder.call(self.flush, [])
+        self._lock()
+        size = builder.call(self.spawn, [])
+        size64 = builder.sext(size, i64)
+        share = builder.sdiv(builder.sub(builder.add(builder.sub(stop, start), size64), ir.Constant(i64, 1)), size64)
+        default_chunk = builder.select(builder.icmp_unsigned("!=", dynamic, ir.Constant(i8, 0)), ir.Constant(i64, 1), share)
+        chunk = builder.select(builder.icmp_signed("<=", chunk, ir.Constant(i64, 0)), default_chunk, chunk)
+        for variable, value in [(self.body, body), (self.context, context), (self.stop, stop), (self.chunk, chunk), (self.dynamic, dynamic), (self.next, start), (self.size, size)]:
+            builder.store(value, variable)
+        builder.store_atomic(builder.load(self.workers), self.pending, "release", 4)
+        builder.store_atomic(builder.add(builder.load_atomic(self.generation, "acquire", 8), ir.Constant(i64, 1)), self.generation, "release", 8)
+        builder.call(self.cond_broadcast, [self._pointer(self.wake)])
+        self._unlock()
+
+        builder.call(self.run, [ir.Constant(i32, 0), size])
+
+        self._lock()
+        self._wait_while(lambda: builder.icmp_signed("!=", builder.load_atomic(self.pending, "acquire", 4), ir.Constant(i32, 0)), self.done)
+        self._unlock()
+        builder.store_atomic(ir.Constant(i32, 0), self.busy, "release", 4)
+        builder.ret_void()
@@ -0,0 +1,156 @@
+import re
+from array import array
+
+from Token import TokenType, Token, get_identifier
+
+
+TOKEN_TYPES = list(TokenType)
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+
+OPERATORS = {
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.MULTIPLY,
+    "/": TokenType.DIVIDE,
+    "^": TokenType.EXPONENT,
+    "%": TokenType.MODULO,
+    "@": TokenType.AT,
+    "=": TokenType.EQUALS,
+    "==": TokenType.DOUBLE_EQUALS,
+    "<": TokenType.LESSTHAN,
+    "<=": TokenType.LESSTHAN_EQUALS,
+    ">": TokenType.GREATERTHAN,
+    ">=": TokenType.GREATERTHAN_EQUALS,
+    "!": TokenType.BANG,
+    "!=": TokenType.NOT_EQUALS,
+    ":": TokenType.COLON,
+    ",": TokenType.COMMA,
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    "{": TokenType.LBRACE,
+    "}": TokenType.RBRACE,
+    "[": TokenType.LBRACKET,
+    "]": TokenType.RBRACKET,
+    "..": TokenType.DOTDOT,
+}
+
+# one group per token class, tried in order and preceded by the whitespace the class skips. Identifiers continue
+# with \w, which is the same character set as Lexer's isalnum() or _is_letter() test, and numbers stop before ..
+PATTERN = re.compile(r"""
+    [ \t\r]*
+    (?:
+        (==|<=|>=|!=|\.\.|[-+*/^%@=<>!:,(){}\[\]])   # 1: operators and punctuation
+      | ([A-Za-zåäöÅÄÖ_]\w*)                      # 2: identifiers, keywords and types
+      | ([0-9](?:[0-9]|\.(?!\.))*)                # 3: numbers
+      | (\n)                                      # 4: end of line
+      | ([^ \t\r])                                # 5: anything else
+    )
+""", re.VERBOSE | re.DOTALL)
+OPERATOR_GROUP, WORD_GROUP, NUMBER_GROUP, EOL_GROUP = 1, 2, 3, 4
+
+INT = TOKEN_CODES[TokenType.INT]
+FLOAT = TOKEN_CODES[TokenType.FLOAT]
+EOL = TOKEN_CODES[TokenType.EOL]
+EOF = TOKEN_CODES[TokenType.EOF]
+EXCEPTION = TOKEN_CODES[TokenType.EXCEPTION]
+OPERATOR_CODES = {operator: TOKEN_CODES[token_type] for operator, token_type in OPERATORS.items()}
+
+
+class TokenBuffer:
+    # struct-of-arrays token stream: token i has type TOKEN_TYPES[types[i]], its literal is code[starts[i]:ends[i]]
+    # and line_numbers[i] and positions[i] match what Lexer reports for the same token
+    def __init__(self, code: str, types: array, starts: array, ends: array, line_numbers: array, positions: array) -> None:
+        self.code = code
+        self.types = types
+        self.starts = starts
+        self.ends = ends
+        self.line_numbers = line_numbers
+        self.positions = positions
+
+    def __len__(self) -> int:
+        return len(self.types)
+
+    def type(self, index: int) -> TokenType:
+        return TOKEN_TYPES[self.types[index]]
+
+    def literal(self, index: int):
+        code = self.types[index]
+        text = self.code[self.starts[index]:self.ends[index]]
+        if code == INT: return int(text)
+        if code == FLOAT: return float(text)
+        if code == EOF: return None
+        return text
+
+    def token(self, index: int) -> Token:
+        return Token(self.type(index), self.literal(index), self.line_numbers[index], self.positions[index])
+
+
+def tokenize(code: str) -> TokenBuffer:
+    # the columns are collected in lists, which append faster than arrays, and packed once at the end
+    types, starts, ends, line_numbers, positions = [], [], [], [], []
+    word_codes: dict[str, int] = {}
+    operator_codes = OPERATOR_CODES
+    length = len(code)
+    line_number = 1
+
+    for match in PATTERN.finditer(code):
+        group = match.lastindex
+        start, end = match.span(group)
+        if group == OPERATOR_GROUP:
+            type_code = operator_codes[match.group(group)]
+            position = end
+        elif group == WORD_GROUP:
+            word = match.group(group)
+            type_code = word_codes.get(word)
+            if type_code is None:
+                type_code = word_codes[word] = TOKEN_CODES[get_identifier(word)]
+            # Lexer reports the position after its lookahead character for identifiers and numbers
+            position = end + 1
+        elif group == NUMBER_GROUP:
+            dots = match.group(group).count(".")
+            type_code = INT if dots == 0 else FLOAT if dots == 1 else EXCEPTION
+            position = end + 1
+        elif group == EOL_GROUP:
+            type_code = EOL
+            position = end
+        else:
+            type_code = EXCEPTION
+            position = end
+        types.append(type_code)
+        starts.append(start)
+        ends.append(end)
+        line_numbers.append(line_number)
+        positions.append(position)
+        if group == EOL_GROUP:
+            line_number += 1
+
+    # a token ending the source has no lookahead character
+    if positions and positions[-1] > length:
+        positions[-1] = length
+    types.append(EOF)
+    starts.append(length)
+    ends.append(length)
+    line_numbers.append(line_number)
+    positions.append(length)
+    return TokenBuffer(code, array("B", types), array("I", starts), array("I", ends), array("I", line_numbers), array("I", positions))
+
+
+class TableLexer:
+    # drop-in replacement for Lexer: the whole source is tokenized in one regex pass up front, and get_next_token
+    # only materialises Token objects from the buffer
+    def __init__(self, code: str) -> None:
+        self.code = code
+        self.buffer = tokenize(code)
+        self.index = 0
+
+    def get_next_token(self) -> Token:
+        # like Lexer, keep returning EOF once the source is exhausted
+        buffer = self.buffer
+        index = self.index if self.index < len(buffer.types) else len(buffer.types) - 1
+        self.index += 1
+        type_code = buffer.types[index]
+        if type_code == INT or type_code == FLOAT or type_code == EOF:
+            literal = buffer.literal(index)
+        else:
+            literal = self.code[buffer.starts[index]:buffer.ends[index]]
+        return Token(TOKEN_TYPES[type_code], literal, buffer.line_numbers[index], buffer.positions[index])
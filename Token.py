@@ -17,6 +17,7 @@ class TokenType(Enum):
     DIVIDE = "DIVIDE"
     EXPONENT = "EXPONENT"
     MODULO = "MODULO"
+    AT = "AT"
 
     LESSTHAN = "<"
     GREATERTHAN = ">"
@@ -33,6 +34,9 @@ class TokenType(Enum):
     RPAREN = "RPAREN"
     LBRACE = "LBRACE"
     RBRACE = "RBRACE"
+    LBRACKET = "LBRACKET"
+    RBRACKET = "RBRACKET"
+    DOTDOT = "DOTDOT"
 
     EQUALS = "EQUALS"
 
@@ -44,6 +48,10 @@ class TokenType(Enum):
     IF = "IF"
     ELSE = "ELSE"
     WHILE = "WHILE"
+    FOR = "FOR"
+    IN = "IN"
+    PARALLEL = "PARALLEL"
+    REDUCE = "REDUCE"
 
     TYPE = "TYPE"
 
@@ -70,9 +78,17 @@ KEYWORDS = {
     "true": TokenType.TRUE,
     "false": TokenType.FALSE,
     "while": TokenType.WHILE,
+    "for": TokenType.FOR,
+    "in": TokenType.IN,
+    "parallel": TokenType.PARALLEL,
+    "reduce": TokenType.REDUCE,
 }
 
-TYPES = ["int", "float", "string", "bool"]
+TYPES = ["int", "float", "string", "bool", "matrix", "i32", "i64", "f32", "f64"]
+# i32 and f32 are other names of int and float
+TYPE_ALIASES = {"i32": "int", "f32": "float"}
+# the scalar types arithmetic converts between, see Compiler._promoted_type
+NUMERIC_TYPES = ("int", "i64", "float", "f64")
 
 def get_identifier(identifier: str) -> TokenType:
     keyword = KEYWORDS.get(identifier)